@@ -66,6 +66,7 @@ def register_orders_routes(app):
                 'trailing_distance': data.get('trailing_distance'),
                 'oco_group_id': data.get('oco_group_id'),
                 'oco_related_ids': data.get('oco_related_ids', []),
+                'order_wallet_id': wallet_id,
             })
             
             # Store wallet_id in order if needed for later reference
@@ -117,19 +118,30 @@ def register_orders_routes(app):
     def api_v1_get_orders():
         """
         API для получения списка ордеров
-        Параметры: user_wallet (опционально)
+        Параметры: user_wallet, status (через запятую), pair, limit, cursor (все опционально)
         """
         try:
             # Import inside function to avoid circular imports
-            from app import load_orders
+            from app import query_orders, ORDERS_PAGE_SIZE
             
             user_wallet = request.args.get('user_wallet')
-            orders_data = load_orders(user_wallet)
+            statuses = [s for s in request.args.get('status', '').split(',') if s] or None
+            pair = request.args.get('pair')
+            orders_data = query_orders(
+                statuses=statuses,
+                pairs=[pair] if pair else None,
+                user_wallet=user_wallet,
+                limit=request.args.get('limit', ORDERS_PAGE_SIZE, type=int),
+                cursor=request.args.get('cursor')
+            )
             
             return jsonify({
                 'success': True,
-                'orders': orders_data.get('orders', [])
+                'orders': orders_data.get('orders', []),
+                'next_cursor': orders_data.get('next_cursor')
             })
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         except Exception as e:
             print(f"[API] Get orders error: {e}")
             return jsonify({'error': str(e)}), 500
@@ -141,21 +153,20 @@ def register_orders_routes(app):
         """
         try:
             # Import inside function to avoid circular imports
-            from app import load_orders
+            from app import load_order
             from order_engine import get_order_engine
             
             engine = get_order_engine()
             
-            if order_id in engine.processor.orders:
-                order = engine.processor.orders[order_id]
+            order = engine.get_order(order_id) # Из снимка движка
+            if order is not None:
                 return jsonify({
                     'success': True,
-                    'order': order.to_dict()
+                    'order': order
                 })
             else:
                 # Пытаемся загрузить из БД
-                orders_data = load_orders()
-                order_dict = next((o for o in orders_data.get('orders', []) if o['id'] == order_id), None)
+                order_dict = load_order(order_id)
                 if order_dict:
                     from order_engine import OrderEngine
                     order = OrderEngine._convert_legacy_order(order_dict)
@@ -178,23 +189,27 @@ def register_orders_routes(app):
         try:
             # Import inside function to avoid circular imports
             from app import (
-                load_orders,
-                save_order
+                get_db_connection,
+                load_order
             )
+            from order_state import transition_order
             from datetime import datetime
             
-            orders_data = load_orders()
+            order = load_order(order_id)
+            if order and order['status'] in ('unfunded', 'waiting_entry', 'opened', 'active'):
+                with get_db_connection() as conn:
+                    with conn.cursor() as cur:
+                        won = transition_order(cur, order, 'cancelled', cancelled_at=datetime.now().isoformat())
+                        conn.commit()
+                if not won:
+                    return jsonify({'error': 'Order was modified concurrently, retry the request'}), 409
+                from order_engine import notify_order_cancelled
+                notify_order_cancelled(order_id)
+                return jsonify({
+                    'success': True,
+                    'message': 'Order cancelled'
+                })
             
-            for order in orders_data['orders']:
-                if order['id'] == order_id and order['status'] in ('unfunded', 'waiting_entry', 'opened', 'active'):
-                    order['status'] = 'cancelled'
-                    order['cancelled_at'] = datetime.now().isoformat()
-                    save_order(order)
-                    return jsonify({
-                        'success': True,
-                        'message': 'Order cancelled'
-                    })
-                    
             return jsonify({'error': 'Order not found or already executed/cancelled'}), 404
         except Exception as e:
             print(f"[API] Cancel order error: {e}")
@@ -42,7 +42,8 @@ def register_wallets_routes(app):
                 get_order_wallet_record,
                 get_db_connection,
                 validate_address,
-                encrypt_secret
+                encrypt_secret,
+                wallet_key_cache
             )
             
             data = request.json or {}
@@ -83,6 +84,7 @@ def register_wallets_routes(app):
                     conn.commit()
                     if row:
                         wallet = dict(row)
+                        wallet_key_cache.invalidate(wallet_id=wallet['id'], address=wallet['address'])
                         wallet['label'] = wallet.get('label') or f"Wallet #{wallet['id']}"
                         if isinstance(wallet.get('created_at'), datetime):
                             wallet['created_at'] = wallet['created_at'].isoformat()
@@ -8,17 +8,24 @@ from datetime import datetime, timedelta
 import traceback
 import base64
 import hashlib
+import sys
 from typing import Dict, List, Optional
 import requests
 from dotenv import load_dotenv
 import psycopg2
 import psycopg2.extras
 from contextlib import contextmanager
+from concurrent.futures import Future
 from cryptography.fernet import Fernet
 
+if __name__ == '__main__':
+    # order_engine и api импортируют app: при запуске python app.py это должен быть этот же модуль, а не вторая копия
+    sys.modules.setdefault('app', sys.modules[__name__])
+
 # Импорты из новых модулей
 from ton_rpc import (
     get_balance,
+    get_wallet_state,
     validate_address,
     get_pool_reserves,
     get_expected_output,
@@ -37,8 +44,25 @@ from stonfi import (
     STONFI_GAS_AMOUNT
 )
 from order_executor import execute_order_swap, transfer_ton_from_wallet, calculate_order_gas_requirements, calculate_order_gas_requirements
+from price_events import PriceEventBus, PriceWatcher
+from execution_pool import ExecutionPool
+from execution_outbox import ExecutionOutbox
+from retry_scheduler import RetryScheduler, plan_retry
+from order_persistence import OrderPersistence
+from checker_shards import ShardLeaseManager
+from order_state import can_transition, transition_condition, transition_order, version_condition
+from order_evaluators import entry_condition, exit_condition, side_price
+from order_scheduler import OrderEvaluator, OrderScheduler
+from slippage_stats import SlippageStats
+from order_snapshots import OrderChangeLog
+from latency import LatencyStats, LatencyTrace
+from log_config import configure_logging, debug_sampled, get_logger, get_logging_metrics
+from wallet_cache import wallet_cache_key, wallet_key_cache
+from wallet_sequencer import SEQUENCER_CONFIRM_GRACE, disable_wallet_sequencer, get_sequencer_metrics
 
 load_dotenv()
+configure_logging()
+log = get_logger('app')
 app = Flask(__name__)
 
 # Register API routes
@@ -128,14 +152,18 @@ def get_best_price_entry(pair: str) -> Optional[dict]:
     return best
 def get_pair_price_snapshot(pair: str) -> Optional[dict]:
     """
-    Возвращает минимальную (для LONG) и максимальную (для SHORT) цену по всем пулам пары.
+    Возвращает минимальную (для LONG) и максимальную (для SHORT) цену по всем пулам пары,
+    а также цену основного пула (primary) для расширенных ордеров OrderEngine.
     """
     min_price = None
     max_price = None
-    for pool in get_pair_pools(pair):
+    primary_price = None
+    for index, pool in enumerate(get_pair_pools(pair)):
         price = get_pool_price(pool)
         if not price:
             continue
+        if index == 0:
+            primary_price = price # Цена основного пула (get_primary_pool)
         if min_price is None or price < min_price:
             min_price = price
         if max_price is None or price > max_price:
@@ -146,7 +174,8 @@ def get_pair_price_snapshot(pair: str) -> Optional[dict]:
         min_price = max_price
     if max_price is None:
         max_price = min_price
-    return {'long': min_price, 'short': max_price}
+    # fetched_at — момент получения по time.monotonic(): начало трассы задержки исполнения
+    return {'long': min_price, 'short': max_price, 'primary': primary_price or min_price, 'fetched_at': time.monotonic()}
 def pick_pool_by_targets(pair: str, targets: List[float]) -> Optional[dict]:
     candidates = get_pair_pools(pair)
     if not candidates:
@@ -338,6 +367,15 @@ def get_order_wallet_record(wallet_id: int) -> Optional[dict]:
 
 
 def get_order_wallet_credentials(order: dict) -> Optional[dict]:
+    """Учетные данные кошелька ордера из кэша (при промахе — БД и расшифровка мнемоники)"""
+    key = wallet_cache_key(order.get('order_wallet_id'), order.get('order_wallet'))
+    if not key:
+        return None
+    return wallet_key_cache.credentials(key, lambda: load_order_wallet_credentials(order),
+                                        wallet_id=order.get('order_wallet_id'))
+
+
+def load_order_wallet_credentials(order: dict) -> Optional[dict]:
     wallet_info = None
     wallet_id = order.get('order_wallet_id')
     if wallet_id:
@@ -467,6 +505,9 @@ def init_db():
                 """)
                 cur.execute("CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status, pair)")
                 cur.execute("CREATE INDEX IF NOT EXISTS idx_orders_user ON orders(user_wallet, created_at)")
+                # Keyset-пагинация (created_at, id) по всем ордерам и по пользователю
+                cur.execute("CREATE INDEX IF NOT EXISTS idx_orders_keyset ON orders(created_at DESC, id DESC)")
+                cur.execute("CREATE INDEX IF NOT EXISTS idx_orders_user_keyset ON orders(user_wallet, created_at DESC, id DESC)")
                 # Дополнительные колонки (для обратной совместимости)
                 new_columns = [
                     ("opened_at", "TIMESTAMP"),
@@ -482,105 +523,286 @@ def init_db():
                     ("oco_group_id", "VARCHAR(64)"),
                     ("oco_related_ids", "TEXT"),
                     ("filled_quantity", "NUMERIC(20,8) DEFAULT 0"),
-                    ("execution_error", "TEXT")
+                    ("execution_error", "TEXT"),
+                    ("version", "INTEGER NOT NULL DEFAULT 1") # Оптимистичная блокировка записей ордера
                 ]
                 for col_name, col_type in new_columns:
                     try:
                         cur.execute(f"ALTER TABLE orders ADD COLUMN IF NOT EXISTS {col_name} {col_type}")
                     except Exception as e:
                         print(f"[ПРИЛОЖЕНИЕ] Возможно колонка {col_name} уже есть: {e}")
+                # Частичный покрывающий индекс живых ордеров для цикла проверки (после добавления max_slippage)
+                cur.execute(f"""
+                    CREATE INDEX IF NOT EXISTS idx_orders_live ON orders(status, pair, created_at DESC, id DESC)
+                    INCLUDE (type, amount, entry_price, stop_loss, take_profit, price_at_creation,
+                             max_slippage, order_wallet, order_wallet_id)
+                    WHERE status IN ({', '.join(repr(s) for s in LIVE_ORDER_STATUSES)})
+                """)
+                # Очередь исполнения ордеров
+                ExecutionOutbox.init_table(cur)
+                # Аренды шардов проверки ордеров (режим нескольких воркеров)
+                ShardLeaseManager.init_table(cur)
+                # Агрегаты статистики проскальзывания
+                SlippageStats.init_table(cur)
+                # Журнал изменений ордеров для теплого старта OrderEngine из снимка
+                OrderChangeLog.init_table(cur)
                 conn.commit()
     except Exception as e:
         print(f"[ПРИЛОЖЕНИЕ] Ошибка инициализации базы данных: {e}")
         if conn:
             conn.rollback()
 # Замените функции работы с ордерами
-def load_orders(user_wallet=None):
-    """Загрузка ордеров из БД - унифицированная версия"""
+ORDER_SELECT_COLUMNS = """
+    id, type, pair, amount, entry_price, stop_loss, take_profit,
+    user_wallet, order_wallet, order_wallet_id, status, created_at, funded_at,
+    opened_at, executed_at, execution_price, execution_type, cancelled_at, pnl, price_at_creation,
+    max_slippage, execution_error, version, order_type
+"""
+# Статусы ордеров, которые еще обрабатываются (пополнение, вход, SL/TP)
+LIVE_ORDER_STATUSES = ('unfunded', 'active', 'waiting_entry', 'opened')
+ORDERS_PAGE_SIZE = int(os.environ.get("ORDERS_PAGE_SIZE", "200"))
+ORDERS_MAX_PAGE_SIZE = 1000
+ORDERS_FETCH_SIZE = int(os.environ.get("ORDERS_FETCH_SIZE", "500")) # Строк за один FETCH серверного курсора
+def _order_from_row(columns, row) -> dict:
+    """Строка orders -> dict (Decimal в float для JSON, datetime в isoformat)"""
+    order = dict(zip(columns, row))
+    for key, value in order.items():
+        if isinstance(value, datetime): # Конвертация datetime
+            order[key] = value.isoformat()
+        elif hasattr(value, 'to_eng_string'): # Decimal
+            order[key] = float(value)
+    return order
+def encode_orders_cursor(order: dict) -> str:
+    """Курсор страницы: (created_at, id) последнего ордера страницы"""
+    raw = json.dumps([order['created_at'], order['id']])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+def decode_orders_cursor(cursor: str):
     try:
-        with get_db_connection() as conn:
-            with conn.cursor() as cur:
-                if user_wallet:
-                    cur.execute("""
-                        SELECT id, type, pair, amount, entry_price, stop_loss, take_profit,
-                               user_wallet, order_wallet, order_wallet_id, status, created_at, funded_at,
-                               opened_at, executed_at, execution_price, execution_type, cancelled_at, pnl, price_at_creation,
-                               max_slippage, execution_error
-                        FROM orders
-                        WHERE user_wallet = %s
-                        ORDER BY created_at DESC
-                    """, (user_wallet,))
-                else:
-                    cur.execute("""
-                        SELECT id, type, pair, amount, entry_price, stop_loss, take_profit,
-                               user_wallet, order_wallet, order_wallet_id, status, created_at, funded_at,
-                               opened_at, executed_at, execution_price, execution_type, cancelled_at, pnl, price_at_creation,
-                               max_slippage, execution_error
-                        FROM orders
-                        ORDER BY created_at DESC
-                    """)
-                
-                columns = [desc[0] for desc in cur.description]
-                orders = []
-                for row in cur.fetchall():
-                    order = dict(zip(columns, row))
-                    # Конвертируем Decimal в float для JSON и datetime в isoformat
-                    for key, value in order.items():
-                        if isinstance(value, datetime): # Конвертация datetime
-                            order[key] = value.isoformat()
-                        elif hasattr(value, 'to_eng_string'): # Decimal
-                            order[key] = float(value)
-                        elif value is None:
-                            order[key] = None
-                    orders.append(order)
-                
-                return {"orders": orders}
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, order_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), str(order_id)
+    except Exception:
+        raise ValueError('Некорректный курсор страницы')
+def _orders_filter(statuses=None, pairs=None, user_wallet=None, order_wallet_id=None, after=None, ids=None, engine=None):
+    """
+    WHERE для выборки ордеров; after — (created_at, id) для keyset-пагинации по убыванию.
+    engine: True — только ордера OrderEngine (заполнен order_type), False — только legacy long/short
+    """
+    conditions = []
+    params = []
+    if engine is not None:
+        conditions.append("order_type IS NOT NULL" if engine else "order_type IS NULL")
+    if ids is not None:
+        conditions.append("id = ANY(%s)")
+        params.append(list(ids))
+    if statuses:
+        conditions.append("status = ANY(%s)")
+        params.append(list(statuses))
+    if pairs is not None:
+        conditions.append("pair = ANY(%s)")
+        params.append(list(pairs))
+    if user_wallet:
+        conditions.append("user_wallet = %s")
+        params.append(user_wallet)
+    if order_wallet_id is not None:
+        conditions.append("order_wallet_id = %s")
+        params.append(int(order_wallet_id))
+    if after:
+        conditions.append("(created_at, id) < (%s, %s)")
+        params.extend(after)
+    where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+    return where, params
+def iter_orders(statuses=None, pairs=None, user_wallet=None, order_wallet_id=None, fetch_size=ORDERS_FETCH_SIZE, ids=None,
+                engine=None):
+    """
+    Потоковая выборка ордеров через серверный курсор: в памяти не больше fetch_size строк.
+    Фильтры: набор статусов, пары, кошелек пользователя, кошелек ордеров, id, ордера движка/legacy
+    """
+    where, params = _orders_filter(statuses, pairs, user_wallet, order_wallet_id, ids=ids, engine=engine)
+    with get_db_connection() as conn:
+        with conn.cursor(name=f"orders_scan_{threading.get_ident()}") as cur:
+            cur.itersize = fetch_size
+            cur.execute(f"""
+                SELECT {ORDER_SELECT_COLUMNS}
+                FROM orders
+                {where}
+                ORDER BY created_at DESC, id DESC
+            """, params)
+            columns = None
+            for row in cur:
+                if columns is None:
+                    columns = [desc[0] for desc in cur.description]
+                yield _order_from_row(columns, row)
+def query_orders(statuses=None, pairs=None, user_wallet=None, order_wallet_id=None,
+                 limit: int = ORDERS_PAGE_SIZE, cursor: Optional[str] = None) -> dict:
+    """
+    Страница ордеров (новые первыми) с keyset-пагинацией по (created_at, id).
+    
+    Returns:
+        dict: {'orders': [...], 'next_cursor': str или None}
+    """
+    limit = max(1, min(int(limit), ORDERS_MAX_PAGE_SIZE))
+    after = decode_orders_cursor(cursor) if cursor else None
+    where, params = _orders_filter(statuses, pairs, user_wallet, order_wallet_id, after)
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT {ORDER_SELECT_COLUMNS}
+                FROM orders
+                {where}
+                ORDER BY created_at DESC, id DESC
+                LIMIT %s
+            """, params + [limit + 1])
+            columns = [desc[0] for desc in cur.description]
+            orders = [_order_from_row(columns, row) for row in cur.fetchall()]
+    next_cursor = None
+    if len(orders) > limit:
+        orders = orders[:limit]
+        next_cursor = encode_orders_cursor(orders[-1])
+    return {'orders': orders, 'next_cursor': next_cursor}
+def load_orders(user_wallet=None, statuses=None, pairs=None, ids=None, engine=None):
+    """Загрузка ордеров из БД - унифицированная версия (с фильтром по статусам, парам, id и владельцу: движок/legacy)"""
+    try:
+        return {"orders": list(iter_orders(statuses=statuses, pairs=pairs, user_wallet=user_wallet, ids=ids, engine=engine))}
     except Exception as e:
         print(f"[ПРИЛОЖЕНИЕ] Ошибка загрузки ордеров: {e}")
         return {"orders": []}
+def load_order(order_id: str) -> Optional[dict]:
+    """Загрузка одного ордера из БД в формате load_orders"""
+    try:
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"""
+                    SELECT {ORDER_SELECT_COLUMNS}
+                    FROM orders
+                    WHERE id = %s
+                """, (order_id,))
+                row = cur.fetchone()
+                if not row:
+                    return None
+                return _order_from_row([desc[0] for desc in cur.description], row)
+    except Exception as e:
+        print(f"[ПРИЛОЖЕНИЕ] Ошибка загрузки ордера {order_id}: {e}")
+        return None
+# Условие ON CONFLICT DO UPDATE: версия совпадает (без версии — только вставка нового ордера) и переход статуса разрешен
+ORDER_CAS_CONDITION = version_condition('orders.version', '%s::integer') + ' AND ' + transition_condition('orders.status', 'EXCLUDED.status')
+# То же для пути исполнения: дополнительно разрешен переход в executed
+ORDER_EXECUTION_CAS_CONDITION = version_condition('orders.version', '%s::integer') + ' AND ' + transition_condition('orders.status', 'EXCLUDED.status', execution=True)
+# Ордера OrderEngine исполняет сам движок (без обмена и задачи outbox): executed — только для строк движка
+ORDER_ENGINE_FILL_CAS_CONDITION = ORDER_EXECUTION_CAS_CONDITION + ' AND orders.order_type IS NOT NULL'
+def _upsert_order(cur, order, execution: bool = False, engine_fill: bool = False) -> Optional[int]:
+    """
+    UPSERT ордера на переданном курсоре (без commit).
+    Обновление существующего ордера — CAS: проходит, только если версия в БД равна order['version']
+    и смена статуса разрешена машиной состояний; ордер без версии только вставляется.
+    execution=True — запись задачи outbox после обмена; engine_fill=True — исполнение ордера движка
+    (только строки с order_type). Других путей в executed нет.
+    
+    Returns:
+        int: Новая версия ордера или None, если запись проиграла параллельному изменению
+    """
+    cur.execute(f"""
+        INSERT INTO orders (
+            id, type, pair, amount, entry_price, stop_loss, take_profit,
+            user_wallet, order_wallet, order_wallet_id, status, created_at,
+            funded_at, opened_at, executed_at, execution_price, execution_type, cancelled_at, pnl, price_at_creation,
+            max_slippage, execution_error, order_type, version
+        )
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 1)
+        ON CONFLICT (id) DO UPDATE SET
+            stop_loss = EXCLUDED.stop_loss,
+            take_profit = EXCLUDED.take_profit,
+            amount = EXCLUDED.amount,
+            status = EXCLUDED.status,
+            funded_at = EXCLUDED.funded_at,
+            opened_at = EXCLUDED.opened_at,
+            executed_at = EXCLUDED.executed_at,
+            execution_price = EXCLUDED.execution_price,
+            execution_type = EXCLUDED.execution_type,
+            cancelled_at = EXCLUDED.cancelled_at,
+            pnl = EXCLUDED.pnl,
+            max_slippage = EXCLUDED.max_slippage,
+            execution_error = EXCLUDED.execution_error,
+            order_wallet_id = EXCLUDED.order_wallet_id,
+            version = orders.version + 1
+        WHERE {ORDER_ENGINE_FILL_CAS_CONDITION if engine_fill else ORDER_EXECUTION_CAS_CONDITION if execution else ORDER_CAS_CONDITION}
+        RETURNING version
+    """, (
+        order['id'], order['type'], order['pair'], order['amount'],
+        order['entry_price'], order.get('stop_loss'), order.get('take_profit'),
+        order['user_wallet'], order.get('order_wallet'), order.get('order_wallet_id'),
+        order['status'],
+        order['created_at'], order.get('funded_at'), order.get('opened_at'),
+        order.get('executed_at'), order.get('execution_price'), order.get('execution_type'),
+        order.get('cancelled_at'), order.get('pnl', 0), order.get('price_at_creation'),
+        order.get('max_slippage', DEFAULT_SLIPPAGE), order.get('execution_error'), order.get('order_type'),
+        order.get('version'), order.get('version')
+    ))
+    row = cur.fetchone()
+    if not row:
+        return None
+    order['version'] = row[0]
+    return row[0]
 def save_order(order):
     """Сохранение ордера в БД"""
     try:
         with get_db_connection() as conn:
             with conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO orders (
-                        id, type, pair, amount, entry_price, stop_loss, take_profit,
-                        user_wallet, order_wallet, order_wallet_id, status, created_at,
-                        funded_at, opened_at, executed_at, execution_price, execution_type, cancelled_at, pnl, price_at_creation,
-                        max_slippage, execution_error
-                    )
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (id) DO UPDATE SET
-                        stop_loss = EXCLUDED.stop_loss,
-                        take_profit = EXCLUDED.take_profit,
-                        amount = EXCLUDED.amount,
-                        status = EXCLUDED.status,
-                        funded_at = EXCLUDED.funded_at,
-                        opened_at = EXCLUDED.opened_at,
-                        executed_at = EXCLUDED.executed_at,
-                        execution_price = EXCLUDED.execution_price,
-                        execution_type = EXCLUDED.execution_type,
-                        cancelled_at = EXCLUDED.cancelled_at,
-                        pnl = EXCLUDED.pnl,
-                        max_slippage = EXCLUDED.max_slippage,
-                        execution_error = EXCLUDED.execution_error,
-                        order_wallet_id = EXCLUDED.order_wallet_id
-                """, (
-                    order['id'], order['type'], order['pair'], order['amount'],
-                    order['entry_price'], order.get('stop_loss'), order.get('take_profit'),
-                    order['user_wallet'], order.get('order_wallet'), order.get('order_wallet_id'),
-                    order['status'],
-                    order['created_at'], order.get('funded_at'), order.get('opened_at'),
-                    order.get('executed_at'), order.get('execution_price'), order.get('execution_type'),
-                    order.get('cancelled_at'), order.get('pnl', 0), order.get('price_at_creation'),
-                    order.get('max_slippage', DEFAULT_SLIPPAGE), order.get('execution_error')
-                ))
+                version = _upsert_order(cur, order)
                 conn.commit()
+                if version is None:
+                    print(f"[ПРИЛОЖЕНИЕ] Ордер {order['id']} изменен параллельно или переход в {order['status']} запрещен, запись отклонена")
+                    return False
                 return True
     except Exception as e:
         print(f"[ПРИЛОЖЕНИЕ] Ошибка сохранения ордера: {e}")
         return False
+# Колонки результата исполнения; остальные (SL/TP, сумма) берутся из свежей строки
+EXECUTION_RESULT_COLUMNS = ('status', 'opened_at', 'executed_at', 'execution_price', 'execution_type', 'pnl', 'execution_error')
+def _reapply_execution_result(cur, order) -> Optional[int]:
+    """
+    Повтор записи результата исполнения после проигранного CAS: строка перечитывается под блокировкой,
+    результат накладывается на свежую версию (изменения SL/TP и трейлинга во время обмена сохраняются).
+
+    Returns:
+        int: Новая версия или None — переход из текущего статуса запрещен (например, ордер отменен)
+    """
+    cur.execute(f"""
+        SELECT {ORDER_SELECT_COLUMNS}
+        FROM orders
+        WHERE id = %s
+        FOR UPDATE
+    """, (order['id'],))
+    row = cur.fetchone()
+    if not row:
+        return None
+    fresh = _order_from_row([desc[0] for desc in cur.description], row)
+    if not can_transition(fresh['status'], order['status'], execution=True):
+        return None
+    for column in EXECUTION_RESULT_COLUMNS:
+        fresh[column] = order.get(column)
+    version = _upsert_order(cur, fresh, execution=True)
+    if version is not None:
+        order.update(fresh)
+    return version
+def save_engine_fills(orders: List[dict]) -> List[str]:
+    """
+    Исполнения ордеров OrderEngine одной транзакцией (CAS по версии, переход в executed только для строк движка).
+
+    Returns:
+        list: id ордеров, запись которых прошла
+    """
+    if not orders:
+        return []
+    try:
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                written = [order['id'] for order in orders if _upsert_order(cur, order, engine_fill=True) is not None]
+                conn.commit()
+                return written
+    except Exception as e:
+        print(f"[ПРИЛОЖЕНИЕ] Ошибка сохранения исполнений движка: {e}")
+        return []
 # Вспомогательная функция для конверсии (используется в app.py)
 def to_nano(amount: float, currency: str = "ton") -> int:
     if currency != "ton":
@@ -593,6 +815,16 @@ SERVICE_FEE_RATE = float(os.environ.get("SERVICE_FEE_RATE", 0.0025))
 # Настройки по умолчанию
 DEFAULT_SLIPPAGE = 1.0 # 1% по умолчанию
 ORDER_CHECK_INTERVAL = float(os.environ.get("ORDER_CHECK_INTERVAL", "2.0"))
+# Полная проверка (funding и все пары) без события изменения цены
+ORDER_HEARTBEAT_INTERVAL = float(os.environ.get("ORDER_HEARTBEAT_INTERVAL", "30.0"))
+# embedded — проверка ордеров в процессе веб-сервера; sharded/off — проверку ведут отдельные воркеры (checker_worker.py)
+ORDER_CHECKER_MODE = os.environ.get("ORDER_CHECKER_MODE", "embedded")
+if ORDER_CHECKER_MODE != 'embedded':
+    # Ордера исполняют отдельные процессы (checker_worker.py), а API веб-сервера отправляет с тех же кошельков:
+    # локальный seqno секвенсора верен, только если все отправки с кошелька идут через один процесс
+    disable_wallet_sequencer(f"ORDER_CHECKER_MODE={ORDER_CHECKER_MODE}, отправки с кошелька идут из нескольких процессов")
+# Минимальное относительное изменение цены, запускающее проверку пары
+PRICE_CHANGE_THRESHOLD = float(os.environ.get("PRICE_CHANGE_THRESHOLD", "0"))
 def load_pools():
     db_pools = fetch_pools_from_db()
     if db_pools:
@@ -646,6 +878,27 @@ def load_pools():
 pools = {}
 _default_wallet = None
 order_wallet_address = None
+price_events = PriceEventBus()
+execution_pool = ExecutionPool()
+execution_outbox = ExecutionOutbox(get_db_connection)
+order_store = OrderPersistence(get_db_connection, defaults={'pnl': 0, 'max_slippage': DEFAULT_SLIPPAGE})
+retry_scheduler = RetryScheduler()
+slippage_stats = SlippageStats(get_db_connection) # Общая для legacy-исполнения и OrderEngine
+latency_stats = LatencyStats() # Задержки этапов исполнения в этом процессе (по всем воркерам — из outbox)
+checker_shards = None # ShardLeaseManager воркера в шардированном режиме
+def checker_owns(key) -> bool:
+    """Ключ (пара или адрес кошелька) относится к шардам этого процесса"""
+    return checker_shards is None or checker_shards.owns(key)
+def checked_pairs() -> List[str]:
+    """Пары, которые проверяет этот процесс"""
+    return [pair for pair in pools.keys() if checker_owns(pair)]
+price_watcher = PriceWatcher(
+    price_events,
+    pairs_provider=checked_pairs,
+    snapshot_fetcher=lambda pair: get_pair_price_snapshot(pair),
+    poll_interval=ORDER_CHECK_INTERVAL,
+    min_change=PRICE_CHANGE_THRESHOLD
+)
 def get_current_price(pool_addr: str, pool: dict = None):
     """
     Получает текущую цену из пула с учетом decimals токенов
@@ -751,7 +1004,7 @@ def order_is_funded(order):
     required_amount = order['amount'] + 0.1 # +0.1 TON для газа
     
     return balance >= required_amount
-def execute_entry_swap(order):
+def execute_entry_swap(order, before_send=None, trace=None, on_confirm=None):
     """Выполняет обмен при открытии позиции (используется для SHORT)"""
     pair = order.get('pair')
     pair_pools = get_pair_pools(pair)
@@ -774,7 +1027,10 @@ def execute_entry_swap(order):
         order=order_for_swap,
         pool=pool,
         wallet_credentials=wallet_credentials,
-        slippage=order_slippage
+        slippage=order_slippage,
+        before_send=before_send,
+        trace=trace,
+        on_confirm=on_confirm
     )
     
     if swap_result.get('success'):
@@ -791,41 +1047,415 @@ def execute_entry_swap(order):
         return False, True
     print(f"[ОРДЕР] Ошибка открытия {order.get('id')}: {error_msg}")
     return False, False
+def get_order_wallet_key(order: dict) -> str:
+    """Ключ сериализации исполнения: ордера одного кошелька исполняются последовательно (seqno)"""
+    return str(order.get('order_wallet_id') or order.get('order_wallet') or 'default')
+def outbox_send_guard(outbox_job):
+    """Колбэк before_send: фиксирует начало отправки в outbox; без аренды отправка отменяется"""
+    if not outbox_job:
+        return None
+    def before_send():
+        outbox_job['sending'] = execution_outbox.mark_sending(outbox_job['id'])
+        return outbox_job['sending']
+    return before_send
+def outbox_confirm_hook(outbox_job):
+    """
+    Колбэк on_confirm секвенсора кошелька: итог отправки (True — seqno подтвержден, False — истек
+    valid_until) попадает в Future задачи; его ждет save_execution_result, если результат пришел раньше
+    """
+    if not outbox_job:
+        return None
+    outbox_job['confirmation'] = Future()
+    return outbox_job['confirmation'].set_result
+def defer_until_confirmed(order, outbox_job, result) -> bool:
+    """
+    Принятое сетью, но не подтвержденное сообщение: задача остается в sending с seqno,
+    ордер и задача сохраняются, когда секвенсор сообщит итог (в потоке retry_scheduler)
+    """
+    confirm_seconds = max(float(result.get('valid_until') or 0) - time.time(), 0) + SEQUENCER_CONFIRM_GRACE
+    if not execution_outbox.mark_sent(outbox_job['id'], result.get('seqno'), confirm_seconds):
+        print(f"[ИСПОЛНЕНИЕ] ⚠️ Аренда задачи {outbox_job['id']} ордера {order['id']} потеряна после отправки seqno {result.get('seqno')}")
+        return False
+    print(f"[ИСПОЛНЕНИЕ] Ордер {order['id']}: seqno {result.get('seqno')} принят сетью, ждем подтверждения")
+    confirmation = outbox_job.pop('confirmation')
+    confirmation.add_done_callback(lambda future: retry_scheduler.schedule(
+        f"confirm:{order['id']}", 0, complete_confirmed_execution, order, outbox_job, result, future.result()
+    ))
+    return True
+def complete_confirmed_execution(order, outbox_job, result, confirmed: bool):
+    """Итог отправки через секвенсор: подтверждено — done; истек valid_until — повтор (сообщение уже не исполнится)"""
+    if confirmed:
+        trace = outbox_job.get('trace')
+        if trace:
+            trace.stamp('confirmed')
+        save_execution_result(order, outbox_job, 'done', result=result)
+        return
+    error = f"seqno {result.get('seqno')} не включен в блок до valid_until (confirmation timeout)"
+    print(f"[ИСПОЛНЕНИЕ] ⚠️ Ордер {order['id']}: {error}")
+    fresh = load_order(order['id'])
+    if not fresh:
+        execution_outbox.finish(outbox_job['id'], 'failed', error=error)
+        return
+    outbox_job['expired'] = True
+    save_execution_result(fresh, outbox_job, 'retry', error=error)
+def save_execution_result(order, outbox_job=None, job_state='done', error=None, result=None):
+    """
+    Сохраняет ордер; при исполнении из outbox — в одной транзакции с завершением задачи
+    (done — только если запись ордера прошла). Возвращает, записан ли ордер
+    """
+    if not outbox_job:
+        return order_store.save(order) # Внутри цикла проверки — в пакете цикла
+    if outbox_job.get('sending') is False:
+        # Аренда потеряна до отправки: задачей владеет другой воркер, ордер не трогаем
+        print(f"[ИСПОЛНЕНИЕ] Аренда задачи {outbox_job['id']} ордера {order.get('id')} потеряна, результат не сохраняется")
+        return False
+    if job_state == 'done' and result and result.get('awaiting_confirmation') and outbox_job.get('confirmation'):
+        return defer_until_confirmed(order, outbox_job, result)
+    if job_state == 'retry' and outbox_job.get('sending') and not outbox_job.get('expired'):
+        # Ошибка после начала отправки: транзакция могла уйти, повторять автоматически нельзя
+        # (кроме сообщения секвенсора с истекшим valid_until — оно уже не исполнится)
+        job_state = 'unknown'
+    retry = None
+    if job_state == 'retry':
+        retry = plan_retry(error, outbox_job['attempt'])
+        if retry is None:
+            job_state = 'failed'
+            order['status'] = 'execution_failed'
+            order['execution_error'] = f"Попытки исчерпаны ({outbox_job['attempt']}): {error}"
+    try:
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                written = _upsert_order(cur, order, execution=True) is not None
+                if not written:
+                    # Версию могли поднять безобидные изменения (PATCH SL/TP, трейлинг) — результат накладывается на свежую строку
+                    written = _reapply_execution_result(cur, order) is not None
+                if not written:
+                    # Переход запрещен (например, ордер отменен во время обмена): результат остается в outbox
+                    print(f"[ИСПОЛНЕНИЕ] ⚠️ Ордер {order['id']} изменен параллельно, статус {order['status']} не записан (задача {outbox_job['id']}: {job_state})")
+                    if job_state == 'retry':
+                        job_state = 'failed' # Повтор по устаревшему ордеру не нужен
+                        retry = None
+                    elif job_state == 'done':
+                        # Обмен прошел, а ордер не записан: done заблокировал бы ордер навсегда, нужна сверка
+                        job_state = 'unknown'
+                        error = f"Обмен выполнен, но ордер изменен параллельно: статус {order['status']} не записан"
+                trace = outbox_job.get('trace')
+                execution_outbox.finish(outbox_job['id'], job_state, result=result, error=error, cur=cur,
+                                        latency=trace.to_dict() if trace else None)
+                next_job = None
+                if retry:
+                    # Следующая попытка создается в той же транзакции, срок — по политике причины ошибки
+                    payload = dict(outbox_job.get('payload') or {}, retry_reason=retry['reason'])
+                    next_job = execution_outbox.enqueue(
+                        order['id'], outbox_job['action'], outbox_job.get('wallet_key'), payload,
+                        delay_seconds=retry['delay'], cur=cur
+                    )
+                conn.commit()
+        if trace and job_state == 'done':
+            latency_stats.observe(trace)
+        if next_job:
+            retry_scheduler.schedule(order['id'], retry['delay'], claim_outbox_job, next_job['id'])
+            print(f"[ИСПОЛНЕНИЕ] Повтор {order['id']} ({retry['reason']}): попытка {next_job['attempt']} через {retry['delay']:.1f} с")
+        return written
+    except Exception as e:
+        print(f"[ИСПОЛНЕНИЕ] Ошибка сохранения результата {order.get('id')}: {e}")
+        return False
+def mark_order_opened(order, current_price, price_at_creation, outbox_job=None):
+    """Переводит ордер в opened по цене входа"""
+    entry_price = float(order['entry_price'])
+    order['status'] = 'opened'
+    order['opened_at'] = datetime.now().isoformat()
+    order['execution_price'] = entry_price # Используем entry_price как цену открытия
+    save_execution_result(order, outbox_job, 'done', result=order.get('open_swap_result'))
+    print(f"[ОРДЕР] Открыт {order['id']} по цене входа {entry_price} (текущая: {current_price:.6f}, была: {price_at_creation:.6f})")
+def execute_open_order(task, order, current_price, price_at_creation, outbox_job=None):
+    """Задача пула исполнения: обмен при открытии SHORT и перевод ордера в opened"""
+    with task.stage('swap'):
+        swap_success, is_transient = execute_entry_swap(order, before_send=outbox_send_guard(outbox_job),
+                                                        trace=outbox_job.get('trace') if outbox_job else None,
+                                                        on_confirm=outbox_confirm_hook(outbox_job))
+    with task.stage('save'):
+        if not swap_success:
+            if not is_transient:
+                order['status'] = 'execution_failed'
+            save_execution_result(order, outbox_job, 'retry' if is_transient else 'failed', error=order.get('execution_error'))
+            return
+        mark_order_opened(order, current_price, price_at_creation, outbox_job)
+def record_trigger_slippage(order, execution_type, current_price, pool):
+    """Проскальзывание исполнения относительно уровня SL/TP (цена срабатывания против уровня)"""
+    target = order.get('stop_loss') if execution_type == 'STOP_LOSS' else order.get('take_profit')
+    try:
+        target = float(target or 0)
+        if target <= 0 or not current_price:
+            return
+        slippage_stats.record(
+            abs(float(current_price) - target) / target * 100,
+            symbol=order.get('pair'),
+            dex=pool.get('dex'),
+            order_id=order.get('id'),
+            expected_price=target,
+            execution_price=float(current_price)
+        )
+    except (TypeError, ValueError) as e:
+        print(f"[ОРДЕР] Не удалось учесть проскальзывание {order.get('id')}: {e}")
+def execute_close_order(task, order, execution_type, current_price, outbox_job=None):
+    """Задача пула исполнения: закрытие ордера по SL/TP через DEX"""
+    # Выполняем реальный обмен через DEX
+    pair = order['pair']
+    pair_pools = get_pair_pools(pair)
+    if pair_pools:
+        with task.stage('prepare'):
+            targets = [order.get('take_profit'), order.get('stop_loss')]
+            pool = pick_pool_by_targets(pair, targets) or pair_pools[0]
+            wallet_credentials = get_order_wallet_credentials(order)
+        
+        if not wallet_credentials:
+            order['status'] = 'execution_failed'
+            order['execution_error'] = 'Кошелек для ордера не найден или не настроен'
+            save_execution_result(order, outbox_job, 'failed', error=order['execution_error'])
+            return
+        
+        order['action'] = 'close'
+        order_slippage = float(order.get('max_slippage', DEFAULT_SLIPPAGE))
+        with task.stage('swap'):
+            swap_result = execute_order_swap(
+                order=order,
+                pool=pool,
+                wallet_credentials=wallet_credentials,
+                slippage=order_slippage,
+                before_send=outbox_send_guard(outbox_job),
+                trace=outbox_job.get('trace') if outbox_job else None,
+                on_confirm=outbox_confirm_hook(outbox_job)
+            )
+        
+        if swap_result.get('success'):
+            order['status'] = 'executed'
+            order['executed_at'] = datetime.now().isoformat()
+            order['execution_type'] = execution_type
+            order['swap_result'] = swap_result # Сохраняем результат обмена
+            record_trigger_slippage(order, execution_type, current_price, pool)
+            
+            if swap_result.get('transaction_sent'):
+                order['transaction_hash'] = swap_result.get('transaction', {}).get('hash')
+                print(f"[ОРДЕР] Исполнен и произведён обмен {order['id']} по цене {current_price} ({execution_type}), PnL: {order.get('pnl', 0)}")
+                print(f"[ОРДЕР] Транзакция отправлена: {swap_result.get('message', '')}")
+            else:
+                print(f"[ОРДЕР] Исполнен {order['id']} по цене {current_price} ({execution_type}), PnL: {order.get('pnl', 0)}")
+                print(f"[ОРДЕР] Обмен подготовлен, но НЕ отправлен: {swap_result.get('message', '')}")
+                print(f"[ОРДЕР] 💡 Причина: {swap_result.get('message', 'Unknown')}")
+                print(f"[ОРДЕР] Данные транзакции: {swap_result.get('transaction', {})}")
+                print(f"[ОРДЕР] 💡 Для автоматической отправки убедитесь, что:")
+                print(f" 1. Установлен pytoniq: pip install pytoniq")
+                print(f" 2. Установлена переменная ORDER_WALLET_MNEMONIC в .env")
+                print(f" 3. Мнемоника соответствует адресу кошелька ордеров")
+        else:
+            # Ошибка при выполнении обмена
+            error_msg = swap_result.get('error', 'Unknown error')
+            order['execution_error'] = error_msg
+            if swap_result.get('transient'):
+                print(f"[ОРДЕР] Временная ошибка исполнения для {order['id']}: {error_msg}. Повторим попытку позже.")
+                with task.stage('save'):
+                    save_execution_result(order, outbox_job, 'retry', error=error_msg)
+                return
+            print(f"[ОРДЕР] Ошибка исполнения для {order['id']}: {error_msg}")
+            order['status'] = 'execution_failed'
+    else:
+        # Пул не найден, просто отмечаем как executed
+        print(f"[ОРДЕР] Пул {pair} не найден, отмечаем ордер исполненным без обмена")
+        order['status'] = 'executed'
+        order['executed_at'] = datetime.now().isoformat()
+        order['execution_type'] = execution_type
+    
+    # execution_price уже установлен при открытии (entry_price)
+    with task.stage('save'):
+        if order['status'] == 'executed':
+            save_execution_result(order, outbox_job, 'done', result=order.get('swap_result'))
+        else:
+            save_execution_result(order, outbox_job, 'failed', error=order.get('execution_error'))
+def submit_outbox_job(job) -> bool:
+    """Передает захваченную задачу outbox в пул исполнения; если задача ордера уже в пуле — возвращает аренду"""
+    if not execution_pool.submit(job.get('wallet_key'), job['order_id'], process_outbox_job, job):
+        execution_outbox.release(job['id'])
+        return False
+    return True
+def claim_outbox_job(job_id):
+    """Захватывает конкретную задачу outbox по сроку и передает в пул исполнения"""
+    claimed = execution_outbox.claim(job_id=job_id)
+    if claimed:
+        submit_outbox_job(claimed[0])
+def start_latency_trace(pair_prices) -> dict:
+    """Трасса задержки для payload задачи: получение цены пары и проверка условия"""
+    trace = LatencyTrace(pair_prices.get('fetched_at'))
+    if pair_prices.get('fetched_at') is not None:
+        trace.stamp('price_fetched', pair_prices['fetched_at'])
+    trace.stamp('evaluated')
+    return trace.to_dict()
+def dispatch_execution(order, action, payload) -> bool:
+    """
+    Ставит исполнение ордера в outbox и сразу передает его в пул исполнения.
+    Если для действия ордера уже есть незавершенная или исполненная задача, повторно не ставится.
+    """
+    if execution_pool.is_pending(order['id']) or retry_scheduler.is_scheduled(order['id']):
+        return False # Исполняется или ждет отложенного повтора
+    job = execution_outbox.enqueue(order['id'], action, get_order_wallet_key(order), payload)
+    if not job:
+        return False
+    claimed = execution_outbox.claim(job_id=job['id'])
+    if not claimed:
+        return False # Задачу уже забрал другой воркер
+    return submit_outbox_job(claimed[0])
+def dispatch_due_outbox_jobs(limit: int = 50):
+    """Забирает готовые задачи outbox (в т.ч. созданные другими процессами или возвращенные после сбоя)"""
+    recovered = execution_outbox.recover_abandoned()
+    for order_id in recovered['unknown']:
+        print(f"[ИСПОЛНЕНИЕ] ⚠️ Аренда ордера {order_id} истекла во время отправки: требуется сверка, повторная отправка заблокирована")
+    for job in execution_outbox.claim(limit=limit):
+        submit_outbox_job(job)
+def process_outbox_job(task, job):
+    """Задача пула исполнения для outbox: перечитывает ордер и исполняет действие"""
+    order = load_order(job['order_id'])
+    expected_status = 'waiting_entry' if job['action'] == 'open' else 'opened'
+    if not order or order['status'] != expected_status:
+        status = order['status'] if order else 'не найден'
+        execution_outbox.finish(job['id'], 'failed', error=f'Ордер в статусе {status}, исполнение пропущено')
+        return
+    payload = job.get('payload') or {}
+    # Трасса задержки продолжается с отметок проверки (возможно, в другом процессе)
+    job['trace'] = LatencyTrace.from_dict(payload.get('latency'))
+    job['trace'].stamp('execution_started')
+    job['trace'].label(action=job['action'], pair=order.get('pair'))
+    current_price = float(payload.get('current_price') or 0)
+    if job['action'] == 'open':
+        price_at_creation = float(payload.get('price_at_creation') or current_price)
+        execute_open_order(task, order, current_price, price_at_creation, outbox_job=job)
+    else:
+        if payload.get('pnl') is not None:
+            order['pnl'] = payload['pnl']
+        execute_close_order(task, order, payload.get('execution_type', ''), current_price, outbox_job=job)
+# Состояние кошельков на момент последней проверки funding: address -> (last_lt, ожидающие ордера, резерв)
+_funding_wallet_state = {}
+# Статусы ордеров, для которых средства на кошельке уже зарезервированы
+FUNDED_ORDER_STATUSES = ('active', 'waiting_entry', 'opened')
+def get_order_wallet_addresses(wallet_ids) -> Dict[int, str]:
+    """Адреса кошельков ордеров одним запросом: {wallet_id: address}"""
+    wallet_ids = sorted({int(w) for w in wallet_ids if w})
+    if not wallet_ids:
+        return {}
+    try:
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT id, address FROM order_wallets WHERE id = ANY(%s)", (wallet_ids,))
+                return {row[0]: row[1] for row in cur.fetchall()}
+    except Exception as e:
+        print(f"[КОШЕЛЬКИ] Ошибка получения адресов кошельков: {e}")
+        return {}
+def allocate_wallet_funding(balance: float, reserved: float, pending_orders: List[dict]) -> List[dict]:
+    """
+    Распределяет баланс кошелька по ожидающим пополнения ордерам в порядке создания.
+    
+    Args:
+        balance: Баланс кошелька в TON
+        reserved: Сумма, уже зарезервированная активными ордерами этого кошелька
+        pending_orders: Ордера кошелька в статусе unfunded
+    
+    Returns:
+        list: Ордера, которые покрываются балансом (более поздний ордер не обгоняет более ранний)
+    """
+    available = balance - reserved
+    funded = []
+    for order in sorted(pending_orders, key=lambda o: str(o.get('created_at') or '')):
+        required_amount = float(order['amount']) + 0.1 # +0.1 TON для газа
+        if available < required_amount:
+            break
+        available -= required_amount
+        funded.append(order)
+    return funded
 def check_orders_funding():
-    '''Проверка "поступили ли нужные средства для ордеров"'''
+    '''
+    Проверка "поступили ли нужные средства для ордеров".
+    Ордера группируются по кошельку: один запрос состояния на кошелек за цикл, средства распределяются
+    по ордерам в порядке создания. Кошелек, у которого не изменились lt последней транзакции,
+    набор ожидающих ордеров и резерв, пропускается целиком.
+    '''
     try:
-        orders_data = load_orders()
-        for order in orders_data['orders']:
-            if order.get('status') == 'unfunded' and order_is_funded(order):
+        orders_data = load_orders(statuses=LIVE_ORDER_STATUSES) # unfunded + FUNDED_ORDER_STATUSES
+        order_store.track(orders_data['orders'], replace=True) # Полный набор живых ордеров — сброс отслеживания
+        live_orders = orders_data['orders']
+        wallet_addresses = get_order_wallet_addresses(o.get('order_wallet_id') for o in live_orders)
+        
+        groups = {}
+        for order in live_orders:
+            address = wallet_addresses.get(order.get('order_wallet_id')) or order.get('order_wallet')
+            if not address:
+                continue
+            group = groups.setdefault(address, {'pending': [], 'reserved': 0.0})
+            if order['status'] == 'unfunded':
+                group['pending'].append(order)
+            else:
+                group['reserved'] += float(order['amount']) + 0.1
+        
+        for address, group in groups.items():
+            if not checker_owns(address):
+                continue # Кошелек в шарде другого воркера
+            if not group['pending']:
+                _funding_wallet_state.pop(address, None)
+                continue
+            state = get_wallet_state(address)
+            if not state:
+                continue
+            state_key = (
+                state['last_lt'],
+                frozenset(o['id'] for o in group['pending']),
+                round(group['reserved'], 9)
+            )
+            if state['last_lt'] is not None and _funding_wallet_state.get(address) == state_key:
+                continue # На кошелек ничего не поступало
+            _funding_wallet_state[address] = state_key
+            
+            for order in allocate_wallet_funding(state['balance'], group['reserved'], group['pending']):
                 order['status'] = 'waiting_entry' # Меняем на waiting_entry вместо active
                 order['funded_at'] = datetime.now().isoformat()
-                save_order(order)
+                # Запись отклонена (ордер изменен параллельно) — кошелек проверяется заново на следующем проходе
+                order_store.save(order, on_conflict=lambda _, address=address: _funding_wallet_state.pop(address, None))
                 print(f"[ОРДЕР] Ордер {order['id']} - поступление средств подтверждено, ожидает достижения цены входа!")
     except Exception as e:
         print(f"[ПОПОЛНЕНИЕ ОРДЕРА] Ошибка: {e}")
         traceback.print_exc()
-def check_orders_execution():
-    """Проверяет выполнение условий для ордеров"""
+def check_orders_execution(pairs=None, current_prices=None):
+    """
+    Проверяет выполнение условий для ордеров
+    
+    Args:
+        pairs: Проверить только ордера этих пар (None — все пары)
+        current_prices: Уже полученные снимки цен {pair: {'long', 'short'}} (например, из события изменения цены)
+    """
     try:
-        orders_data = load_orders()
+        if pairs is None and checker_shards is not None:
+            pairs = checked_pairs()
+        if pairs is not None:
+            pairs = set(pairs)
+        # Только живые legacy-ордера нужных пар: история не читается, ордера OrderEngine (order_type) проверяет движок
+        orders_data = load_orders(statuses=('waiting_entry', 'opened'), pairs=pairs, engine=False)
+        order_store.track(orders_data['orders'])
         # Проверяем ордера в статусах waiting_entry и opened
-        waiting_orders = [o for o in orders_data['orders'] if o['status'] == 'waiting_entry']
-        opened_orders = [o for o in orders_data['orders'] if o['status'] == 'opened']
+        waiting_orders = [o for o in orders_data['orders'] if o['status'] == 'waiting_entry' and (pairs is None or o['pair'] in pairs)]
+        opened_orders = [o for o in orders_data['orders'] if o['status'] == 'opened' and (pairs is None or o['pair'] in pairs)]
         
-        # Получаем диапазон цен для всех пар
-        current_prices = {}
-        for pair_name in pools.keys():
+        # Получаем диапазон цен для пар, которые не пришли с событием
+        current_prices = dict(current_prices or {})
+        for pair_name in (pairs if pairs is not None else pools.keys()):
+            if pair_name in current_prices:
+                continue
             snapshot = get_pair_price_snapshot(pair_name)
             if snapshot:
                 current_prices[pair_name] = snapshot
         
         # Проверяем ордера, ожидающие достижения entry_price
         for order in waiting_orders:
-            pair = order['pair']
-            pair_prices = current_prices.get(pair)
+            pair_prices = current_prices.get(order['pair'])
             if not pair_prices:
                 continue
-            current_price = pair_prices['long'] if order['type'] == 'long' else pair_prices['short']
+            current_price = side_price(order, pair_prices)
             if not current_price:
                 continue
             entry_price = float(order['entry_price'])
@@ -834,195 +1464,110 @@ def check_orders_execution():
             # Если price_at_creation не сохранена, используем текущую цену как отправную точку
             if price_at_creation_raw is None:
                 price_at_creation = current_price
-                print(f"[ПРОВЕРКА ОРДЕРА] Внимание: price_at_creation не найден для ордера {order['id']}, используется текущая цена: {current_price:.6f}")
+                debug_sampled(log, "[ПРОВЕРКА ОРДЕРА] Внимание: price_at_creation не найден для ордера %s, используется текущая цена: %.6f",
+                              order['id'], current_price, order_id=order['id'], pair=order['pair'])
             else:
                 price_at_creation = float(price_at_creation_raw)
             
-            # Определяем, достигнута ли entry_price в нужном направлении
-            entry_reached = False
-            
             # Получаем slippage из ордера или используем значение по умолчанию
             order_slippage = float(order.get('max_slippage', DEFAULT_SLIPPAGE))
-            
-            # Используем slippage для определения допустимого диапазона цен вокруг entry_price
-            slippage_multiplier = order_slippage / 100.0 # Конвертируем проценты в множитель
-            
-            if order['type'] == 'long':
-                if price_at_creation < entry_price:
-                    # Buy Stop: цена была ниже, ждем роста до entry_price или выше
-                    # С учетом slippage: цена должна быть >= entry_price * (1 - slippage)
-                    min_entry_price = entry_price * (1 - slippage_multiplier)
-                    entry_reached = current_price >= min_entry_price
-                else:
-                    # Buy Limit: цена была выше, ждем падения до entry_price или ниже
-                    # С учетом slippage: цена должна быть <= entry_price * (1 + slippage)
-                    max_entry_price = entry_price * (1 + slippage_multiplier)
-                    entry_reached = current_price <= max_entry_price
-            elif order['type'] == 'short':
-                if price_at_creation > entry_price:
-                    # Sell Stop: цена была выше, ждем падения до entry_price или ниже
-                    # С учетом slippage: цена должна быть <= entry_price * (1 + slippage)
-                    max_entry_price = entry_price * (1 + slippage_multiplier)
-                    entry_reached = current_price <= max_entry_price
-                else:
-                    # Sell Limit: цена была ниже, ждем роста до entry_price или выше
-                    # С учетом slippage: цена должна быть >= entry_price * (1 - slippage)
-                    min_entry_price = entry_price * (1 - slippage_multiplier)
-                    entry_reached = current_price >= min_entry_price
-            
-            print(entry_reached)
-            # Добавляем отладочный вывод для диагностики
-            if order['type'] == 'long':
-                if price_at_creation < entry_price:
-                    min_entry = entry_price * (1 - slippage_multiplier)
-                    print(f"[ПРОВЕРКА ОРДЕРА] Ордер {order['id']}: Длинный Buy Stop, текущая={current_price:.6f}, вход={entry_price:.6f}, мин. вход={min_entry:.6f}, цена_создания={price_at_creation:.6f}, slippage={order_slippage}%, entry_reached={entry_reached}")
-                else:
-                    max_entry = entry_price * (1 + slippage_multiplier)
-                    print(f"[ПРОВЕРКА ОРДЕРА] Ордер {order['id']}: Длинный Buy Limit, текущая={current_price:.6f}, вход={entry_price:.6f}, макс. вход={max_entry:.6f}, цена_создания={price_at_creation:.6f}, slippage={order_slippage}%, entry_reached={entry_reached}")
-            else:
-                if price_at_creation > entry_price:
-                    max_entry = entry_price * (1 + slippage_multiplier)
-                    print(f"[ПРОВЕРКА ОРДЕРА] Ордер {order['id']}: Короткий Sell Stop, текущая={current_price:.6f}, вход={entry_price:.6f}, макс. вход={max_entry:.6f}, цена_создания={price_at_creation:.6f}, slippage={order_slippage}%, entry_reached={entry_reached}")
-                else:
-                    min_entry = entry_price * (1 - slippage_multiplier)
-                    print(f"[ПРОВЕРКА ОРДЕРА] Ордер {order['id']}: Короткий Sell Limit, текущая={current_price:.6f}, вход={entry_price:.6f}, мин. вход={min_entry:.6f}, цена_создания={price_at_creation:.6f}, slippage={order_slippage}%, entry_reached={entry_reached}")
+            # Достигнута ли entry_price в нужном направлении (с допуском slippage вокруг entry_price)
+            entry_reached, entry_kind, entry_bound = entry_condition(order, current_price, price_at_creation, order_slippage)
+            # Запись на каждый ордер каждого тика: только debug с сэмплированием, аргументы форматирует фоновый поток
+            debug_sampled(log, "[ПРОВЕРКА ОРДЕРА] Ордер %s: %s %s, текущая=%.6f, вход=%.6f, граница=%.6f, цена_создания=%.6f, slippage=%s%%, entry_reached=%s",
+                          order['id'], order['type'], entry_kind, current_price, entry_price, entry_bound, price_at_creation,
+                          order_slippage, entry_reached, order_id=order['id'], pair=order['pair'], entry_reached=entry_reached)
             
             if entry_reached:
                 if order['type'] == 'short':
-                    swap_success, is_transient = execute_entry_swap(order)
-                    if not swap_success:
-                        if is_transient:
-                            save_order(order)
-                            continue
-                        order['status'] = 'execution_failed'
-                        save_order(order)
-                        continue
+                    # Обмен при открытии SHORT выполняется через outbox в пуле исполнения, чтобы не блокировать проверку
+                    dispatch_execution(order, 'open', {
+                        'current_price': current_price,
+                        'price_at_creation': price_at_creation,
+                        'latency': start_latency_trace(pair_prices)
+                    })
+                    continue
                 
-                # Позиция открыта, меняем статус на opened
-                order['status'] = 'opened'
-                order['opened_at'] = datetime.now().isoformat()
-                order['execution_price'] = entry_price # Используем entry_price как цену открытия
-                save_order(order)
-                print(f"[ОРДЕР] Открыт {order['id']} по цене входа {entry_price} (текущая: {current_price:.6f}, была: {price_at_creation:.6f})")
+                mark_order_opened(order, current_price, price_at_creation)
         
         # Проверяем открытые ордера на stop_loss и take_profit
         for order in opened_orders:
-            pair = order['pair']
-            pair_prices = current_prices.get(pair)
+            pair_prices = current_prices.get(order['pair'])
             if not pair_prices:
                 continue
-            
-            current_price = pair_prices['long'] if order['type'] == 'long' else pair_prices['short']
+            current_price = side_price(order, pair_prices)
             if not current_price:
                 continue
-            entry_price = order['entry_price']
-            stop_loss = order.get('stop_loss')
-            take_profit = order.get('take_profit')
             
             # Проверяем условия исполнения (SL/TP)
-            should_execute = False
-            execution_type = ""
-            
-            if order['type'] == 'long':
-                if stop_loss and current_price <= stop_loss:
-                    should_execute = True
-                    execution_type = "STOP_LOSS"
-                    order['pnl'] = (stop_loss - entry_price) * order['amount']
-                elif take_profit and current_price >= take_profit:
-                    should_execute = True
-                    execution_type = "TAKE_PROFIT"
-                    order['pnl'] = (take_profit - entry_price) * order['amount']
-            elif order['type'] == 'short':
-                if stop_loss and current_price >= stop_loss:
-                    should_execute = True
-                    execution_type = "STOP_LOSS"
-                    order['pnl'] = (entry_price - stop_loss) * order['amount']
-                elif take_profit and current_price <= take_profit:
-                    should_execute = True
-                    execution_type = "TAKE_PROFIT"
-                    order['pnl'] = (entry_price - take_profit) * order['amount']
-            
-            if should_execute:
-                # Выполняем реальный обмен через DEX
-                pair = order['pair']
-                pair_pools = get_pair_pools(pair)
-                if pair_pools:
-                    targets = [take_profit, stop_loss]
-                    pool = pick_pool_by_targets(pair, targets) or pair_pools[0]
-                    wallet_credentials = get_order_wallet_credentials(order)
-                    
-                    if not wallet_credentials:
-                        order['status'] = 'execution_failed'
-                        order['execution_error'] = 'Кошелек для ордера не найден или не настроен'
-                        save_order(order)
-                        continue
-                    
-                    order['action'] = 'close'
-                    order_slippage = float(order.get('max_slippage', DEFAULT_SLIPPAGE))
-                    swap_result = execute_order_swap(
-                        order=order,
-                        pool=pool,
-                        wallet_credentials=wallet_credentials,
-                        slippage=order_slippage
-                    )
-                    
-                    if swap_result.get('success'):
-                        order['status'] = 'executed'
-                        order['executed_at'] = datetime.now().isoformat()
-                        order['execution_type'] = execution_type
-                        order['swap_result'] = swap_result # Сохраняем результат обмена
-                        
-                        if swap_result.get('transaction_sent'):
-                            order['transaction_hash'] = swap_result.get('transaction', {}).get('hash')
-                            print(f"[ОРДЕР] Исполнен и произведён обмен {order['id']} по цене {current_price} ({execution_type}), PnL: {order.get('pnl', 0)}")
-                            print(f"[ОРДЕР] Транзакция отправлена: {swap_result.get('message', '')}")
-                        else:
-                            print(f"[ОРДЕР] Исполнен {order['id']} по цене {current_price} ({execution_type}), PnL: {order.get('pnl', 0)}")
-                            print(f"[ОРДЕР] Обмен подготовлен, но НЕ отправлен: {swap_result.get('message', '')}")
-                            print(f"[ОРДЕР] 💡 Причина: {swap_result.get('message', 'Unknown')}")
-                            print(f"[ОРДЕР] Данные транзакции: {swap_result.get('transaction', {})}")
-                            print(f"[ОРДЕР] 💡 Для автоматической отправки убедитесь, что:")
-                            print(f" 1. Установлен pytoniq: pip install pytoniq")
-                            print(f" 2. Установлена переменная ORDER_WALLET_MNEMONIC в .env")
-                            print(f" 3. Мнемоника соответствует адресу кошелька ордеров")
-                    else:
-                        # Ошибка при выполнении обмена
-                        error_msg = swap_result.get('error', 'Unknown error')
-                        order['execution_error'] = error_msg
-                        if swap_result.get('transient'):
-                            print(f"[ОРДЕР] Временная ошибка исполнения для {order['id']}: {error_msg}. Повторим попытку позже.")
-                            save_order(order)
-                            continue
-                        print(f"[ОРДЕР] Ошибка исполнения для {order['id']}: {error_msg}")
-                        order['status'] = 'execution_failed'
-                else:
-                    # Пул не найден, просто отмечаем как executed
-                    print(f"[ОРДЕР] Пул {pair} не найден, отмечаем ордер исполненным без обмена")
-                    order['status'] = 'executed'
-                    order['executed_at'] = datetime.now().isoformat()
-                    order['execution_type'] = execution_type
-                
-                # execution_price уже установлен при открытии (entry_price)
-                save_order(order)
+            trigger = exit_condition(order, current_price)
+            if trigger:
+                execution_type, order['pnl'] = trigger
+                # Обмен выполняется через outbox в пуле исполнения: медленный своп не задерживает остальные ордера
+                dispatch_execution(order, 'close', {
+                    'execution_type': execution_type,
+                    'current_price': current_price,
+                    'pnl': order.get('pnl'),
+                    'latency': start_latency_trace(pair_prices)
+                })
             
     except Exception as e:
         print(f"[ПРОВЕРКА ОРДЕРА] Ошибка: {e}")
         traceback.print_exc()
 # Запускаем проверку ордеров в фоне
-def start_order_checker():
-    def checker_loop():
-        while True:
-            try:
-                check_orders_funding() # Проверить funding, после этого — исполнение
-                check_orders_execution() # Проверяем достижение entry_price и SL/TP
-                time.sleep(ORDER_CHECK_INTERVAL)
-            except Exception as e:
-                print(f"[ПРОВЕРКА ОРДЕРА] Ошибка: {e}")
-                time.sleep(max(ORDER_CHECK_INTERVAL * 2, 5))
+class LegacyOrderEvaluator(OrderEvaluator):
+    """Оценщик legacy long/short ордеров (entry → opened → SL/TP)"""
+    name = 'legacy'
+    
+    def evaluate(self, prices, full):
+        if full:
+            check_orders_execution(current_prices=prices)
+        else:
+            check_orders_execution(pairs=prices.keys(), current_prices=prices)
+def run_heartbeat_tasks():
+    """Периодические задачи полного прохода: очередь исполнения и пополнение ордеров"""
+    dispatch_due_outbox_jobs() # Брошенные и отложенные задачи исполнения
+    check_orders_funding() # Проверить funding, после этого — исполнение
+    try:
+        slippage_stats.persist_if_due()
+    except Exception as e:
+        print(f"[ПРОСКАЛЬЗЫВАНИЕ] Ошибка сохранения статистики: {e}")
+order_scheduler = OrderScheduler(
+    price_events,
+    price_watcher,
+    pairs_provider=checked_pairs,
+    heartbeat_interval=ORDER_HEARTBEAT_INTERVAL,
+    on_heartbeat=run_heartbeat_tasks,
+    tick_context=order_store.batch # Изменения ордеров за проход записываются одной транзакцией
+)
+order_scheduler.register(LegacyOrderEvaluator())
+def start_order_checker(shards: Optional[ShardLeaseManager] = None):
+    """
+    Запуск единого планировщика проверки ордеров.
+    PriceWatcher опрашивает цены пар каждые ORDER_CHECK_INTERVAL и публикует только изменившиеся пары;
+    проверка запускается сразу для затронутой пары. Полный проход (funding + все пары) — раз в ORDER_HEARTBEAT_INTERVAL.
+    Оценщики: legacy long/short и расширенные ордера OrderEngine (лимит/стоп/трейлинг/OCO).
     
-    checker_thread = threading.Thread(target=checker_loop)
-    checker_thread.daemon = True
-    checker_thread.start()
+    Args:
+        shards: Аренды шардов воркера — проверяются только пары и кошельки его шардов
+    """
+    global checker_shards
+    checker_shards = shards
+    if shards is not None:
+        # Задачи outbox одного кошелька забирают разные воркеры: локальный seqno секвенсора неверен
+        disable_wallet_sequencer("шардированный режим, отправки с кошелька идут из нескольких процессов")
+    try:
+        slippage_stats.load()
+    except Exception as e:
+        print(f"[ПРОСКАЛЬЗЫВАНИЕ] Ошибка загрузки статистики: {e}")
+    retry_scheduler.start()
+    from order_engine import get_order_engine
+    try:
+        get_order_engine() # Регистрирует OrderEngine в планировщике
+    except Exception as e:
+        # Планировщик проверяет остальные ордера; движок повторит старт при следующем обращении
+        print(f"[ENGINE] Не удалось запустить OrderEngine: {e}")
+    return order_scheduler.start()
 @app.route('/')
 def index():
     wallets = get_order_wallets()
@@ -1206,11 +1751,24 @@ def swap():
         return jsonify({'error': str(e)}), 500
 @app.route('/orders', methods=['GET'])
 def get_orders():
-    """Получить список ордеров пользователя"""
+    """
+    Получить список ордеров пользователя постранично.
+    Параметры: user_wallet, status (через запятую), pair, limit, cursor (next_cursor предыдущей страницы)
+    """
     try:
         user_wallet = request.args.get('user_wallet')
-        orders_data = load_orders(user_wallet)
+        statuses = [s for s in request.args.get('status', '').split(',') if s] or None
+        pair = request.args.get('pair')
+        orders_data = query_orders(
+            statuses=statuses,
+            pairs=[pair] if pair else None,
+            user_wallet=user_wallet,
+            limit=request.args.get('limit', ORDERS_PAGE_SIZE, type=int),
+            cursor=request.args.get('cursor')
+        )
         return jsonify(orders_data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 @app.route('/orders', methods=['POST'])
@@ -1338,11 +1896,11 @@ def create_order():
         if save_order(order):
             print(f"[АПИ] Ордер {order_id} успешно сохранён")
             # Проверяем, что ордер действительно сохранен
-            saved_orders = load_orders(order['user_wallet'])
-            print(f"[АПИ] После сохранения у пользователя {len(saved_orders.get('orders', []))} ордеров")
+            if load_order(order_id) is None:
+                print(f"[АПИ] ⚠️ Ордер {order_id} не найден после сохранения")
             if order['status'] == 'waiting_entry':
                 try:
-                    check_orders_execution()
+                    check_orders_execution(pairs=[order['pair']])
                 except Exception as e:
                     print(f"[АПИ] Не удалось выполнить моментальную проверку ордеров: {e}")
             response_data = {
@@ -1375,11 +1933,13 @@ def create_order():
         return jsonify({'error': str(e)}), 500
 @app.route('/user-orders', methods=['GET'])
 def get_user_orders():
-    """Получить все ордера пользователя"""
+    """Получить ордера пользователя постранично (limit, cursor — next_cursor предыдущей страницы)"""
     try:
         user_wallet_raw = request.args.get('user_wallet')
         if not user_wallet_raw:
             return jsonify({'error': 'user_wallet parameter is required'}), 400
+        limit = request.args.get('limit', ORDERS_PAGE_SIZE, type=int)
+        cursor = request.args.get('cursor')
         
         # Нормализуем адрес для поиска
         try:
@@ -1388,18 +1948,20 @@ def get_user_orders():
             user_wallet = user_wallet_raw # Если не удалось нормализовать, используем как есть
         
         print(f"[АПИ] Загрузка ордеров для кошелька: {user_wallet} (исходный: {user_wallet_raw})")
-        orders_data = load_orders(user_wallet)
+        orders_data = query_orders(user_wallet=user_wallet, limit=limit, cursor=cursor)
         print(f"[АПИ] Найдено {len(orders_data.get('orders', []))} ордеров")
         
         # Если не нашли ордера с нормализованным адресом, попробуем с оригинальным
         if len(orders_data.get('orders', [])) == 0 and user_wallet != user_wallet_raw:
             print(f"[АПИ] Пробуем с исходным адресом: {user_wallet_raw}")
-            orders_data_alt = load_orders(user_wallet_raw)
+            orders_data_alt = query_orders(user_wallet=user_wallet_raw, limit=limit, cursor=cursor)
             if len(orders_data_alt.get('orders', [])) > 0:
                 orders_data = orders_data_alt
                 print(f"[АПИ] Найдено {len(orders_data.get('orders', []))} ордеров с исходным адресом")
         
         return jsonify(orders_data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"[АПИ] Ошибка при загрузке ордеров пользователя: {e}")
         traceback.print_exc()
@@ -1408,14 +1970,17 @@ def get_user_orders():
 def cancel_order(order_id):
     """Отменить ордер"""
     try:
-        orders_data = load_orders()
-        
-        for order in orders_data['orders']:
-            if order['id'] == order_id and order['status'] in ('unfunded', 'waiting_entry', 'opened', 'active'):
-                order['status'] = 'cancelled'
-                order['cancelled_at'] = datetime.now().isoformat()
-                save_order(order)
-                return jsonify({'success': True, 'message': 'Ордер отменен'})
+        order = load_order(order_id)
+        if order and order['status'] in ('unfunded', 'waiting_entry', 'opened', 'active'):
+            with get_db_connection() as conn:
+                with conn.cursor() as cur:
+                    won = transition_order(cur, order, 'cancelled', cancelled_at=datetime.now().isoformat())
+                    conn.commit()
+            if not won:
+                return jsonify({'error': 'Ордер изменился во время отмены, повторите запрос'}), 409
+            from order_engine import notify_order_cancelled
+            notify_order_cancelled(order_id)
+            return jsonify({'success': True, 'message': 'Ордер отменен'})
         
         return jsonify({'error': 'Ордер не найден или уже исполнен/отменен'}), 404
         
@@ -1426,28 +1991,28 @@ def update_order(order_id):
     """Редактировать активный или unfunded ордер: stop_loss, take_profit, amount"""
     data = request.json
     try:
-        orders_data = load_orders()
-        for order in orders_data['orders']:
-            if order['id'] == order_id and order['status'] in ('unfunded', 'waiting_entry', 'opened', 'active'):
-                # Разрешаем менять SL/TP/amount только если не исполнен/не отменён
-                if 'stop_loss' in data:
-                    order['stop_loss'] = float(data['stop_loss']) if data['stop_loss'] is not None else None
-                if 'take_profit' in data:
-                    order['take_profit'] = float(data['take_profit']) if data['take_profit'] is not None else None
-                if 'amount' in data:
-                    # Если amount увеличивается — требует доп. funding! Можно усложнить логику при необходимости
-                    new_amount = float(data['amount'])
-                    if new_amount <= 0:
-                        return jsonify({'error': 'Сумма должна быть положительной'}), 400
-                    order['amount'] = new_amount
-                    # Если ордер был opened, при изменении суммы нужно вернуть в waiting_entry
-                    if order['status'] == 'opened':
-                        order['status'] = 'waiting_entry'
-                        order['opened_at'] = None
-                    elif order['status'] in ('waiting_entry', 'active'):
-                        order['status'] = 'unfunded' # нужно будет заново пополнить
-                save_order(order)
-                return jsonify({'success': True, 'order': order, 'message': 'Ордер успешно обновлён'})
+        order = load_order(order_id)
+        if order and order['status'] in ('unfunded', 'waiting_entry', 'opened', 'active'):
+            # Разрешаем менять SL/TP/amount только если не исполнен/не отменён
+            if 'stop_loss' in data:
+                order['stop_loss'] = float(data['stop_loss']) if data['stop_loss'] is not None else None
+            if 'take_profit' in data:
+                order['take_profit'] = float(data['take_profit']) if data['take_profit'] is not None else None
+            if 'amount' in data:
+                # Если amount увеличивается — требует доп. funding! Можно усложнить логику при необходимости
+                new_amount = float(data['amount'])
+                if new_amount <= 0:
+                    return jsonify({'error': 'Сумма должна быть положительной'}), 400
+                order['amount'] = new_amount
+                # Если ордер был opened, при изменении суммы нужно вернуть в waiting_entry
+                if order['status'] == 'opened':
+                    order['status'] = 'waiting_entry'
+                    order['opened_at'] = None
+                elif order['status'] in ('waiting_entry', 'active'):
+                    order['status'] = 'unfunded' # нужно будет заново пополнить
+            if not save_order(order):
+                return jsonify({'error': 'Ордер изменился во время редактирования, повторите запрос'}), 409
+            return jsonify({'success': True, 'order': order, 'message': 'Ордер успешно обновлён'})
         return jsonify({'error': 'Ордер не найден или недоступен для редактирования'}), 404
     except Exception as e:
         print(f"[ОРДЕР ОБНОВЛЕНИЕ] Ошибка: {e}")
@@ -1528,6 +2093,7 @@ def api_create_order_wallet():
                 conn.commit()
                 if row:
                     wallet = dict(row)
+                    wallet_key_cache.invalidate(wallet_id=wallet['id'], address=wallet['address'])
                     wallet['label'] = wallet.get('label') or f"Wallet #{wallet['id']}"
                     if isinstance(wallet.get('created_at'), datetime):
                         wallet['created_at'] = wallet['created_at'].isoformat()
@@ -1570,6 +2136,7 @@ def api_wallet_add_mnemonic(wallet_id: int):
                     WHERE id = %s
                 """, (encrypted, wallet_id))
                 conn.commit()
+        wallet_key_cache.invalidate(wallet_id=wallet_id, address=wallet['address'])
         return jsonify({'success': True})
     except Exception as e:
         print(f"[КОШЕЛЬКИ] Ошибка добавления мнемоники: {e}")
@@ -1589,6 +2156,7 @@ def api_delete_order_wallet(wallet_id: int):
                     return jsonify({'error': f'Невозможно удалить: кошелек используется в {count} ордерах'}), 400
                 cur.execute("DELETE FROM order_wallets WHERE id = %s", (wallet_id,))
                 conn.commit()
+        wallet_key_cache.invalidate(wallet_id=wallet_id, address=wallet['address'])
         return jsonify({'success': True})
     except Exception as e:
         print(f"[КОШЕЛЬКИ] Ошибка удаления кошелька: {e}")
@@ -1675,12 +2243,9 @@ def deposit_order():
     order_id = data.get('order_id')
     
     try:
-        orders_data = load_orders()
-        order = None
-        for o in orders_data['orders']:
-            if o['id'] == order_id and o['status'] == 'unfunded':
-                order = o
-                break
+        order = load_order(order_id)
+        if order and order['status'] != 'unfunded':
+            order = None
         
         if not order:
             return jsonify({'error': 'Ордер не найден или уже пополнен'}), 404
@@ -1922,9 +2487,8 @@ def create_advanced_order():
             'trailing_distance': data.get('trailing_distance'),
             'oco_group_id': data.get('oco_group_id'),
             'oco_related_ids': data.get('oco_related_ids', []),
+            'order_wallet_id': wallet_id,
         })
-        if wallet_id:
-            order.order_wallet_id = wallet_id
         
         # Рассчитываем газ и комиссию для ордера
         gas_info = {}
@@ -2027,29 +2591,21 @@ def create_oco_order():
 def set_trailing_stop(order_id):
     """Установить трейлинг-стоп для существующего ордера"""
     try:
+        from decimal import Decimal
         from order_engine import get_order_engine
-        from order_system import TrailingConfig, TrailingType
+        from order_system import TrailingType
         
         data = request.json
         engine = get_order_engine()
         
-        # Находим ордер
-        if order_id not in engine.processor.orders:
-            return jsonify({'error': 'Order not found'}), 404
-        
-        order = engine.processor.orders[order_id]
-        
         # Создаем конфиг трейлинга
         trailing_type = TrailingType[data.get('trailing_type', 'FIXED').upper()]
-        trailing_distance = float(data.get('trailing_distance', 0))
-        
-        order.trailing = TrailingConfig(
-            type=trailing_type,
-            distance=trailing_distance
-        )
+        trailing_distance = Decimal(str(data.get('trailing_distance', 0)))
         
-        # Сохраняем
-        engine.save_order_to_db(order)
+        # Изменение и сохранение — командой актора движка
+        order = engine.set_trailing(order_id, trailing_type, trailing_distance)
+        if order is None:
+            return jsonify({'error': 'Order not found'}), 404
         
         return jsonify({
             'success': True,
@@ -2065,10 +2621,14 @@ def set_trailing_stop(order_id):
 def get_slippage_stats():
     """Получить статистику проскальзывания"""
     try:
-        from order_engine import get_order_engine
-        
-        engine = get_order_engine()
-        stats = engine.get_slippage_stats()
+        if ORDER_CHECKER_MODE == 'embedded':
+            from order_engine import get_order_engine
+            
+            engine = get_order_engine()
+            stats = engine.get_slippage_stats()
+        else:
+            # Проверку ведут воркеры: сводка по их сохраненным агрегатам
+            stats = SlippageStats.read_merged(get_db_connection)
         
         return jsonify({
             'success': True,
@@ -2078,6 +2638,61 @@ def get_slippage_stats():
         print(f"[АПИ] Ошибка получения статистики проскальзывания: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/orders/execution-metrics', methods=['GET'])
+def get_execution_metrics():
+    """Метрики пула исполнения (глубина очередей, задержки этапов), планировщика проверки, очереди логов, кэша и очередей отправки кошельков"""
+    return jsonify({
+        'success': True,
+        'metrics': execution_pool.get_metrics(),
+        'scheduler': order_scheduler.get_metrics(),
+        'logging': get_logging_metrics(),
+        'wallet_cache': wallet_key_cache.get_metrics(),
+        'wallet_sequencers': get_sequencer_metrics()
+    })
+@app.route('/api/orders/execution-latency', methods=['GET'])
+def get_execution_latency():
+    """
+    Гистограммы задержек этапов исполнения (получение цены → проверка → ... → отправка) по DEX и парам.
+    ?source=db — по трассам execution_outbox всех воркеров за ?hours (по умолчанию 24), иначе — этого процесса
+    """
+    try:
+        if request.args.get('source') == 'db' or ORDER_CHECKER_MODE != 'embedded':
+            stats = LatencyStats()
+            for data in execution_outbox.recent_latency(float(request.args.get('hours', 24))):
+                stats.observe(LatencyTrace.from_dict(data))
+            latency = stats.snapshot()
+        else:
+            latency = latency_stats.snapshot()
+        return jsonify({'success': True, 'latency': latency})
+    except Exception as e:
+        print(f"[АПИ] Ошибка получения задержек исполнения: {e}")
+        return jsonify({'error': str(e)}), 500
+
+def get_order_execution_attempts(order_id: str) -> List[dict]:
+    """История попыток исполнения ордера из outbox"""
+    try:
+        jobs = execution_outbox.get_order_jobs(order_id)
+    except Exception as e:
+        print(f"[АПИ] Ошибка получения попыток исполнения {order_id}: {e}")
+        return []
+    retry_in = retry_scheduler.pending().get(order_id)
+    attempts = []
+    for job in jobs:
+        attempt = {
+            'attempt': job['attempt'],
+            'action': job['action'],
+            'state': job['state'],
+            'error': job.get('error'),
+            'retry_reason': (job.get('payload') or {}).get('retry_reason'),
+            'available_at': job['available_at'].isoformat() if job.get('available_at') else None,
+            'created_at': job['created_at'].isoformat() if job.get('created_at') else None,
+            'updated_at': job['updated_at'].isoformat() if job.get('updated_at') else None,
+        }
+        if job['state'] == 'pending' and retry_in is not None:
+            attempt['next_attempt_in'] = retry_in
+        attempts.append(attempt)
+    return attempts
+
 @app.route('/api/orders/<order_id>', methods=['GET'])
 def get_order_details(order_id):
     """Получить детали ордера"""
@@ -2086,24 +2701,22 @@ def get_order_details(order_id):
         
         engine = get_order_engine()
         
-        if order_id not in engine.processor.orders:
+        order = engine.get_order(order_id) # Из снимка движка
+        if order is None:
             # Пытаемся загрузить из БД
-            orders_data = load_orders()
-            order_dict = next((o for o in orders_data.get('orders', []) if o['id'] == order_id), None)
+            order_dict = load_order(order_id)
             if order_dict:
                 from order_engine import OrderEngine
-                order = OrderEngine._convert_legacy_order(order_dict)
-                if order:
-                    return jsonify({
-                        'success': True,
-                        'order': order.to_dict()
-                    })
-            return jsonify({'error': 'Order not found'}), 404
+                legacy_order = OrderEngine._convert_legacy_order(order_dict)
+                if legacy_order:
+                    order = legacy_order.to_dict()
+            if order is None:
+                return jsonify({'error': 'Order not found'}), 404
         
-        order = engine.processor.orders[order_id]
         return jsonify({
             'success': True,
-            'order': order.to_dict()
+            'order': order,
+            'execution_attempts': get_order_execution_attempts(order_id)
         })
     except Exception as e:
         print(f"[АПИ] Ошибка получения деталей ордера: {e}")
@@ -2113,7 +2726,7 @@ init_db()
 pools = load_pools()
 _default_wallet = get_default_order_wallet()
 order_wallet_address = _default_wallet['address'] if _default_wallet else None
-order_checker_thread = start_order_checker()
+order_checker_thread = None # Планировщик запускается процессом-владельцем (python app.py, run_system.py, checker_worker.py), не при импорте
 if __name__ == '__main__':
     print("[ЗАПУСК] Тестируем TON-USDT котировку...")
     primary_pool = get_primary_pool('TON-USDT')
@@ -2129,4 +2742,6 @@ if __name__ == '__main__':
     else:
         print("[ЗАПУСК] ⚠️ Кошельки для ордеров не найдены")
     
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    if ORDER_CHECKER_MODE == 'embedded':
+        order_checker_thread = start_order_checker()
+    app.run(debug=True, port=5000, use_reloader=False) # Перезагрузчик запустил бы второй планировщик
\ No newline at end of file
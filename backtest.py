@@ -0,0 +1,314 @@
+"""
+Воспроизведение исторических цен через логику срабатывания ордеров (бэктест).
+Цены — из pool_snapshots (тики), pool_aggregated (часовые бары, раскладываются в путь bar_path)
+или CSV; часы симулированные (время берется из данных), исполнение — по модели FillModel.
+Legacy long/short ордера проверяются теми же order_evaluators, что и живая проверка в app.py,
+расширенные — OrderProcessor.process_tick. Без обращений к RPC и без sleep: скорость
+ограничена только CPU.
+
+    python backtest.py --orders orders.json --source snapshots --pair TON-USDT --since 2026-01-01
+    python backtest.py --orders orders.json --source csv --file prices.csv
+"""
+import argparse
+import csv
+import json
+import os
+import time
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from order_evaluators import entry_condition, exit_condition, side_price
+from order_system import Order, OrderProcessor, OrderStatus, bar_path
+
+PG_CONN = os.environ.get("PG_CONN", "dbname=lpm user=postgres password=762341 host=localhost port=5432")
+BACKTEST_FETCH_SIZE = int(os.environ.get("BACKTEST_FETCH_SIZE", "10000"))
+# Комиссия сервиса и пула (как в расчете свопа) и проскальзывание исполнения, в долях
+BACKTEST_FEE_RATE = float(os.environ.get("BACKTEST_FEE_RATE", "0.0055"))
+BACKTEST_SLIPPAGE = float(os.environ.get("BACKTEST_SLIPPAGE", "0.0"))
+DEFAULT_SLIPPAGE = 1.0  # Допуск входа, %, если в ордере нет max_slippage (как app.DEFAULT_SLIPPAGE)
+
+# Тик воспроизведения: (время, пара, адрес пула, цена)
+Tick = Tuple[datetime, str, str, float]
+
+
+class FillModel:
+    """Исполнение по цене тика, сдвинутой против трейдера на slippage, с комиссией от объема"""
+
+    def __init__(self, fee_rate: float = BACKTEST_FEE_RATE, slippage: float = BACKTEST_SLIPPAGE):
+        self.fee_rate = fee_rate
+        self.slippage = slippage
+
+    def fill_price(self, price: float, buy: bool) -> float:
+        return price * (1 + self.slippage) if buy else price * (1 - self.slippage)
+
+    def fee(self, price: float, amount: float) -> float:
+        return price * amount * self.fee_rate
+
+
+def iter_snapshot_ticks(pairs: Optional[Sequence[str]] = None, since: Optional[datetime] = None,
+                        until: Optional[datetime] = None, conn_string: str = PG_CONN) -> Iterator[Tick]:
+    """Тики из pool_snapshots по времени (серверный курсор)"""
+    import psycopg2
+    conditions, params = [], []
+    if pairs:
+        conditions.append("pool_name = ANY(%s)")
+        params.append(list(pairs))
+    if since:
+        conditions.append("created_at >= %s")
+        params.append(since)
+    if until:
+        conditions.append("created_at < %s")
+        params.append(until)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    conn = psycopg2.connect(conn_string)
+    try:
+        with conn.cursor(name="backtest_snapshots") as cur:
+            cur.itersize = BACKTEST_FETCH_SIZE
+            cur.execute(f"""
+                SELECT created_at, pool_name, pool_address, price
+                FROM pool_snapshots {where}
+                ORDER BY created_at, id
+            """, params)
+            for created_at, pool_name, pool_address, price in cur:
+                yield created_at, pool_name, pool_address, float(price)
+    finally:
+        conn.close()
+
+
+def iter_bar_ticks(pairs: Optional[Sequence[str]] = None, since: Optional[datetime] = None,
+                   until: Optional[datetime] = None, conn_string: str = PG_CONN) -> Iterator[Tick]:
+    """Часовые бары pool_aggregated, разложенные в путь O-L-H-C / O-H-L-C"""
+    import psycopg2
+    conditions, params = [], []
+    if pairs:
+        conditions.append("pool_name = ANY(%s)")
+        params.append(list(pairs))
+    if since:
+        conditions.append("date_hour >= %s")
+        params.append(since)
+    if until:
+        conditions.append("date_hour < %s")
+        params.append(until)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    conn = psycopg2.connect(conn_string)
+    try:
+        with conn.cursor(name="backtest_bars") as cur:
+            cur.itersize = BACKTEST_FETCH_SIZE
+            cur.execute(f"""
+                SELECT date_hour, pool_name, open_price, high_price, low_price, close_price
+                FROM pool_aggregated {where}
+                ORDER BY date_hour, pool_name
+            """, params)
+            for date_hour, pool_name, open_price, high, low, close in cur:
+                for price in bar_path(open_price, high, low, close):
+                    yield date_hour, pool_name, pool_name, float(price)
+    finally:
+        conn.close()
+
+
+def iter_csv_ticks(path: str) -> Iterator[Tick]:
+    """
+    CSV с заголовком: ts,pair,price[,pool] или ts,pair,open,high,low,close (бары).
+    ts — ISO-время или unix-время; строки должны идти по времени
+    """
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            ts = row['ts']
+            ts = datetime.fromtimestamp(float(ts)) if ts.replace('.', '', 1).isdigit() else datetime.fromisoformat(ts)
+            pair = row['pair']
+            if row.get('price'):
+                yield ts, pair, row.get('pool') or pair, float(row['price'])
+            else:
+                for price in bar_path(*(Decimal(row[key]) for key in ('open', 'high', 'low', 'close'))):
+                    yield ts, pair, pair, float(price)
+
+
+def load_orders_file(path: str) -> Tuple[List[Dict], List[Order]]:
+    """Ордера из JSON: legacy long/short (type 'long'/'short') и расширенные (формат Order.to_dict)"""
+    with open(path) as f:
+        data = json.load(f)
+    items = data.get('orders', []) if isinstance(data, dict) else data
+    legacy = [item for item in items if item.get('type') in ('long', 'short')]
+    advanced = [Order.from_dict(item) for item in items if item.get('type') not in ('long', 'short')]
+    return legacy, advanced
+
+
+class Backtest:
+    """
+    Args:
+        legacy_orders: Ордера формата таблицы orders (status waiting_entry/opened)
+        advanced_orders: Ордера order_system (ACTIVE)
+        fill_model: Модель исполнения
+    """
+
+    def __init__(self, legacy_orders: Iterable[Dict] = (), advanced_orders: Iterable[Order] = (),
+                 fill_model: Optional[FillModel] = None):
+        self.fill_model = fill_model or FillModel()
+        self.waiting: Dict[str, List[Dict]] = defaultdict(list)
+        self.opened: Dict[str, List[Dict]] = defaultdict(list)
+        for order in legacy_orders:
+            order = dict(order)
+            for key in ('entry_price', 'stop_loss', 'take_profit', 'amount', 'price_at_creation'):
+                if order.get(key) is not None:
+                    order[key] = float(order[key])
+            if order.get('status') == 'opened':
+                order.setdefault('fill_price', order['entry_price'])
+                self.opened[order['pair']].append(order)
+            else:
+                self.waiting[order['pair']].append(order)
+        self._last_price: Dict[str, float] = {}
+        self.processor = OrderProcessor(lambda symbol: Decimal(str(self._last_price.get(symbol, 0))))
+        self.advanced_live: Dict[str, int] = defaultdict(int)
+        for order in advanced_orders:
+            self.processor.add_order(order)
+            self.advanced_live[order.symbol] += 1
+        self.pool_prices: Dict[str, Dict[str, float]] = defaultdict(dict)  # pair -> {pool: цена}
+        self.fills: List[Dict] = []
+        self.ticks = 0
+        self.evaluations = 0
+        self.elapsed = 0.0
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+
+    def run(self, ticks: Iterable[Tick]) -> Dict:
+        started = time.perf_counter()
+        for ts, pair, pool, price in ticks:
+            self.on_tick(ts, pair, pool, price)
+        self.elapsed += time.perf_counter() - started
+        return self.report()
+
+    def on_tick(self, ts: datetime, pair: str, pool: str, price: float):
+        if price <= 0:
+            return
+        self.ticks += 1
+        self.started_at = self.started_at or ts
+        self.finished_at = ts
+        # Снимок пары как в живой проверке: LONG — минимальная цена по пулам, SHORT — максимальная
+        prices = self.pool_prices[pair]
+        prices[pool] = price
+        snapshot = {'long': min(prices.values()), 'short': max(prices.values())}
+        self._last_price[pair] = price
+        self._check_legacy(ts, pair, snapshot)
+        if self.advanced_live.get(pair):
+            self._check_advanced(ts, pair, price)
+
+    def _check_legacy(self, ts: datetime, pair: str, snapshot: Dict):
+        waiting = self.waiting.get(pair)
+        if waiting:
+            self.evaluations += len(waiting)
+            still_waiting = []
+            for order in waiting:
+                current_price = side_price(order, snapshot)
+                price_at_creation = order.get('price_at_creation') or current_price
+                order['price_at_creation'] = price_at_creation
+                entry_reached, _, _ = entry_condition(order, current_price, price_at_creation,
+                                                      float(order.get('max_slippage') or DEFAULT_SLIPPAGE))
+                if not entry_reached:
+                    still_waiting.append(order)
+                    continue
+                buy = order['type'] == 'long'
+                order['fill_price'] = self.fill_model.fill_price(current_price, buy)
+                order['opened_at'] = ts
+                self.opened[pair].append(order)
+                self._record(order, 'open', ts, order['fill_price'])
+            self.waiting[pair] = still_waiting
+        opened = self.opened.get(pair)
+        if opened:
+            self.evaluations += len(opened)
+            still_opened = []
+            for order in opened:
+                current_price = side_price(order, snapshot)
+                trigger = exit_condition(order, current_price)
+                if not trigger:
+                    still_opened.append(order)
+                    continue
+                execution_type, level_pnl = trigger
+                exit_price = self.fill_model.fill_price(current_price, order['type'] == 'short')
+                amount = order['amount']
+                direction = 1 if order['type'] == 'long' else -1
+                pnl = direction * (exit_price - order['fill_price']) * amount
+                pnl -= self.fill_model.fee(order['fill_price'], amount) + self.fill_model.fee(exit_price, amount)
+                self._record(order, execution_type, ts, exit_price, pnl=pnl, level_pnl=level_pnl)
+            self.opened[pair] = still_opened
+
+    def _check_advanced(self, ts: datetime, pair: str, price: float):
+        self.evaluations += self.advanced_live[pair]
+        executed = self.processor.process_tick(pair, Decimal(str(price)), ts)
+        cancelled = self.processor.reap_oco()
+        for order in executed:
+            execution_price = float(order.execution_price or price)
+            pnl = float(order.pnl or 0) - self.fill_model.fee(execution_price, float(order.quantity))
+            self._record_advanced(order, order.execution_type or order.type.value, ts, execution_price, pnl)
+        for order in cancelled:
+            self._record_advanced(order, 'OCO_CANCELLED', ts, None, 0.0)
+        for order in executed + cancelled:
+            self.processor.remove_order(order.id)
+            self.advanced_live[order.symbol] -= 1
+
+    def _record(self, order: Dict, kind: str, ts: datetime, price: float, pnl: Optional[float] = None, **extra):
+        self.fills.append(dict(extra, order_id=order.get('id'), pair=order['pair'], kind=kind,
+                               ts=ts, price=price, pnl=pnl))
+
+    def _record_advanced(self, order: Order, kind: str, ts: datetime, price: Optional[float], pnl: float):
+        self.fills.append({'order_id': order.id, 'pair': order.symbol, 'kind': kind, 'ts': ts, 'price': price, 'pnl': pnl})
+
+    def report(self) -> Dict:
+        closed = [fill for fill in self.fills if fill['pnl'] is not None and fill['kind'] != 'OCO_CANCELLED']
+        by_kind: Dict[str, int] = defaultdict(int)
+        for fill in self.fills:
+            by_kind[fill['kind']] += 1
+        elapsed = self.elapsed or 1e-9
+        return {
+            'ticks': self.ticks,
+            'orders_evaluated': self.evaluations,
+            'elapsed_sec': self.elapsed,
+            'ticks_per_sec': self.ticks / elapsed,
+            'orders_evaluated_per_sec': self.evaluations / elapsed,
+            'period': [self.started_at, self.finished_at],
+            'fills': len(self.fills),
+            'fills_by_kind': dict(by_kind),
+            'closed_trades': len(closed),
+            'total_pnl': sum(fill['pnl'] for fill in closed),
+            'wins': sum(1 for fill in closed if fill['pnl'] > 0),
+            'losses': sum(1 for fill in closed if fill['pnl'] <= 0),
+            'still_waiting': sum(len(orders) for orders in self.waiting.values()),
+            'still_opened': sum(len(orders) for orders in self.opened.values()),
+            'advanced_active': sum(1 for order in self.processor.orders.values() if order.status == OrderStatus.ACTIVE),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бэктест логики срабатывания ордеров на исторических ценах")
+    parser.add_argument('--orders', required=True, help="JSON с ордерами (список или {'orders': [...]})")
+    parser.add_argument('--source', choices=('snapshots', 'aggregated', 'csv'), default='snapshots')
+    parser.add_argument('--file', help="CSV с ценами для --source csv")
+    parser.add_argument('--pair', action='append', help="Пара (можно несколько раз)")
+    parser.add_argument('--since', type=datetime.fromisoformat)
+    parser.add_argument('--until', type=datetime.fromisoformat)
+    parser.add_argument('--fee-rate', type=float, default=BACKTEST_FEE_RATE)
+    parser.add_argument('--slippage', type=float, default=BACKTEST_SLIPPAGE)
+    parser.add_argument('--fills', action='store_true', help="Вывести все исполнения")
+    args = parser.parse_args()
+
+    if args.source == 'csv':
+        if not args.file:
+            parser.error("--source csv требует --file")
+        ticks = iter_csv_ticks(args.file)
+    elif args.source == 'aggregated':
+        ticks = iter_bar_ticks(args.pair, args.since, args.until)
+    else:
+        ticks = iter_snapshot_ticks(args.pair, args.since, args.until)
+
+    legacy, advanced = load_orders_file(args.orders)
+    backtest = Backtest(legacy, advanced, FillModel(args.fee_rate, args.slippage))
+    report = backtest.run(ticks)
+    print(f"[БЭКТЕСТ] {json.dumps(report, default=str, ensure_ascii=False, indent=2)}")
+    if args.fills:
+        for fill in backtest.fills:
+            print(f"[БЭКТЕСТ] {json.dumps(fill, default=str, ensure_ascii=False)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Бенчмарк памяти и пропускной способности на 100k ордеров: список Order (dataclass, Decimal),
+проверка тика сравнением Decimal против целых ключей price_key (нано-единицы, как в очередях
+триггеров OrderProcessor) и полный тик OrderProcessor.
+
+    python benchmark_orders.py [количество_ордеров]
+"""
+import random
+import sys
+import time
+import tracemalloc
+from decimal import Decimal
+
+from order_system import Order, OrderProcessor, OrderStatus, OrderType, PositionSide, price_key
+
+SYMBOLS = ['TON-USDT', 'NOT-TON', 'DOGS-TON', 'USDT-TON']
+
+
+def make_orders(count: int):
+    rng = random.Random(42)
+    orders = []
+    for i in range(count):
+        order_type = rng.choice((OrderType.LIMIT, OrderType.STOP_LOSS, OrderType.TAKE_PROFIT))
+        level = Decimal(rng.randint(1_000_000, 9_000_000)).scaleb(-6)
+        orders.append(Order(
+            id=f"order_{i}",
+            symbol=rng.choice(SYMBOLS),
+            quantity=Decimal(rng.randint(1, 10_000)).scaleb(-2),
+            type=order_type,
+            side=rng.choice((PositionSide.LONG, PositionSide.SHORT)),
+            status=OrderStatus.ACTIVE,
+            limit_price=level if order_type == OrderType.LIMIT else None,
+            stop_price=level if order_type != OrderType.LIMIT else None,
+            user_wallet=f"EQ_user_{i % 5000}",
+            order_wallet=f"EQ_order_{i % 5000}",
+        ))
+    return orders
+
+
+def measure(label: str, build):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - started
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<40} {current / 1024 / 1024:8.1f} MB  {elapsed:7.2f} s")
+    return result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    print(f"[БЕНЧМАРК] {count} ордеров")
+
+    source = make_orders(count)
+    # Память: независимые копии, чтобы не учитывать общие объекты исходного списка
+    records = [order.to_dict() for order in source]
+    measure("list[Order] (Decimal, dataclass)", lambda: [Order.from_dict(r) for r in records])
+    processor = measure("OrderProcessor (индексы и очереди)", lambda: _fill(OrderProcessor(lambda symbol: None), records))
+
+    price = Decimal('5.0')
+    symbol = SYMBOLS[0]
+    ticks = 20
+
+    # Обе проверки — по заранее отобранным активным ордерам символа
+    symbol_orders = [o for o in source if o.symbol == symbol and o.status == OrderStatus.ACTIVE]
+    keyed = [(price_key(o.stop_price), o.id) for o in symbol_orders if o.stop_price is not None]
+
+    started = time.perf_counter()
+    for _ in range(ticks):
+        hits = [o.id for o in symbol_orders if o.stop_price is not None and price >= o.stop_price]
+    decimal_rate = ticks * len(symbol_orders) / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for _ in range(ticks):
+        key = price_key(price)  # Цена тика масштабируется один раз
+        int_hits = [order_id for level, order_id in keyed if key >= level]
+    int_rate = ticks * len(symbol_orders) / (time.perf_counter() - started)
+    assert sorted(hits) == sorted(int_hits)
+
+    print(f"{'Проверка тика, Decimal':<40} {decimal_rate / 1e6:8.2f} M ордеров/с")
+    print(f"{'Проверка тика, price_key (int)':<40} {int_rate / 1e6:8.2f} M ордеров/с")
+
+    started = time.perf_counter()
+    executed = processor.process_tick(symbol, price)
+    print(f"{'Тик OrderProcessor':<40} {(time.perf_counter() - started) * 1000:8.1f} ms  ({len(executed)} исполнено)")
+
+
+def _fill(processor: OrderProcessor, records):
+    for record in records:
+        processor.add_order(Order.from_dict(record))
+    return processor
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Шардирование проверки ордеров между процессами-воркерами.
+Пространство ключей (пары для проверки исполнения, адреса кошельков для пополнения) делится на
+CHECKER_SHARDS шардов по crc32 ключа. Шарды раздаются воркерам через таблицу аренд checker_shards:
+каждый воркер держит примерно равную долю (ceil(шарды / живые воркеры)), продлевает аренду,
+отдает лишнее при появлении нового воркера и подбирает шарды с истекшей арендой ушедших.
+"""
+import math
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+import zlib
+from typing import Callable, FrozenSet, Optional
+
+CHECKER_SHARDS = int(os.environ.get("CHECKER_SHARDS", "16"))
+CHECKER_LEASE_SECONDS = int(os.environ.get("CHECKER_LEASE_SECONDS", "30"))
+
+
+def shard_of(key: str, shard_count: int = CHECKER_SHARDS) -> int:
+    """Номер шарда ключа (стабилен между процессами, в отличие от hash())"""
+    return zlib.crc32(str(key).encode()) % shard_count
+
+
+class ShardLeaseManager:
+    """
+    Args:
+        connection_factory: Контекстный менеджер подключения к БД (app.get_db_connection)
+        shard_count: Число шардов (одинаковое у всех воркеров)
+        worker_id: Идентификатор воркера
+        lease_seconds: Длительность аренды шарда; продление — каждые lease_seconds / 3
+    """
+
+    def __init__(self, connection_factory: Callable, shard_count: int = CHECKER_SHARDS,
+                 worker_id: Optional[str] = None, lease_seconds: int = CHECKER_LEASE_SECONDS):
+        self.connection_factory = connection_factory
+        self.shard_count = shard_count
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lease_seconds = lease_seconds
+        self.running = False
+        self._owned: FrozenSet[int] = frozenset()
+        self._valid_until = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def init_table(cur, shard_count: int = CHECKER_SHARDS):
+        """Создание таблиц аренд шардов и живых воркеров (вызывается из init_db)"""
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS checker_shards (
+                shard_id INTEGER PRIMARY KEY,
+                owner VARCHAR(120),
+                lease_expires_at TIMESTAMP,
+                updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+            )
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS checker_workers (
+                worker_id VARCHAR(120) PRIMARY KEY,
+                started_at TIMESTAMP NOT NULL DEFAULT NOW(),
+                last_seen TIMESTAMP NOT NULL DEFAULT NOW()
+            )
+        """)
+        cur.execute("""
+            INSERT INTO checker_shards (shard_id)
+            SELECT generate_series(0, %s - 1)
+            ON CONFLICT (shard_id) DO NOTHING
+        """, (shard_count,))
+
+    def owned(self) -> FrozenSet[int]:
+        """Шарды воркера; если аренду не удалось продлить до истечения — пусто"""
+        with self._lock:
+            if time.monotonic() > self._valid_until:
+                return frozenset()
+            return self._owned
+
+    def owns(self, key: str) -> bool:
+        return shard_of(key, self.shard_count) in self.owned()
+
+    def rebalance(self) -> FrozenSet[int]:
+        """
+        Отметка воркера, продление своих аренд и выравнивание доли:
+        лишние шарды отдаются, недостающие забираются из свободных/истекших
+        """
+        started = time.monotonic()
+        with self.connection_factory() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO checker_workers (worker_id) VALUES (%s)
+                    ON CONFLICT (worker_id) DO UPDATE SET last_seen = NOW()
+                """, (self.worker_id,))
+                cur.execute(
+                    "DELETE FROM checker_workers WHERE last_seen < NOW() - make_interval(secs => %s)",
+                    (self.lease_seconds * 3,)
+                )
+                cur.execute(
+                    "SELECT COUNT(*) FROM checker_workers WHERE last_seen >= NOW() - make_interval(secs => %s)",
+                    (self.lease_seconds,)
+                )
+                live_workers = max(cur.fetchone()[0], 1)
+                target = math.ceil(self.shard_count / live_workers)
+
+                cur.execute("""
+                    UPDATE checker_shards
+                    SET lease_expires_at = NOW() + make_interval(secs => %s), updated_at = NOW()
+                    WHERE owner = %s AND shard_id < %s
+                    RETURNING shard_id
+                """, (self.lease_seconds, self.worker_id, self.shard_count))
+                mine = sorted(row[0] for row in cur.fetchall())
+
+                if len(mine) > target:
+                    # Новый воркер: отдаем лишние шарды, он заберет их на своем цикле
+                    extra = mine[target:]
+                    cur.execute("""
+                        UPDATE checker_shards
+                        SET owner = NULL, lease_expires_at = NULL, updated_at = NOW()
+                        WHERE shard_id = ANY(%s) AND owner = %s
+                    """, (extra, self.worker_id))
+                    mine = mine[:target]
+                elif len(mine) < target:
+                    cur.execute("""
+                        UPDATE checker_shards
+                        SET owner = %s, lease_expires_at = NOW() + make_interval(secs => %s), updated_at = NOW()
+                        WHERE shard_id IN (
+                            SELECT shard_id FROM checker_shards
+                            WHERE shard_id < %s AND (owner IS NULL OR lease_expires_at < NOW())
+                            ORDER BY shard_id
+                            LIMIT %s
+                            FOR UPDATE SKIP LOCKED
+                        )
+                        RETURNING shard_id
+                    """, (self.worker_id, self.lease_seconds, self.shard_count, target - len(mine)))
+                    mine = sorted(mine + [row[0] for row in cur.fetchall()])
+                conn.commit()
+
+        owned = frozenset(mine)
+        with self._lock:
+            changed = owned != self._owned
+            self._owned = owned
+            self._valid_until = started + self.lease_seconds
+        if changed:
+            print(f"[ШАРДЫ] Воркер {self.worker_id}: {len(owned)}/{self.shard_count} шардов (живых воркеров: {live_workers})")
+        return owned
+
+    def release_all(self):
+        """Освобождает шарды и снимает воркера с учета (корректное завершение)"""
+        with self._lock:
+            self._owned = frozenset()
+            self._valid_until = 0.0
+        with self.connection_factory() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE checker_shards
+                    SET owner = NULL, lease_expires_at = NULL, updated_at = NOW()
+                    WHERE owner = %s
+                """, (self.worker_id,))
+                cur.execute("DELETE FROM checker_workers WHERE worker_id = %s", (self.worker_id,))
+                conn.commit()
+
+    def start(self):
+        """Первое распределение шардов и фоновое продление аренд"""
+        if self.running:
+            return None
+        self.running = True
+        try:
+            self.rebalance()
+        except Exception as e:
+            print(f"[ШАРДЫ] Ошибка распределения шардов: {e}")
+
+        def lease_loop():
+            while self.running:
+                time.sleep(max(self.lease_seconds / 3, 1))
+                if not self.running:
+                    break
+                try:
+                    self.rebalance()
+                except Exception as e:
+                    print(f"[ШАРДЫ] Ошибка продления аренды: {e}")
+                    traceback.print_exc()
+
+        lease_thread = threading.Thread(target=lease_loop)
+        lease_thread.daemon = True
+        lease_thread.start()
+        return lease_thread
+
+    def stop(self):
+        self.running = False
+        try:
+            self.release_all()
+        except Exception as e:
+            print(f"[ШАРДЫ] Ошибка освобождения шардов: {e}")
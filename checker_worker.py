@@ -0,0 +1,41 @@
+"""
+Отдельный воркер проверки ордеров (без веб-сервера).
+Запуск нескольких воркеров на одной или разных машинах делит пары и кошельки между ними
+через аренды шардов в БД; веб-сервер при этом запускается с ORDER_CHECKER_MODE=sharded.
+
+    ORDER_CHECKER_MODE=sharded python app.py   # веб-сервер без встроенной проверки
+    python checker_worker.py                   # воркер (сколько угодно экземпляров)
+
+Статистика проскальзывания сохраняется под источником SLIPPAGE_STATS_SOURCE — задайте
+каждому воркеру свое постоянное имя, чтобы агрегаты переживали перезапуск и не затирали друг друга.
+"""
+import os
+import signal
+import time
+
+# До импорта app: встроенная проверка ордеров в этом процессе не запускается
+os.environ["ORDER_CHECKER_MODE"] = "worker"
+
+import app
+from checker_shards import ShardLeaseManager
+
+
+def main():
+    shards = ShardLeaseManager(app.get_db_connection)
+    print(f"[ВОРКЕР] Запуск воркера проверки ордеров {shards.worker_id}")
+    shards.start()
+    app.start_order_checker(shards=shards)
+
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    try:
+        while not stopping:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    print("[ВОРКЕР] Остановка: освобождаем шарды")
+    shards.stop()
+
+
+if __name__ == "__main__":
+    main()
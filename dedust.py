@@ -10,7 +10,10 @@ from pytoniq_core import Address
 from pytoniq_core.boc import Builder
 from dotenv import load_dotenv
 
+from log_config import get_logger
+
 load_dotenv()
+log = get_logger('dedust')
 
 # Константы DeDust
 DEDUST_NATIVE_VAULT = os.environ.get("DEDUST_NATIVE_VAULT")
@@ -108,7 +111,7 @@ def create_swap_payload(pool_address: str, user_address: str, amount: int, min_o
         cell = cell.end_cell()
 
     boc = base64.b64encode(cell.to_boc()).decode('utf-8')
-    print(f"[DeDust] Generated swap payload BOC: {boc[:100]}...")
+    log.debug("[DeDust] Generated swap payload BOC: %.100s...", boc)
     return boc
 
 
@@ -0,0 +1,270 @@
+"""
+Надежная очередь исполнения ордеров (outbox) в PostgreSQL.
+Каждое исполнение (order_id + action + attempt) — строка execution_outbox с ключом идемпотентности.
+Воркеры захватывают задачи с арендой (FOR UPDATE SKIP LOCKED), поэтому исполнение можно
+масштабировать на несколько процессов; брошенные аренды восстанавливаются при старте.
+
+Состояния задачи:
+    pending  — ожидает захвата (с available_at)
+    claimed  — захвачена воркером, отправка еще не начиналась (безопасно вернуть в pending)
+    sending  — начата отправка транзакции (после падения состояние неизвестно); при отправке через
+               секвенсор кошелька задача остается здесь с записанным seqno до его подтверждения в сети
+    done     — исполнено, результат сохранен вместе с ордером в одной транзакции
+    retry    — временная ошибка, следующая попытка — новая задача с attempt + 1
+    failed   — окончательная ошибка
+    unknown  — аренда истекла во время отправки; повторная отправка заблокирована до ручной сверки
+"""
+import json
+import os
+import socket
+import uuid
+from typing import Callable, Dict, List, Optional
+
+import psycopg2.extras
+
+EXECUTION_LEASE_SECONDS = int(os.environ.get("EXECUTION_LEASE_SECONDS", "120"))
+
+# Состояния, в которых новая попытка того же действия ордера не создается
+BLOCKING_STATES = ('pending', 'claimed', 'sending', 'unknown', 'done')
+
+_JOB_COLUMNS = """
+    id, idempotency_key, order_id, action, attempt, wallet_key, state, payload, result, error,
+    latency, seqno, lease_owner, lease_expires_at, available_at, created_at, updated_at
+"""
+
+
+def make_idempotency_key(order_id: str, action: str, attempt: int) -> str:
+    return f"{order_id}:{action}:{attempt}"
+
+
+class ExecutionOutbox:
+    """
+    Args:
+        connection_factory: Контекстный менеджер подключения к БД (app.get_db_connection)
+        worker_id: Идентификатор воркера-владельца аренды
+        lease_seconds: Длительность аренды задачи
+    """
+
+    def __init__(self, connection_factory: Callable, worker_id: Optional[str] = None,
+                 lease_seconds: int = EXECUTION_LEASE_SECONDS):
+        self.connection_factory = connection_factory
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lease_seconds = lease_seconds
+
+    @staticmethod
+    def init_table(cur):
+        """Создание таблицы outbox (вызывается из init_db)"""
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS execution_outbox (
+                id BIGSERIAL PRIMARY KEY,
+                idempotency_key VARCHAR(160) UNIQUE NOT NULL,
+                order_id VARCHAR(64) NOT NULL,
+                action VARCHAR(16) NOT NULL,
+                attempt INTEGER NOT NULL DEFAULT 1,
+                wallet_key VARCHAR(80),
+                state VARCHAR(16) NOT NULL DEFAULT 'pending',
+                payload JSONB DEFAULT '{}'::jsonb,
+                result JSONB,
+                error TEXT,
+                lease_owner VARCHAR(120),
+                lease_expires_at TIMESTAMP,
+                available_at TIMESTAMP NOT NULL DEFAULT NOW(),
+                created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+                updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+            )
+        """)
+        # Не более одной незавершенной/исполненной задачи на действие ордера
+        cur.execute(f"""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_execution_outbox_active
+            ON execution_outbox(order_id, action)
+            WHERE state IN ({', '.join(repr(s) for s in BLOCKING_STATES)})
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_execution_outbox_due ON execution_outbox(state, available_at)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_execution_outbox_order ON execution_outbox(order_id, created_at)")
+        # Трасса задержек этапов исполнения (latency.LatencyTrace.to_dict)
+        cur.execute("ALTER TABLE execution_outbox ADD COLUMN IF NOT EXISTS latency JSONB")
+        # seqno сообщения кошелька, отправленного секвенсором (для сверки задач в unknown)
+        cur.execute("ALTER TABLE execution_outbox ADD COLUMN IF NOT EXISTS seqno BIGINT")
+
+    def enqueue(self, order_id: str, action: str, wallet_key: str = None,
+                payload: Optional[Dict] = None, delay_seconds: float = 0, cur=None) -> Optional[Dict]:
+        """
+        Создает задачу исполнения со следующим номером попытки.
+        Если передан курсор, вставка выполняется в транзакции вызывающего.
+
+        Returns:
+            dict: Созданная задача или None, если для действия ордера уже есть незавершенная
+                или исполненная задача (повторная отправка не допускается)
+        """
+        if cur is not None:
+            return self._insert_job(cur, order_id, action, wallet_key, payload, delay_seconds)
+        with self.connection_factory() as conn:
+            with conn.cursor() as own_cur:
+                job = self._insert_job(own_cur, order_id, action, wallet_key, payload, delay_seconds)
+                conn.commit()
+                return job
+
+    @staticmethod
+    def _insert_job(cur, order_id, action, wallet_key, payload, delay_seconds) -> Optional[Dict]:
+        cur.execute(
+            "SELECT COALESCE(MAX(attempt), 0) + 1 FROM execution_outbox WHERE order_id = %s AND action = %s",
+            (order_id, action)
+        )
+        attempt = cur.fetchone()[0]
+        cur.execute(f"""
+            INSERT INTO execution_outbox (idempotency_key, order_id, action, attempt, wallet_key, payload, available_at)
+            VALUES (%s, %s, %s, %s, %s, %s, NOW() + make_interval(secs => %s))
+            ON CONFLICT DO NOTHING
+            RETURNING {_JOB_COLUMNS}
+        """, (
+            make_idempotency_key(order_id, action, attempt), order_id, action, attempt,
+            wallet_key, json.dumps(payload or {}, default=str), float(delay_seconds)
+        ))
+        row = cur.fetchone()
+        if not row:
+            return None
+        return dict(zip([desc[0] for desc in cur.description], row))
+
+    def claim(self, job_id: Optional[int] = None, limit: int = 1) -> List[Dict]:
+        """Захватывает готовые задачи (конкретную или первые limit по available_at) с арендой"""
+        where = "state = 'pending' AND available_at <= NOW()"
+        params = []
+        if job_id is not None:
+            where += " AND id = %s"
+            params.append(job_id)
+        with self.connection_factory() as conn:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                cur.execute(f"""
+                    UPDATE execution_outbox
+                    SET state = 'claimed', lease_owner = %s,
+                        lease_expires_at = NOW() + make_interval(secs => %s), updated_at = NOW()
+                    WHERE id IN (
+                        SELECT id FROM execution_outbox
+                        WHERE {where}
+                        ORDER BY available_at, id
+                        LIMIT %s
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING {_JOB_COLUMNS}
+                """, [self.worker_id, self.lease_seconds] + params + [limit])
+                rows = [dict(r) for r in cur.fetchall()]
+                conn.commit()
+                return rows
+
+    def release(self, job_id: int):
+        """Возвращает захваченную, но не начатую задачу в очередь"""
+        with self.connection_factory() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE execution_outbox
+                    SET state = 'pending', lease_owner = NULL, lease_expires_at = NULL, updated_at = NOW()
+                    WHERE id = %s AND state = 'claimed' AND lease_owner = %s
+                """, (job_id, self.worker_id))
+                conn.commit()
+
+    def mark_sending(self, job_id: int) -> bool:
+        """
+        Фиксирует начало отправки транзакции (вызывается непосредственно перед отправкой).
+        Возвращает False, если аренда потеряна — тогда отправлять нельзя.
+        """
+        with self.connection_factory() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE execution_outbox
+                    SET state = 'sending', lease_expires_at = NOW() + make_interval(secs => %s), updated_at = NOW()
+                    WHERE id = %s AND state = 'claimed' AND lease_owner = %s
+                """, (self.lease_seconds, job_id, self.worker_id))
+                won = cur.rowcount == 1
+                conn.commit()
+                return won
+
+    def mark_sent(self, job_id: int, seqno: int, confirm_seconds: float) -> bool:
+        """
+        Записывает seqno принятого сетью сообщения; задача остается в sending, аренда продлевается
+        на ожидание подтверждения. Если процесс упадет раньше, recover_abandoned переведет задачу
+        в unknown, и seqno покажет, что сверять
+        """
+        with self.connection_factory() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE execution_outbox
+                    SET seqno = %s, lease_expires_at = NOW() + make_interval(secs => %s), updated_at = NOW()
+                    WHERE id = %s AND state = 'sending' AND lease_owner = %s
+                """, (seqno, float(confirm_seconds) + self.lease_seconds, job_id, self.worker_id))
+                won = cur.rowcount == 1
+                conn.commit()
+                return won
+
+    def finish(self, job_id: int, state: str, result: Optional[Dict] = None,
+               error: Optional[str] = None, cur=None, latency: Optional[Dict] = None):
+        """
+        Завершает задачу. Если передан курсор, обновление выполняется в транзакции вызывающего
+        (например, вместе с сохранением ордера), иначе — в собственной.
+        """
+        query = """
+            UPDATE execution_outbox
+            SET state = %s, result = %s, error = %s, latency = COALESCE(%s, latency),
+                lease_expires_at = NULL, updated_at = NOW()
+            WHERE id = %s AND lease_owner = %s AND state IN ('claimed', 'sending')
+        """
+        params = (
+            state, json.dumps(result, default=str) if result is not None else None, error,
+            json.dumps(latency) if latency is not None else None, job_id, self.worker_id
+        )
+        if cur is not None:
+            cur.execute(query, params)
+            return
+        with self.connection_factory() as conn:
+            with conn.cursor() as own_cur:
+                own_cur.execute(query, params)
+                conn.commit()
+
+    def recover_abandoned(self) -> Dict[str, List[str]]:
+        """
+        Восстанавливает задачи с истекшей арендой:
+        claimed → pending (отправка не начиналась), sending → unknown (нужна сверка, повторно не отправляем).
+
+        Returns:
+            dict: {'requeued': [order_id...], 'unknown': [order_id...]}
+        """
+        with self.connection_factory() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE execution_outbox
+                    SET state = 'pending', lease_owner = NULL, lease_expires_at = NULL, updated_at = NOW()
+                    WHERE state = 'claimed' AND lease_expires_at < NOW()
+                    RETURNING order_id
+                """)
+                requeued = [row[0] for row in cur.fetchall()]
+                cur.execute("""
+                    UPDATE execution_outbox
+                    SET state = 'unknown', error = COALESCE(error, 'Аренда истекла во время отправки транзакции'),
+                        updated_at = NOW()
+                    WHERE state = 'sending' AND lease_expires_at < NOW()
+                    RETURNING order_id
+                """)
+                unknown = [row[0] for row in cur.fetchall()]
+                conn.commit()
+                return {'requeued': requeued, 'unknown': unknown}
+
+    def recent_latency(self, hours: float = 24, state: str = 'done') -> List[Dict]:
+        """Трассы задержек завершенных задач за период (для гистограмм по всем воркерам)"""
+        with self.connection_factory() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT latency FROM execution_outbox
+                    WHERE state = %s AND latency IS NOT NULL
+                    AND updated_at >= NOW() - make_interval(secs => %s)
+                """, (state, float(hours) * 3600))
+                return [row[0] if isinstance(row[0], dict) else json.loads(row[0]) for row in cur.fetchall()]
+
+    def get_order_jobs(self, order_id: str) -> List[Dict]:
+        """История задач исполнения ордера"""
+        with self.connection_factory() as conn:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                cur.execute(f"""
+                    SELECT {_JOB_COLUMNS} FROM execution_outbox
+                    WHERE order_id = %s
+                    ORDER BY created_at, attempt
+                """, (order_id,))
+                return [dict(r) for r in cur.fetchall()]
@@ -0,0 +1,162 @@
+"""
+Пул исполнения сработавших ордеров.
+Задачи разных кошельков ордеров выполняются параллельно без ограничения,
+задачи одного кошелька — строго последовательно (seqno кошелька).
+"""
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+
+class StageMetrics:
+    """Агрегированная задержка этапа: количество, среднее, максимум, последнее значение"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def add(self, duration: float):
+        self.count += 1
+        self.total += duration
+        self.last = duration
+        if duration > self.max:
+            self.max = duration
+
+    def to_dict(self) -> Dict:
+        return {
+            'count': self.count,
+            'avg_ms': (self.total / self.count) * 1000 if self.count else 0,
+            'max_ms': self.max * 1000,
+            'last_ms': self.last * 1000,
+        }
+
+
+class ExecutionTask:
+    """Задача пула; передается в функцию задачи для замера этапов"""
+
+    def __init__(self, pool: 'ExecutionPool', wallet_key: str, task_key: str, fn: Callable, args, kwargs):
+        self.pool = pool
+        self.wallet_key = wallet_key
+        self.task_key = task_key
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.enqueued_at = time.monotonic()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Замер длительности этапа задачи: with task.stage('swap'): ..."""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.pool.record_stage(name, time.monotonic() - started)
+
+
+class ExecutionPool:
+    """Пул исполнения с сериализацией по кошельку ордеров"""
+
+    def __init__(self, name: str = "ИСПОЛНЕНИЕ"):
+        self.name = name
+        self._queues: Dict[str, deque] = {}
+        self._queued_keys = set()
+        self._running_keys = set()
+        self._lock = threading.Lock()
+        self._stages: Dict[str, StageMetrics] = {}
+        self._completed = 0
+        self._failed = 0
+
+    def submit(self, wallet_key, task_key: str, fn: Callable, *args, **kwargs) -> bool:
+        """
+        Ставит задачу в очередь кошелька.
+
+        Args:
+            wallet_key: Ключ кошелька ордеров (задачи одного ключа выполняются последовательно)
+            task_key: Ключ задачи (обычно id ордера); повторная постановка той же задачи игнорируется,
+                пока она в очереди или выполняется
+            fn: Функция задачи, первым аргументом получает ExecutionTask
+
+        Returns:
+            bool: True, если задача поставлена в очередь
+        """
+        wallet_key = str(wallet_key or 'default')
+        task = ExecutionTask(self, wallet_key, task_key, fn, args, kwargs)
+        with self._lock:
+            if task_key in self._queued_keys or task_key in self._running_keys:
+                return False
+            self._queued_keys.add(task_key)
+            queue = self._queues.get(wallet_key)
+            start_worker = queue is None
+            if start_worker:
+                queue = deque()
+                self._queues[wallet_key] = queue
+            queue.append(task)
+        if start_worker:
+            worker = threading.Thread(target=self._drain, args=(wallet_key,))
+            worker.daemon = True
+            worker.start()
+        return True
+
+    def is_pending(self, task_key: str) -> bool:
+        """Задача в очереди или выполняется"""
+        with self._lock:
+            return task_key in self._queued_keys or task_key in self._running_keys
+
+    def _drain(self, wallet_key: str):
+        """Последовательно выполняет задачи одного кошелька; поток завершается при пустой очереди"""
+        while True:
+            with self._lock:
+                queue = self._queues.get(wallet_key)
+                if not queue:
+                    self._queues.pop(wallet_key, None)
+                    return
+                task = queue.popleft()
+                self._queued_keys.discard(task.task_key)
+                self._running_keys.add(task.task_key)
+            self.record_stage('queue_wait', time.monotonic() - task.enqueued_at)
+            started = time.monotonic()
+            try:
+                task.fn(task, *task.args, **task.kwargs)
+                with self._lock:
+                    self._completed += 1
+            except Exception as e:
+                with self._lock:
+                    self._failed += 1
+                print(f"[{self.name}] Ошибка задачи {task.task_key} (кошелек {wallet_key}): {e}")
+                traceback.print_exc()
+            finally:
+                self.record_stage('total', time.monotonic() - started)
+                with self._lock:
+                    self._running_keys.discard(task.task_key)
+
+    def record_stage(self, name: str, duration: float):
+        with self._lock:
+            metrics = self._stages.get(name)
+            if metrics is None:
+                metrics = StageMetrics()
+                self._stages[name] = metrics
+            metrics.add(duration)
+
+    def queue_depth(self, wallet_key: Optional[str] = None) -> int:
+        with self._lock:
+            if wallet_key is not None:
+                return len(self._queues.get(str(wallet_key), ()))
+            return sum(len(q) for q in self._queues.values())
+
+    def get_metrics(self) -> Dict:
+        """Глубина очередей, число активных кошельков и задержки этапов"""
+        with self._lock:
+            return {
+                'queue_depth': sum(len(q) for q in self._queues.values()),
+                'queue_depth_by_wallet': {k: len(q) for k, q in self._queues.items() if q},
+                'active_wallets': len(self._queues),
+                'running': len(self._running_keys),
+                'completed': self._completed,
+                'failed': self._failed,
+                'stages': {name: m.to_dict() for name, m in self._stages.items()},
+            }
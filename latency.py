@@ -0,0 +1,156 @@
+"""
+Сквозная задержка срабатывания ордера: от получения цены до отправки транзакции.
+LatencyTrace собирает отметки этапов по time.monotonic(); между процессами (payload задачи
+outbox) трасса передается как смещения от момента получения цены, привязанного к time.time().
+Готовая трасса сохраняется в execution_outbox.latency и учитывается в гистограммах
+LatencyStats — общих, по DEX и по паре.
+"""
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+# Этапы в порядке прохождения; отсутствующие в трассе пропускаются
+LATENCY_STAGES = (
+    'price_fetched',      # Снимок цены получен (PriceWatcher / get_pair_price_snapshot)
+    'evaluated',          # Условие SL/TP/входа проверено, исполнение поставлено в outbox
+    'execution_started',  # Задача взята пулом исполнения
+    'checks_done',        # Балансы и котировка проверены
+    'payload_built',      # Payload свопа собран
+    'gas_estimated',      # Газ и сумма перевода определены
+    'sent',               # Транзакция принята (wallet.transfer завершился)
+    'confirmed',          # seqno сообщения подтвержден в сети (отправка через WalletSequencer)
+)
+# Верхние границы корзин гистограммы, мс (последняя корзина — все, что больше)
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000)
+
+
+class LatencyTrace:
+    """
+    Args:
+        start: Момент начала трассы по time.monotonic() (по умолчанию — сейчас)
+    """
+
+    def __init__(self, start: Optional[float] = None):
+        now_mono = time.monotonic()
+        self._start = now_mono if start is None else start
+        self.origin = time.time() - (now_mono - self._start)  # Начало трассы по часам
+        self.stamps: Dict[str, float] = {}  # этап -> секунд от начала
+        self.labels: Dict[str, str] = {}  # pair, dex, action
+
+    def stamp(self, stage: str, at: Optional[float] = None):
+        """Отметка этапа; at — момент по time.monotonic() (по умолчанию — сейчас)"""
+        self.stamps[stage] = (time.monotonic() if at is None else at) - self._start
+
+    def label(self, **labels):
+        self.labels.update({key: str(value) for key, value in labels.items() if value})
+
+    def to_dict(self) -> Dict:
+        return {'origin': self.origin, 'stamps': dict(self.stamps), 'labels': dict(self.labels)}
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict]) -> 'LatencyTrace':
+        """Продолжение трассы из payload (в другом потоке или процессе — по часам time.time())"""
+        trace = cls()
+        if not data:
+            return trace
+        trace.origin = data['origin']
+        trace._start = time.monotonic() - (time.time() - trace.origin)
+        trace.stamps = dict(data.get('stamps') or {})
+        trace.labels = dict(data.get('labels') or {})
+        return trace
+
+    def durations(self) -> List[Tuple[str, float]]:
+        """Длительности переходов между соседними отмеченными этапами и total, сек"""
+        stages = [stage for stage in LATENCY_STAGES if stage in self.stamps]
+        result = [
+            (f"{before}->{after}", self.stamps[after] - self.stamps[before])
+            for before, after in zip(stages, stages[1:])
+        ]
+        if len(stages) >= 2:
+            result.append(('total', self.stamps[stages[-1]] - self.stamps[stages[0]]))
+        return result
+
+
+class LatencyHistogram:
+    """Гистограмма с фиксированными корзинами: count, среднее, максимум, квантили по границам корзин"""
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, value_ms: float):
+        self.buckets[bisect_left(LATENCY_BUCKETS_MS, value_ms)] += 1
+        self.count += 1
+        self.total_ms += value_ms
+        self.max_ms = max(self.max_ms, value_ms)
+
+    def quantile(self, q: float) -> float:
+        """Верхняя граница корзины, в которую попадает квантиль (для последней — максимум)"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if seen >= rank:
+                return float(LATENCY_BUCKETS_MS[index]) if index < len(LATENCY_BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    def to_dict(self) -> Dict:
+        return {
+            'count': self.count,
+            'avg_ms': self.total_ms / self.count if self.count else 0,
+            'max_ms': self.max_ms,
+            'p50_ms': self.quantile(0.5),
+            'p95_ms': self.quantile(0.95),
+            'p99_ms': self.quantile(0.99),
+            'buckets': {
+                (f"le_{bound}" if index < len(LATENCY_BUCKETS_MS) else 'inf'): count
+                for index, (bound, count) in enumerate(zip(LATENCY_BUCKETS_MS + (None,), self.buckets))
+                if count
+            },
+        }
+
+
+class LatencyStats:
+    """Гистограммы переходов между этапами: общие, по DEX и по паре"""
+
+    def __init__(self):
+        # (scope, key) -> переход -> гистограмма; scope: 'all' / 'dex' / 'pair'
+        self._histograms: Dict[Tuple[str, str], Dict[str, LatencyHistogram]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, trace: LatencyTrace):
+        durations = trace.durations()
+        if not durations:
+            return
+        keys = [('all', '')]
+        if trace.labels.get('dex'):
+            keys.append(('dex', trace.labels['dex']))
+        if trace.labels.get('pair'):
+            keys.append(('pair', trace.labels['pair']))
+        with self._lock:
+            for key in keys:
+                histograms = self._histograms.setdefault(key, {})
+                for name, seconds in durations:
+                    histogram = histograms.get(name)
+                    if histogram is None:
+                        histogram = histograms[name] = LatencyHistogram()
+                    histogram.observe(max(seconds, 0.0) * 1000)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            def dump(scope):
+                return {
+                    key: {name: h.to_dict() for name, h in histograms.items()}
+                    for (s, key), histograms in self._histograms.items() if s == scope
+                }
+            return {
+                'stages': list(LATENCY_STAGES),
+                'all': dump('all').get('', {}),
+                'by_dex': dump('dex'),
+                'by_pair': dump('pair'),
+            }
@@ -0,0 +1,214 @@
+"""
+Неблокирующее логирование.
+Логгеры пишут записи в очередь (QueueHandler без форматирования в потоке вызова), форматирование
+и вывод — в фоновом QueueListener. Уровень проверяется до создания записи, поэтому отключенный
+debug в цикле тиков почти ничего не стоит; пооредерные debug-записи тиков дополнительно
+сэмплируются (debug_sampled). Формат — текст или JSON (LOG_FORMAT=json), в JSON попадают
+поля extra (order_id, pair, ...). При переполнении очереди записи отбрасываются с подсчетом.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import socket
+import sys
+import threading
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, SysLogHandler
+from typing import Dict, Optional
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")  # text / json
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+# Доля пооредерных debug-записей тика, которые попадают в лог
+LOG_DEBUG_SAMPLE_RATE = float(os.environ.get("LOG_DEBUG_SAMPLE_RATE", "0.01"))
+
+ROOT_LOGGER = "dex"
+APP_NAME = 'practice_docs_system'
+
+# Атрибуты LogRecord; все остальное — поля extra
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional["NonBlockingQueueHandler"] = None
+_configure_lock = threading.Lock()
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler без форматирования в потоке вызова и без ожидания при полной очереди"""
+
+    def __init__(self, log_queue: "queue.Queue"):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Очередь внутрипроцессная: запись передается как есть, сообщение собирает фоновый поток
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись: время, уровень, логгер, сообщение и поля extra"""
+
+    def format(self, record):
+        data = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'thread': record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_FIELDS and not key.startswith('_'):
+                data[key] = value
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str, ensure_ascii=False)
+
+
+class AdvancedSyslogHandler(SysLogHandler):
+    """Расширенный обработчик Syslog с дополнительными полями"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.hostname = socket.gethostname()
+        self.app_name = APP_NAME
+
+    def format(self, record):
+        """Форматирование записей для Syslog с дополнительными метаданными"""
+        msg = super().format(record)
+
+        # Добавление структурированных данных в формате JSON
+        structured_data = self._create_structured_data(record)
+        if structured_data:
+            msg = f"{msg} {structured_data}"
+
+        return msg
+
+    def _create_structured_data(self, record):
+        """Создание структурированных данных для Syslog"""
+        try:
+            structured_data = {
+                'app': self.app_name,
+                'host': self.hostname,
+                'module': getattr(record, 'module', ''),
+                'function': getattr(record, 'funcName', ''),
+                'user_id': getattr(record, 'user_id', None),
+                'request_id': getattr(record, 'request_id', None)
+            }
+            # Фильтрация None значений
+            structured_data = {k: v for k, v in structured_data.items() if v is not None}
+            return json.dumps(structured_data)
+        except Exception:
+            return None
+
+
+def _make_formatter() -> logging.Formatter:
+    if LOG_FORMAT == 'json':
+        return JsonFormatter()
+    return logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+
+def configure_logging(level: str = LOG_LEVEL, handlers=None) -> QueueListener:
+    """
+    Подключает к логгеру ROOT_LOGGER очередь и запускает фоновый поток записи (повторный вызов
+    возвращает уже запущенный). handlers — обработчики фонового потока (по умолчанию stdout)
+    """
+    global _listener, _queue_handler
+    with _configure_lock:
+        if _listener is not None:
+            return _listener
+        if handlers is None:
+            stream = logging.StreamHandler(sys.stdout)
+            stream.setFormatter(_make_formatter())
+            handlers = [stream]
+        log_queue = queue.Queue(LOG_QUEUE_SIZE)
+        _queue_handler = NonBlockingQueueHandler(log_queue)
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(getattr(logging, level, logging.INFO))
+        root.addHandler(_queue_handler)
+        root.propagate = False
+        _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)  # Дописать очередь при выходе
+        return _listener
+
+
+def add_handler(handler: logging.Handler):
+    """Добавляет обработчик в фоновый поток записи"""
+    listener = configure_logging()
+    listener.handlers = listener.handlers + (handler,)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Логгер модуля внутри ROOT_LOGGER (записи идут через общую очередь)"""
+    configure_logging()
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def debug_sampled(logger: logging.Logger, msg: str, *args, rate: float = None, **extra):
+    """
+    Debug-запись для горячих путей (по записи на ордер за тик): сначала проверка уровня,
+    затем сэмплирование; аргументы форматируются только в фоновом потоке
+    """
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    if random.random() >= (LOG_DEBUG_SAMPLE_RATE if rate is None else rate):
+        return
+    logger.debug(msg, *args, extra=extra or None, stacklevel=2)
+
+
+def get_logging_metrics() -> Dict:
+    if _queue_handler is None:
+        return {'configured': False}
+    return {
+        'configured': True,
+        'queue_depth': _queue_handler.queue.qsize(),
+        'dropped': _queue_handler.dropped,
+        'level': logging.getLevelName(logging.getLogger(ROOT_LOGGER).level),
+    }
+
+
+def configure_advanced_syslog(app):
+    """Расширенная настройка Syslog с поддержкой структурированного логирования"""
+
+    if app.config.get('SYSLOG_ENABLED', False):
+        try:
+            # Создание расширенного обработчика Syslog
+            syslog_handler = AdvancedSyslogHandler(
+                address=(
+                    app.config['SYSLOG_SERVER'],
+                    app.config.get('SYSLOG_PORT', 514)
+                ),
+                facility=SysLogHandler.facility_names.get(
+                    app.config.get('SYSLOG_FACILITY', 'local0')
+                )
+            )
+
+            # Форматтер для Syslog
+            formatter = logging.Formatter(
+                '%(name)s[%(process)d]: %(levelname)s - %(message)s'
+            )
+            syslog_handler.setFormatter(formatter)
+
+            # Установка уровня логирования для Syslog
+            syslog_level = getattr(
+                logging,
+                app.config.get('SYSLOG_LEVEL', 'INFO')
+            )
+            syslog_handler.setLevel(syslog_level)
+
+            # Форматирование и отправка — в фоновом потоке очереди, а не в потоке вызова
+            add_handler(syslog_handler)
+
+            app.logger.info("Syslog handler configured successfully")
+
+        except Exception as e:
+            app.logger.error(f"Failed to configure Syslog: {e}")
@@ -0,0 +1,175 @@
+"""
+Единственный владелец OrderProcessor (модель актора).
+Все изменения процессора — добавление, отмена, изменение ордеров и тики — команды в очереди,
+которые применяет один поток в порядке поступления; вызывающий получает Future. Чтение для API —
+из неизменяемого снимка, который поток-владелец периодически публикует, поэтому потоки Flask
+не конкурируют с циклом тиков и не видят ордер в середине изменения.
+"""
+import copy
+import os
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import Future
+from datetime import datetime
+from types import MappingProxyType
+from typing import Callable, Dict, Mapping, Optional
+
+from order_system import Order, OrderProcessor, OrderStatus
+
+ORDER_SNAPSHOT_INTERVAL = float(os.environ.get("ORDER_SNAPSHOT_INTERVAL", "1.0"))
+
+_STOP = object()
+
+
+class OrderSnapshot:
+    """Неизменяемый снимок ордеров процессора: {order_id: order.to_dict()}"""
+
+    def __init__(self, orders: Dict[str, Dict], version: int):
+        self._orders: Mapping[str, Dict] = MappingProxyType(orders)
+        self.version = version
+        self.published_at = datetime.now()
+
+    def __len__(self):
+        return len(self._orders)
+
+    def __contains__(self, order_id: str):
+        return order_id in self._orders
+
+    def get(self, order_id: str) -> Optional[Dict]:
+        """Копия ордера из снимка (снимок общий для всех читателей)"""
+        order = self._orders.get(order_id)
+        return dict(order) if order is not None else None
+
+    def order_ids(self):
+        return list(self._orders)
+
+
+class OrderActor:
+    """
+    Args:
+        processor: Процессор, которым владеет актор (снаружи его больше не трогают)
+        snapshot_interval: Минимальный интервал публикации снимка, сек
+        name: Метка в логах
+    """
+
+    def __init__(self, processor: OrderProcessor, snapshot_interval: float = ORDER_SNAPSHOT_INTERVAL,
+                 name: str = "АКТОР"):
+        self.processor = processor
+        self.snapshot_interval = snapshot_interval
+        self.name = name
+        self._commands: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._snapshot = OrderSnapshot({}, 0)
+        self._changed = False
+        self._metrics = {'commands': 0, 'errors': 0, 'snapshots': 0, 'last_snapshot_ms': 0.0}
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return self._thread
+        self._thread = threading.Thread(target=self._run, name="order-actor")
+        self._thread.daemon = True
+        self._thread.start()
+        return self._thread
+
+    def stop(self, timeout: Optional[float] = None):
+        self._commands.put(_STOP)
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        next_snapshot = 0.0
+        while True:
+            try:
+                command = self._commands.get(timeout=max(next_snapshot - time.monotonic(), 0.01) if self._changed else None)
+            except queue.Empty:
+                command = None
+            if command is _STOP:
+                break
+            if command is not None:
+                self._apply(*command)
+            if self._changed and time.monotonic() >= next_snapshot:
+                self._publish()
+                next_snapshot = time.monotonic() + self.snapshot_interval
+
+    def _apply(self, future: Future, fn: Callable, args, kwargs):
+        if not future.set_running_or_notify_cancel():
+            return
+        self._metrics['commands'] += 1
+        try:
+            result = fn(self.processor, *args, **kwargs)
+        except Exception as e:
+            self._metrics['errors'] += 1
+            print(f"[{self.name}] Ошибка команды {getattr(fn, '__name__', fn)}: {e}")
+            traceback.print_exc()
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            self._changed = True
+
+    def _publish(self):
+        started = time.monotonic()
+        self.processor.sync_trailing()
+        orders = {order_id: order.to_dict() for order_id, order in self.processor.orders.items()}
+        self._snapshot = OrderSnapshot(orders, self._snapshot.version + 1) # Замена ссылки атомарна
+        self._changed = False
+        self._metrics['snapshots'] += 1
+        self._metrics['last_snapshot_ms'] = (time.monotonic() - started) * 1000
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """Ставит команду fn(processor, *args, **kwargs) в очередь; из потока-владельца выполняет сразу"""
+        future = Future()
+        if threading.current_thread() is self._thread:
+            self._apply(future, fn, args, kwargs)  # Вложенная команда: очередь привела бы к взаимоблокировке
+        else:
+            self._commands.put((future, fn, args, kwargs))
+        return future
+
+    def call(self, fn: Callable, *args, timeout: Optional[float] = None, **kwargs):
+        """Синхронный вариант submit"""
+        return self.submit(fn, *args, **kwargs).result(timeout)
+
+    def snapshot(self) -> OrderSnapshot:
+        return self._snapshot
+
+    def get_metrics(self) -> Dict:
+        return dict(self._metrics, queue_depth=self._commands.qsize(), snapshot_version=self._snapshot.version,
+                    snapshot_orders=len(self._snapshot))
+
+    # Команды
+
+    def add_order(self, order: Order) -> Future:
+        """Добавляет ордер; результат — копия ордера после добавления"""
+        def command(processor: OrderProcessor):
+            processor.add_order(order)
+            return copy.deepcopy(order)
+        return self.submit(command)
+
+    def cancel_order(self, order_id: str) -> Future:
+        """Отменяет и убирает ордер; результат — копия отмененного ордера или None"""
+        def command(processor: OrderProcessor):
+            order = processor.orders.get(order_id)
+            if order is None or order.status not in (OrderStatus.PENDING, OrderStatus.ACTIVE):
+                return None
+            processor.set_status(order, OrderStatus.CANCELLED)
+            order.cancelled_at = datetime.now()
+            processor.remove_order(order_id)
+            return copy.deepcopy(order)
+        return self.submit(command)
+
+    def modify_order(self, order_id: str, mutate: Callable[[Order], None]) -> Future:
+        """Изменяет ордер функцией mutate(order) с переиндексацией; результат — копия или None"""
+        def command(processor: OrderProcessor):
+            order = processor.orders.get(order_id)
+            if order is None:
+                return None
+            processor.sync_trailing([order_id])
+            mutate(order)
+            processor.reindex(order)
+            return copy.deepcopy(order)
+        return self.submit(command)
+
+    def tick(self, symbol: str, price, ts=None) -> Future:
+        return self.submit(lambda processor: processor.process_tick(symbol, price, ts))
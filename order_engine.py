@@ -1,8 +1,12 @@
 """
 Движок обработки ордеров - интеграция новой системы с существующим кодом
 """
+import asyncio
+import copy
+import os
 import time
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
 from datetime import datetime
 from typing import Dict, List, Optional
@@ -12,18 +16,47 @@ from order_system import (
     Order, OrderType, OrderStatus, PositionSide, TrailingConfig, TrailingType,
     OrderProcessor
 )
+from order_actor import OrderActor
+from order_scheduler import OrderEvaluator
+from order_snapshots import (
+    OrderChangeLog, SnapshotTimer, dump_processor, read_snapshot, write_snapshot, ORDER_SNAPSHOT_PATH
+)
 from app import (
-    get_db_connection, pools, get_current_price, load_orders, save_order, get_primary_pool
+    get_db_connection, pools, get_current_price, load_orders, iter_orders, save_order, save_engine_fills,
+    get_primary_pool, order_store, order_scheduler, LIVE_ORDER_STATUSES, slippage_stats
 )
 
+# Автономный цикл (start): одновременных запросов цены не больше ENGINE_MAX_CONCURRENCY,
+# у каждого символа свой период; ENGINE_SYMBOL_INTERVALS — "TON-USDT=0.5,NOT-TON=2"
+ENGINE_MAX_CONCURRENCY = int(os.environ.get("ENGINE_MAX_CONCURRENCY", "8"))
+ENGINE_SYMBOL_INTERVALS = {
+    symbol.strip(): float(interval)
+    for symbol, _, interval in (
+        item.partition('=') for item in os.environ.get("ENGINE_SYMBOL_INTERVALS", "").split(',') if '=' in item
+    )
+}
+ENGINE_SYMBOL_RESCAN_INTERVAL = float(os.environ.get("ENGINE_SYMBOL_RESCAN_INTERVAL", "30"))
+# Ордера движка отличаются заполненной колонкой order_type (type у них — сторона long/short для совместимости);
+# строки без order_type — legacy long/short, их проверяет и исполняет (с обменом) LegacyOrderEvaluator
+
 
-class OrderEngine:
+class OrderEngine(OrderEvaluator):
     """Движок обработки ордеров с интеграцией в существующую систему"""
+    name = 'advanced'
     
     def __init__(self):
-        self.processor = OrderProcessor(self._get_price)
+        self.processor = OrderProcessor(self._get_price, slippage_stats=slippage_stats)
+        # Процессор меняется только потоком актора; API читает его снимки
+        self.actor = OrderActor(self.processor)
+        self.actor.start()
         self.running = False
-        self.tick_interval = 1.0  # Интервал обработки тиков в секундах
+        self.tick_interval = 1.0  # Интервал обработки тиков в секундах (по умолчанию для символа)
+        self.max_concurrency = ENGINE_MAX_CONCURRENCY
+        self.symbol_intervals = dict(ENGINE_SYMBOL_INTERVALS)
+        # symbol -> {'ticks', 'overruns', 'skipped', 'errors', 'last_ms', 'max_ms'}
+        self.tick_metrics: Dict[str, Dict] = {}
+        self.change_log = OrderChangeLog(get_db_connection)
+        self.snapshot_timer = SnapshotTimer()
     
     def _get_price(self, symbol: str) -> Decimal:
         """Получает текущую цену для символа"""
@@ -36,25 +69,101 @@ class OrderEngine:
     def load_orders_from_db(self):
         """Загружает ордера из БД в процессор"""
         try:
-            orders_data = load_orders()
+            orders_data = load_orders(statuses=LIVE_ORDER_STATUSES, engine=True)
+            orders = []
             for order_dict in orders_data.get('orders', []):
                 try:
                     # Конвертируем старый формат в новый
                     order = OrderEngine._convert_legacy_order(order_dict)
                     if order and order.status == OrderStatus.ACTIVE:
-                        self.processor.add_order(order)
+                        order.db_version = order_dict.get('version') # Версия строки для CAS-записи
+                        orders.append(order)
                 except Exception as e:
                     print(f"[ENGINE] Error loading order {order_dict.get('id')}: {e}")
+            self.actor.call(lambda processor: [processor.add_order(order) for order in orders])
         except Exception as e:
             print(f"[ENGINE] Error loading orders: {e}")
+            raise  # Пустой движок при недоступной БД хуже повторной попытки (get_order_engine)
+    
+    def warm_start(self):
+        """
+        Теплый старт: ордера из снимка процессора (с состоянием трейлинга) плюс ордера,
+        измененные в БД после снимка. Без пригодного снимка — полная загрузка из БД.
+        """
+        started = time.monotonic()
+        snapshot = read_snapshot(ORDER_SNAPSHOT_PATH)
+        if snapshot is None:
+            self.load_orders_from_db()
+            return
+        try:
+            changed_ids = self.change_log.changed_since(snapshot['seq'], snapshot['taken_at'])
+            rows = load_orders(ids=changed_ids)['orders'] if changed_ids else []
+        except Exception as e:
+            print(f"[ENGINE] Журнал изменений недоступен ({e}), полная загрузка из БД")
+            self.load_orders_from_db()
+            return
+        rows_by_id = {row['id']: row for row in rows}
+        
+        def command(processor: OrderProcessor):
+            for order in snapshot['orders']:
+                processor.add_order(order)
+            for order_id in changed_ids:
+                self._replay_change(processor, order_id, rows_by_id.get(order_id))
+        
+        self.actor.call(command)
+        print(f"[ENGINE] Теплый старт из снимка: {len(snapshot['orders'])} ордеров, "
+              f"изменено после снимка {len(changed_ids)}, {time.monotonic() - started:.2f} с")
+    
+    @staticmethod
+    def _replay_change(processor: OrderProcessor, order_id: str, row: Optional[Dict]):
+        """Приводит ордер процессора к строке БД (повторное применение безопасно)"""
+        current = processor.orders.get(order_id)
+        if row is None or row.get('status') not in LIVE_ORDER_STATUSES:
+            processor.remove_order(order_id)  # Исполнен, отменен или удален вне движка
+            return
+        if current is not None and getattr(current, 'db_version', None) == row.get('version'):
+            return  # Изменение уже в снимке
+        if current is None and not row.get('order_type'):
+            return  # Legacy-ордер: не движка
+        fresh = OrderEngine._convert_legacy_order(row)
+        if fresh is None or fresh.status != OrderStatus.ACTIVE:
+            processor.remove_order(order_id)
+            return
+        if current is None:
+            fresh.db_version = row.get('version')
+            processor.add_order(fresh)
+            return
+        # Строка изменена вне движка: берем поля, которые хранит БД; тип, трейлинг и OCO — из снимка
+        processor.sync_trailing([order_id])
+        current.quantity = fresh.quantity
+        current.stop_loss = fresh.stop_loss
+        current.take_profit = fresh.take_profit
+        current.db_version = row.get('version')
+        processor.reindex(current)
+    
+    def maybe_snapshot(self):
+        """Сохраняет снимок процессора, если подошел интервал"""
+        if not self.snapshot_timer.due():
+            return
+        self.snapshot_timer.reset()
+        try:
+            position = self.change_log.position() # До снятия состояния: изменения после — в журнале
+            data = self.actor.call(dump_processor, position)
+            write_snapshot(data, ORDER_SNAPSHOT_PATH)
+            self.change_log.prune()
+        except Exception as e:
+            print(f"[ENGINE] Ошибка сохранения снимка: {e}")
     
     @staticmethod
     def _convert_legacy_order(order_dict: Dict) -> Optional[Order]:
         """Конвертирует старый формат ордера в новый"""
         try:
-            # Определяем тип ордера
+            # Определяем тип ордера: у ордеров движка — order_type, сторона — в type
             order_type_str = order_dict.get('type', '').upper()
-            if order_type_str in ['LONG', 'SHORT']:
+            if order_dict.get('order_type') in [e.value for e in OrderType]:
+                order_type = OrderType(order_dict['order_type'])
+                side = PositionSide.SHORT if order_type_str == 'SHORT' else PositionSide.LONG
+            elif order_type_str in ['LONG', 'SHORT']:
                 # Старый формат - это лимитный ордер на вход
                 order_type = OrderType.LIMIT
                 side = PositionSide.LONG if order_type_str == 'LONG' else PositionSide.SHORT
@@ -97,38 +206,89 @@ class OrderEngine:
             print(f"[ENGINE] Error converting order: {e}")
             return None
     
-    def save_order_to_db(self, order: Order):
-        """Сохраняет ордер в БД"""
+    def save_order_to_db(self, order: Order, new: bool = False):
+        """Сохраняет ордер в БД; существующий — только CAS по известной версии строки (new — вставка нового)"""
+        if not new and getattr(order, 'db_version', None) is None:
+            print(f"[ENGINE] Ордер {order.id} без версии строки БД, запись пропущена")
+            return
         try:
-            order_dict = order.to_dict()
-            # Адаптируем под существующую схему БД
-            db_order = {
-                'id': order.id,
-                'type': order.side.value.lower(),  # Для совместимости
-                'pair': order.symbol,
-                'amount': float(order.quantity),
-                'entry_price': float(order.limit_price or order.entry_price or 0),
-                'stop_loss': float(order.stop_loss) if order.stop_loss else None,
-                'take_profit': float(order.take_profit) if order.take_profit else None,
-                'user_wallet': order.user_wallet,
-                'order_wallet': order.order_wallet,
-                'order_wallet_id': getattr(order, 'order_wallet_id', None),
-                'status': self._map_status_to_legacy(order.status),
-                'created_at': order.created_at.isoformat(),
-                'funded_at': order.filled_at.isoformat() if order.filled_at else None,
-                'opened_at': order.filled_at.isoformat() if order.filled_at and order.status == OrderStatus.FILLED else None,
-                'executed_at': order.filled_at.isoformat() if order.filled_at else None,
-                'execution_price': float(order.execution_price) if order.execution_price else None,
-                'execution_type': order.execution_type,
-                'cancelled_at': order.cancelled_at.isoformat() if order.cancelled_at else None,
-                'pnl': float(order.pnl),
-                'price_at_creation': float(order.execution_price) if order.execution_price else None,
-            }
-            save_order(db_order)
+            db_order = self._to_db_order(order)
+            if save_order(db_order):
+                order.db_version = db_order.get('version')
         except Exception as e:
             print(f"[ENGINE] Error saving order: {e}")
             traceback.print_exc()
     
+    def save_orders_to_db(self, orders: List[Order]) -> List[Order]:
+        """
+        Сохраняет ордера тика одной транзакцией (только с известной версией строки: запись — всегда CAS).
+        Исполненные (FILLED) пишутся путем исполнения движка, остальные — через order_store.
+
+        Returns:
+            list: Ордера, запись которых прошла
+        """
+        unversioned = [order.id for order in orders if getattr(order, 'db_version', None) is None]
+        if unversioned:
+            print(f"[ENGINE] Ордера без версии строки БД, запись пропущена: {', '.join(unversioned)}")
+            orders = [order for order in orders if getattr(order, 'db_version', None) is not None]
+        if not orders:
+            return []
+        try:
+            db_orders = {order.id: self._to_db_order(order) for order in orders}
+            fills = [db_orders[order.id] for order in orders if order.status == OrderStatus.FILLED]
+            others = [db_orders[order.id] for order in orders if order.status != OrderStatus.FILLED]
+            written = set(save_engine_fills(fills))
+            written.update(order['id'] for order in others)
+            written.difference_update(order_store.flush(others))
+            for order in orders:
+                if order.id in written:
+                    order.db_version = db_orders[order.id].get('version')
+            return [order for order in orders if order.id in written]
+        except Exception as e:
+            print(f"[ENGINE] Error saving orders: {e}")
+            traceback.print_exc()
+            return []
+    
+    def _reload_orders(self, processor: OrderProcessor, order_ids: List[str]):
+        """Приводит ордера, запись которых отклонена, к строкам БД (ордер, измененный в БД, перечитывается)"""
+        try:
+            rows = {row['id']: row for row in iter_orders(ids=order_ids)}
+        except Exception as e:
+            # БД недоступна: ордера остаются в процессоре как есть, до следующего старта движка
+            print(f"[ENGINE] Не удалось перечитать ордера {', '.join(order_ids)}: {e}")
+            return
+        for order_id in order_ids:
+            processor.remove_order(order_id)
+            self._replay_change(processor, order_id, rows.get(order_id))
+    
+    def _to_db_order(self, order: Order) -> Dict:
+        """Ордер движка в формате таблицы orders"""
+        # Адаптируем под существующую схему БД
+        return {
+            'id': order.id,
+            'type': order.side.value.lower(),  # Для совместимости
+            'order_type': order.type.value,  # Признак ордера движка (load_orders(engine=True))
+            'pair': order.symbol,
+            'amount': float(order.quantity),
+            'entry_price': float(order.limit_price or order.entry_price or 0),
+            'stop_loss': float(order.stop_loss) if order.stop_loss else None,
+            'take_profit': float(order.take_profit) if order.take_profit else None,
+            'user_wallet': order.user_wallet,
+            'order_wallet': order.order_wallet,
+            'order_wallet_id': getattr(order, 'order_wallet_id', None),
+            'status': self._map_status_to_legacy(order.status),
+            'created_at': order.created_at.isoformat(),
+            'funded_at': order.filled_at.isoformat() if order.filled_at else None,
+            'opened_at': order.filled_at.isoformat() if order.filled_at and order.status == OrderStatus.FILLED else None,
+            'executed_at': order.filled_at.isoformat() if order.filled_at else None,
+            'execution_price': float(order.execution_price) if order.execution_price else None,
+            'execution_type': order.execution_type,
+            'cancelled_at': order.cancelled_at.isoformat() if order.cancelled_at else None,
+            'pnl': float(order.pnl),
+            'price_at_creation': float(order.execution_price) if order.execution_price else None,
+            'version': getattr(order, 'db_version', None),
+        }
+    
     def _map_status_to_legacy(self, status: OrderStatus) -> str:
         """Маппинг нового статуса в старый формат"""
         status_map = {
@@ -140,39 +300,126 @@ class OrderEngine:
         }
         return status_map.get(status, 'pending')
     
-    def process_all_symbols(self):
-        """Обрабатывает тики для всех символов"""
+    def process_prices(self, prices: Dict[str, Decimal]) -> List[Order]:
+        """Обрабатывает тики по уже полученным ценам {symbol: price} (командой актора, в порядке с API)"""
+        return self.actor.call(self._apply_prices, prices)
+    
+    def _apply_prices(self, processor: OrderProcessor, prices: Dict[str, Decimal]) -> List[Order]:
         executed_orders = []
         
-        for symbol in pools.keys():
+        for symbol, price in prices.items():
             try:
-                price = self._get_price(symbol)
                 if price > 0:
-                    orders = self.processor.process_tick(symbol, price)
+                    orders = processor.process_tick(symbol, price)
                     executed_orders.extend(orders)
             except Exception as e:
                 print(f"[ENGINE] Error processing {symbol}: {e}")
         
-        # Сохраняем исполненные ордера
-        for order in executed_orders:
-            self.save_order_to_db(order)
-            self.processor.remove_order(order.id)
+        # Оставшиеся ноги OCO-групп, разрешенных в этих тиках, отменяются здесь, вне обработки тика
+        cancelled_orders = processor.reap_oco()
+        
+        # Сохраняем исполненные и отмененные ордера; из процессора уходят только записанные
+        changed = executed_orders + cancelled_orders
+        written = {order.id for order in self.save_orders_to_db(changed)}
+        for order in changed:
+            if order.id in written:
+                processor.remove_order(order.id)
+        rejected = [order.id for order in changed if order.id not in written]
+        if rejected:
+            print(f"[ENGINE] Запись отклонена, ордера перечитываются из БД: {', '.join(rejected)}")
+            self._reload_orders(processor, rejected)
         
-        return executed_orders
+        return [order for order in executed_orders if order.id in written]
+    
+    def evaluate(self, prices: Dict[str, dict], full: bool):
+        """Оценщик единого планировщика: цены основного пула из общих снимков, без собственных запросов"""
+        self.process_prices({
+            symbol: Decimal(str(snapshot.get('primary') or 0))
+            for symbol, snapshot in prices.items()
+        })
+        if full:
+            self.maybe_snapshot()
+    
+    def process_all_symbols(self):
+        """Обрабатывает тики для всех символов (собственный опрос цен, для автономного запуска через start)"""
+        prices = {}
+        for symbol in pools.keys():
+            try:
+                prices[symbol] = self._get_price(symbol)
+            except Exception as e:
+                print(f"[ENGINE] Error processing {symbol}: {e}")
+        return self.process_prices(prices)
+    
+    def symbol_interval(self, symbol: str) -> float:
+        return self.symbol_intervals.get(symbol, self.tick_interval)
+    
+    async def _symbol_loop(self, symbol: str, semaphore: asyncio.Semaphore, executor: ThreadPoolExecutor):
+        """Цикл одного символа: запрос цены (в пуле потоков, под общим лимитом) и тик в акторе"""
+        loop = asyncio.get_running_loop()
+        metrics = self.tick_metrics.setdefault(symbol, {
+            'ticks': 0, 'overruns': 0, 'skipped': 0, 'errors': 0, 'last_ms': 0.0, 'max_ms': 0.0
+        })
+        next_run = loop.time()
+        while self.running:
+            interval = self.symbol_interval(symbol)
+            started = loop.time()
+            try:
+                async with semaphore:
+                    price = await loop.run_in_executor(executor, self._get_price, symbol)
+                if price > 0:
+                    await asyncio.wrap_future(self.actor.submit(self._apply_prices, {symbol: price}))
+            except Exception as e:
+                metrics['errors'] += 1
+                print(f"[ENGINE] Error processing {symbol}: {e}")
+            elapsed = loop.time() - started
+            metrics['ticks'] += 1
+            metrics['last_ms'] = elapsed * 1000
+            metrics['max_ms'] = max(metrics['max_ms'], elapsed * 1000)
+            
+            next_run += interval
+            now = loop.time()
+            if now > next_run:
+                # Цикл не уложился в период: пропущенные тики не догоняем, чтобы не создавать очередь
+                skipped = int((now - next_run) // interval)
+                metrics['overruns'] += 1
+                metrics['skipped'] += skipped
+                if metrics['overruns'] % 100 == 1:  # Первое и каждое сотое, чтобы не засорять лог
+                    print(f"[ENGINE] Tick overrun {symbol}: {elapsed * 1000:.0f} ms при периоде {interval * 1000:.0f} ms "
+                          f"(всего {metrics['overruns']})")
+                next_run = now
+            await asyncio.sleep(next_run - now)
+    
+    async def run_async(self):
+        """Конкурентный цикл по всем символам; новые пары из pools подхватываются периодически"""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        tasks: Dict[str, asyncio.Task] = {}
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="engine-price") as executor:
+            while self.running:
+                for symbol in list(pools.keys()):
+                    if symbol not in tasks:
+                        tasks[symbol] = asyncio.create_task(self._symbol_loop(symbol, semaphore, executor))
+                await asyncio.sleep(ENGINE_SYMBOL_RESCAN_INTERVAL)
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+    
+    def get_tick_metrics(self) -> Dict:
+        """Метрики автономного цикла по символам (overruns — тики, превысившие свой период)"""
+        return {symbol: dict(metrics, interval=self.symbol_interval(symbol)) for symbol, metrics in self.tick_metrics.items()}
     
     def start(self):
-        """Запускает движок обработки ордеров"""
+        """
+        Запускает автономный цикл движка (без app.order_scheduler). В приложении тики приходят
+        от планировщика, цены для которого конкурентно опрашивает PriceWatcher
+        """
         if self.running:
             return
         
         self.running = True
-        self.load_orders_from_db()
+        self.warm_start()
         
         def engine_loop():
             while self.running:
                 try:
-                    self.process_all_symbols()
-                    time.sleep(self.tick_interval)
+                    asyncio.run(self.run_async())
                 except Exception as e:
                     print(f"[ENGINE] Error in engine loop: {e}")
                     traceback.print_exc()
@@ -188,7 +435,19 @@ class OrderEngine:
         self.running = False
     
     def create_order(self, order_data: Dict) -> Order:
-        """Создает новый ордер"""
+        """Создает новый ордер; возвращает копию (живой ордер принадлежит актору)"""
+        order = self._build_order(order_data)
+        return self.actor.call(self._add_and_save, [order])[0]
+    
+    def _add_and_save(self, processor: OrderProcessor, orders: List[Order]) -> List[Order]:
+        for order in orders:
+            processor.add_order(order)
+        for order in orders:
+            self.save_order_to_db(order, new=True)
+        return [copy.deepcopy(order) for order in orders]
+    
+    def _build_order(self, order_data: Dict) -> Order:
+        """Ордер из данных запроса (еще не добавлен в процессор)"""
         # Генерируем ID
         order_id = f"order_{int(time.time())}_{hash(str(order_data)) % 10000}"
         
@@ -232,11 +491,8 @@ class OrderEngine:
             if order_data.get('oco_related_ids'):
                 order.oco_related_ids = set(order_data['oco_related_ids'])
         
-        # Добавляем в процессор
-        self.processor.add_order(order)
-        
-        # Сохраняем в БД
-        self.save_order_to_db(order)
+        if order_data.get('order_wallet_id'):
+            order.order_wallet_id = order_data['order_wallet_id']
         
         return order
     
@@ -247,23 +503,41 @@ class OrderEngine:
         # Создаем TP ордер
         tp_order_data['order_type'] = 'TAKE_PROFIT'
         tp_order_data['oco_group_id'] = oco_group_id
-        tp_order = self.create_order(tp_order_data)
+        tp_order = self._build_order(tp_order_data)
         
         # Создаем SL ордер
         sl_order_data['order_type'] = 'STOP_LOSS'
         sl_order_data['oco_group_id'] = oco_group_id
-        sl_order = self.create_order(sl_order_data)
+        sl_order = self._build_order(sl_order_data)
         
-        # Связываем ордера
+        # Связываем ордера до добавления: обе ноги появляются в процессоре одной командой
         tp_order.oco_related_ids.add(sl_order.id)
         sl_order.oco_related_ids.add(tp_order.id)
         
-        # Обновляем в процессоре
-        self.processor.add_order(tp_order)
-        self.processor.add_order(sl_order)
-        
+        tp_order, sl_order = self.actor.call(self._add_and_save, [tp_order, sl_order])
         return tp_order, sl_order
     
+    def set_trailing(self, order_id: str, trailing_type: TrailingType, distance: Decimal) -> Optional[Order]:
+        """Настраивает трейлинг-стоп ордера; возвращает копию или None, если ордера нет в движке"""
+        def command(processor: OrderProcessor):
+            order = processor.orders.get(order_id)
+            if order is None:
+                return None
+            processor.sync_trailing([order_id])
+            order.trailing = TrailingConfig(type=trailing_type, distance=distance)
+            processor.reindex(order)
+            self.save_order_to_db(order)
+            return copy.deepcopy(order)
+        return self.actor.call(command)
+    
+    def cancel_order(self, order_id: str):
+        """Снимает ордер с проверки (отмена в БД уже выполнена вызывающим)"""
+        return self.actor.cancel_order(order_id)
+    
+    def get_order(self, order_id: str) -> Optional[Dict]:
+        """Ордер из последнего опубликованного снимка (без ожидания цикла тиков)"""
+        return self.actor.snapshot().get(order_id)
+    
     def get_slippage_stats(self) -> Dict:
         """Возвращает статистику проскальзывания"""
         return self.processor.get_slippage_stats()
@@ -271,94 +545,32 @@ class OrderEngine:
 
 # Глобальный экземпляр движка
 _engine: Optional[OrderEngine] = None
+_engine_lock = threading.Lock()
 
 def get_order_engine() -> OrderEngine:
-    """Получает глобальный экземпляр движка"""
+    """
+    Получает глобальный экземпляр движка. Экземпляр публикуется только после успешного
+    теплого старта: при ошибке загрузки исключение уходит вызывающему, а следующий вызов
+    повторяет старт, вместо того чтобы навсегда оставить пустой движок
+    """
     global _engine
-    if _engine is None:
-        _engine = OrderEngine()
-        _engine.start()
+    if _engine is not None:
+        return _engine
+    with _engine_lock:
+        if _engine is None:
+            engine = OrderEngine()
+            try:
+                engine.warm_start()
+            except Exception:
+                engine.actor.stop()
+                raise
+            # Тики приходят от единого планировщика проверки ордеров (app.order_scheduler), а не из своего цикла
+            order_scheduler.register(engine)
+            _engine = engine
     return _engine
 
 
-
-
-
-# config/advanced_logger_config.py
-import logging
-from logging.handlers import SysLogHandler
-import socket
-
-class AdvancedSyslogHandler(SysLogHandler):
-    """Расширенный обработчик Syslog с дополнительными полями"""
-    
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.hostname = socket.gethostname()
-        self.app_name = 'practice_docs_system'
-    
-    def format(self, record):
-        """Форматирование записей для Syslog с дополнительными метаданными"""
-        msg = super().format(record)
-        
-        # Добавление структурированных данных в формате JSON
-        structured_data = self._create_structured_data(record)
-        if structured_data:
-            msg = f"{msg} {structured_data}"
-            
-        return msg
-    
-    def _create_structured_data(self, record):
-        """Создание структурированных данных для Syslog"""
-        try:
-            structured_data = {
-                'app': self.app_name,
-                'host': self.hostname,
-                'module': getattr(record, 'module', ''),
-                'function': getattr(record, 'funcName', ''),
-                'user_id': getattr(record, 'user_id', None),
-                'request_id': getattr(record, 'request_id', None)
-            }
-            # Фильтрация None значений
-            structured_data = {k: v for k, v in structured_data.items() if v is not None}
-            return json.dumps(structured_data)
-        except Exception:
-            return None
-
-def configure_advanced_syslog(app):
-    """Расширенная настройка Syslog с поддержкой структурированного логирования"""
-    
-    if app.config.get('SYSLOG_ENABLED', False):
-        try:
-            # Создание расширенного обработчика Syslog
-            syslog_handler = AdvancedSyslogHandler(
-                address=(
-                    app.config['SYSLOG_SERVER'], 
-                    app.config.get('SYSLOG_PORT', 514)
-                ),
-                facility=SysLogHandler.facility_names.get(
-                    app.config.get('SYSLOG_FACILITY', 'local0')
-                )
-            )
-            
-            # Форматтер для Syslog
-            formatter = logging.Formatter(
-                '%(name)s[%(process)d]: %(levelname)s - %(message)s'
-            )
-            syslog_handler.setFormatter(formatter)
-            
-            # Установка уровня логирования для Syslog
-            syslog_level = getattr(
-                logging, 
-                app.config.get('SYSLOG_LEVEL', 'INFO')
-            )
-            syslog_handler.setLevel(syslog_level)
-            
-            # Добавление обработчика к корневому логгеру
-            logging.getLogger().addHandler(syslog_handler)
-            
-            app.logger.info("Syslog handler configured successfully")
-            
-        except Exception as e:
-            app.logger.error(f"Failed to configure Syslog: {e}")
-
+def notify_order_cancelled(order_id: str):
+    """Снимает отмененный в БД ордер с проверки движка, если движок запущен в этом процессе"""
+    if _engine is not None:
+        _engine.cancel_order(order_id)
@@ -0,0 +1,64 @@
+"""
+Чистые функции оценки условий legacy-ордеров (long/short с entry/SL/TP).
+Без обращений к БД и сети: на вход ордер и цена, на выход решение — используются
+проверкой ордеров в app.py и пригодны для бэктеста и тестов.
+"""
+from typing import Dict, Optional, Tuple
+
+
+def entry_condition(order: Dict, current_price: float, price_at_creation: float,
+                    slippage_percent: float) -> Tuple[bool, str, float]:
+    """
+    Достигнута ли цена входа в нужном направлении с учетом slippage.
+
+    Returns:
+        tuple: (entry_reached, вид ордера — 'Buy Stop'/'Buy Limit'/'Sell Stop'/'Sell Limit', граница цены входа)
+    """
+    entry_price = float(order['entry_price'])
+    slippage_multiplier = slippage_percent / 100.0 # Конвертируем проценты в множитель
+    if order['type'] == 'long':
+        if price_at_creation < entry_price:
+            # Buy Stop: цена была ниже, ждем роста до entry_price или выше
+            bound = entry_price * (1 - slippage_multiplier)
+            return current_price >= bound, 'Buy Stop', bound
+        # Buy Limit: цена была выше, ждем падения до entry_price или ниже
+        bound = entry_price * (1 + slippage_multiplier)
+        return current_price <= bound, 'Buy Limit', bound
+    if order['type'] == 'short':
+        if price_at_creation > entry_price:
+            # Sell Stop: цена была выше, ждем падения до entry_price или ниже
+            bound = entry_price * (1 + slippage_multiplier)
+            return current_price <= bound, 'Sell Stop', bound
+        # Sell Limit: цена была ниже, ждем роста до entry_price или выше
+        bound = entry_price * (1 - slippage_multiplier)
+        return current_price >= bound, 'Sell Limit', bound
+    return False, '', entry_price
+
+
+def exit_condition(order: Dict, current_price: float) -> Optional[Tuple[str, float]]:
+    """
+    Сработал ли SL/TP открытой позиции.
+
+    Returns:
+        tuple: (execution_type 'STOP_LOSS'/'TAKE_PROFIT', pnl) или None
+    """
+    entry_price = order['entry_price']
+    stop_loss = order.get('stop_loss')
+    take_profit = order.get('take_profit')
+    amount = order['amount']
+    if order['type'] == 'long':
+        if stop_loss and current_price <= stop_loss:
+            return 'STOP_LOSS', (stop_loss - entry_price) * amount
+        if take_profit and current_price >= take_profit:
+            return 'TAKE_PROFIT', (take_profit - entry_price) * amount
+    elif order['type'] == 'short':
+        if stop_loss and current_price >= stop_loss:
+            return 'STOP_LOSS', (entry_price - stop_loss) * amount
+        if take_profit and current_price <= take_profit:
+            return 'TAKE_PROFIT', (entry_price - take_profit) * amount
+    return None
+
+
+def side_price(order: Dict, snapshot: Dict) -> Optional[float]:
+    """Цена пары для стороны ордера: LONG — минимальная по пулам, SHORT — максимальная"""
+    return snapshot.get('long') if order['type'] == 'long' else snapshot.get('short')
@@ -2,7 +2,7 @@ import os
 import time
 import asyncio
 import base64
-from typing import Dict, Optional, Tuple
+from typing import Callable, Dict, Optional, Tuple
 from decimal import Decimal
 import traceback
 
@@ -17,6 +17,9 @@ from ton_rpc import (
 )
 from dedust import create_swap_payload as dedust_create_swap_payload, DEDUST_GAS_AMOUNT
 from stonfi import create_swap_payload as stonfi_create_swap_payload, STONFI_GAS_AMOUNT
+from latency import LatencyTrace
+from wallet_cache import wallet_cache_key, wallet_key_cache
+from wallet_sequencer import get_wallet_sequencer, sequencer_enabled
 from dotenv import load_dotenv
 
 # Import the new network configuration
@@ -41,7 +44,10 @@ TRANSIENT_ERROR_KEYWORDS = (
     'server error',
     'jsonrpc',
     'timeout',
-    'rungetmethod'
+    'rungetmethod',
+    '429',
+    'too many requests',
+    'rate limit'
 )
 
 
@@ -264,11 +270,109 @@ async def deploy_wallet_v5(wallet):
         print(f"[ORDER EXECUTOR] ❌ Ошибка развертывания кошелька: {e}")
         return False
 
+async def _connect_lite_client(testnet: bool):
+    """LiteClient, подключенный к testnet/mainnet, или None"""
+    print(f"[ORDER EXECUTOR] Подключение к {'testnet' if testnet else 'mainnet'}...")
+    
+    # Use the new network config function
+    if NETWORK_CONFIG_AVAILABLE and create_lite_client:
+        client = create_lite_client(testnet)
+    else:
+        # Fallback to direct creation
+        try:
+            from pytoniq import LiteClient
+            if testnet:
+                client = LiteClient.from_testnet_config(ls_i=1)
+            else:
+                client = LiteClient.from_mainnet_config(ls_i=1)
+        except Exception as e:
+            print(f"[ORDER EXECUTOR] Failed to create client: {e}")
+            return None
+    
+    if not client:
+        return None
+    
+    # Connect with retry logic
+    if NETWORK_CONFIG_AVAILABLE and connect_with_retry:
+        if not await connect_with_retry(client):
+            return None
+    else:
+        # Fallback connection
+        try:
+            await client.connect()
+        except Exception as e:
+            print(f"[ORDER EXECUTOR] Connection failed: {e}")
+            return None
+    return client
+
+
+def _send_via_sequencer(result: Dict, order_wallet_address: str, order_wallet_mnemonic: str,
+                        dest_address: str, amount: int, payload: Optional[str], cache_key: str,
+                        on_confirm: Optional[Callable[[bool], None]] = None) -> Dict:
+    """
+    Отправка через очередь кошелька: seqno ведется локально, следующее сообщение кошелька
+    подписывается сразу после приема предыдущего, без чтения состояния кошелька из сети.
+    Прием сетью — еще не исполнение: итог (включено в блок или истек valid_until) сообщает on_confirm
+    """
+    if len(order_wallet_mnemonic.strip().split()) < 12:
+        result['message'] = 'Invalid mnemonic: must contain at least 12 words'
+        return result
+    
+    wallet_balance = get_balance(order_wallet_address)
+    required_ton = amount / 1e9 + 0.05  # amount + gas buffer
+    if wallet_balance < required_ton:
+        result['message'] = f'Недостаточно средств. Баланс: {wallet_balance:.6f} TON, требуется: {required_ton:.6f} TON'
+        print(f"[ORDER EXECUTOR] {result['message']}")
+        return result
+    
+    payload_cell = None
+    if payload:
+        try:
+            from pytoniq_core import Cell
+            payload_cell = Cell.from_boc(base64.b64decode(payload))[0]
+        except Exception as payload_error:
+            result['message'] = f'Ошибка подготовки payload: {payload_error}'
+            print(f"[ORDER EXECUTOR] {result['message']}")
+            return result
+    
+    testnet = os.environ.get("TESTNET", "False") == "True"
+    sequencer = get_wallet_sequencer(
+        cache_key,
+        order_wallet_address,
+        lambda: _connect_lite_client(testnet),
+        WalletV5R1,
+        wallet_id=2147483409,  # Standard wallet ID
+        network_global_id=-239 if not testnet else 0
+    )
+    try:
+        sent = sequencer.send(dest_address, amount, payload_cell, order_wallet_mnemonic, on_confirm=on_confirm)
+    except Exception as e:
+        print(f"[ORDER EXECUTOR] ❌ Ошибка отправки транзакции: {e}")
+        result['message'] = str(e)
+        result['transient'] = _is_transient_error(result['message'])
+        return result
+    
+    print(f"[ORDER EXECUTOR] ✅ Транзакция отправлена успешно! seqno: {sent['seqno']}")
+    result['transaction_sent'] = True
+    result['seqno'] = sent['seqno']
+    result['valid_until'] = sent['valid_until']
+    result['awaiting_confirmation'] = on_confirm is not None
+    result['message'] = 'Transaction sent successfully'
+    return result
+
+
 def _maybe_send_transaction(order_wallet_address: str, order_wallet_mnemonic: Optional[str],
-                            dest_address: str, amount: int, payload: Optional[str] = None):
+                            dest_address: str, amount: int, payload: Optional[str] = None,
+                            cache_key: Optional[str] = None, on_confirm: Optional[Callable[[bool], None]] = None):
     """
     Запускает отправку транзакции с проверкой инициализации кошелька
+
+    Args:
+        cache_key: Ключ кошелька в wallet_key_cache (по умолчанию — по адресу)
+        on_confirm: Итог отправки через секвенсор (True — включено в блок, False — истек valid_until);
+            при прямой отправке не вызывается, результат тогда содержит awaiting_confirmation=False
     """
+    cache_key = cache_key or wallet_cache_key(address=order_wallet_address)
     result = {
         'transaction_sent': False,
         'message': 'pytoniq is not available or mnemonic missing',
@@ -293,45 +397,18 @@ def _maybe_send_transaction(order_wallet_address: str, order_wallet_mnemonic: Op
         result['message'] = 'pytoniq package is not installed on server'
         return result
     
+    if sequencer_enabled():
+        return _send_via_sequencer(result, order_wallet_address, order_wallet_mnemonic, dest_address, amount,
+                                   payload, cache_key, on_confirm)
+    
     async def send_tx():
         testnet = os.environ.get("TESTNET", "False") == "True"
-        print(f"[ORDER EXECUTOR] Подключение к {'testnet' if testnet else 'mainnet'}...")
-        
-        # Use the new network config function
-        if NETWORK_CONFIG_AVAILABLE and create_lite_client:
-            client = create_lite_client(testnet)
-        else:
-            # Fallback to direct creation
-            try:
-                from pytoniq import LiteClient
-                if testnet:
-                    client = LiteClient.from_testnet_config(ls_i=1)
-                else:
-                    client = LiteClient.from_mainnet_config(ls_i=1)
-            except Exception as e:
-                print(f"[ORDER EXECUTOR] Failed to create client: {e}")
-                result['message'] = 'Failed to create LiteClient'
-                return False
-        
+        client = await _connect_lite_client(testnet)
         if not client:
-            result['message'] = 'Failed to create LiteClient'
+            result['message'] = 'Failed to connect to TON network'
             return False
         
         try:
-            # Connect with retry logic
-            if NETWORK_CONFIG_AVAILABLE and connect_with_retry:
-                if not await connect_with_retry(client):
-                    result['message'] = 'Failed to connect to TON network'
-                    return False
-            else:
-                # Fallback connection
-                try:
-                    await client.connect()
-                except Exception as e:
-                    print(f"[ORDER EXECUTOR] Connection failed: {e}")
-                    result['message'] = 'Failed to connect to TON network'
-                    return False
-            
             # Get network global ID
             network_global_id = -239 if not testnet else 0
             
@@ -342,9 +419,12 @@ def _maybe_send_transaction(order_wallet_address: str, order_wallet_mnemonic: Op
                 await client.close()
                 return False
             
-            wallet = await WalletV5R1.from_mnemonic(
+            # Ключ подписи выводится из мнемоники один раз и берется из кэша
+            wallet = await wallet_key_cache.get_wallet(
+                cache_key,
                 provider=client,
-                mnemonics=mnemonic_words,
+                mnemonic=order_wallet_mnemonic,
+                wallet_cls=WalletV5R1,
                 wallet_id=2147483409,  # Standard wallet ID
                 network_global_id=network_global_id
             )
@@ -591,10 +671,20 @@ def build_comment_payload(message: str) -> Optional[str]:
 
 
 def execute_order_swap(order: Dict, pool: Dict, wallet_credentials: Dict,
-                       slippage: float = 1.0) -> Dict:
+                       slippage: float = 1.0, before_send: Optional[Callable[[], bool]] = None,
+                       trace: Optional[LatencyTrace] = None,
+                       on_confirm: Optional[Callable[[bool], None]] = None) -> Dict:
     """
     Выполняет реальный обмен при срабатывании ордера
+    
+    Args:
+        before_send: Колбэк непосредственно перед отправкой транзакции; если возвращает False,
+            отправка отменяется (используется outbox для фиксации начала отправки)
+        trace: Трасса задержек исполнения: отмечаются проверки, payload, газ и отправка
+        on_confirm: Итог отправки через секвенсор кошелька (см. _maybe_send_transaction)
     """
+    trace = trace or LatencyTrace()
+    trace.label(dex=pool.get('dex', 'DeDust'), pair=order.get('pair'))
     try:
         order_id = order.get('id', 'unknown')
         order_type = order.get('type', '').lower()
@@ -698,6 +788,7 @@ def execute_order_swap(order: Dict, pool: Dict, wallet_credentials: Dict,
         
         if output == 0 or min_out_nano == 0:
             return _error_result('Не удалось рассчитать выходное количество токенов', transient=False)
+        trace.stamp('checks_done')
         
         # Определяем DEX и адреса
         dex = pool.get('dex', 'DeDust')
@@ -732,6 +823,7 @@ def execute_order_swap(order: Dict, pool: Dict, wallet_credentials: Dict,
             )
         else:
             return _error_result(f'Unsupported DEX: {dex}', transient=False)
+        trace.stamp('payload_built')
         
         # Используем РЕАЛЬНЫЙ газ вместо динамического расчета
         gas = base_gas
@@ -740,6 +832,7 @@ def execute_order_swap(order: Dict, pool: Dict, wallet_credentials: Dict,
             total_amount = amount_nano + gas
         else:
             total_amount = gas
+        trace.stamp('gas_estimated')
         
         result = {
             'success': True,
@@ -771,12 +864,23 @@ def execute_order_swap(order: Dict, pool: Dict, wallet_credentials: Dict,
             required = total_amount / 1e9
             print(f"[ORDER EXECUTOR] Баланс кошелька: {balance:.6f} TON, требуется: {required:.6f} TON (ордер: {order_amount:.6f} TON + газ: {gas/1e9:.6f} TON)")
             if balance < required:
+                result['success'] = False
                 result['transaction_sent'] = False
-                result['message'] = f'Недостаточно средств: баланс {balance:.6f} TON, требуется {required:.6f} TON'
+                result['message'] = result['error'] = f'Недостаточно средств: баланс {balance:.6f} TON, требуется {required:.6f} TON'
                 return result
         
-        send_result = _maybe_send_transaction(order_wallet_address, order_wallet_mnemonic, dest_valid, total_amount, payload)
+        if before_send and not before_send():
+            return _error_result('Отправка отменена: задача исполнения больше не принадлежит этому воркеру', transient=False)
+        
+        send_result = _maybe_send_transaction(order_wallet_address, order_wallet_mnemonic, dest_valid, total_amount, payload,
+                                              cache_key=wallet_credentials.get('cache_key'), on_confirm=on_confirm)
         result.update(send_result)
+        if result.get('transaction_sent'):
+            trace.stamp('sent')
+        else:
+            # Транзакция не ушла: неуспех (transient — повтор через outbox, иначе execution_failed)
+            result['success'] = False
+            result['error'] = result.get('message')
         print(f"[ORDER EXECUTOR] Swap prepared: {order_amount} {from_token} -> ~{output:.6f} {to_token} (комиссия: {order_amount * 0.0055:.6f} {from_token})")
         return result
         
@@ -805,7 +909,8 @@ def transfer_ton_from_wallet(wallet_credentials: Dict, destination: str,
     payload = build_comment_payload(comment) if comment else None
     amount_nano = to_nano(amount_ton, 9)
     dest_valid = validate_address(destination)
-    send_result = _maybe_send_transaction(wallet_address, wallet_mnemonic, dest_valid, amount_nano, payload)
+    send_result = _maybe_send_transaction(wallet_address, wallet_mnemonic, dest_valid, amount_nano, payload,
+                                          cache_key=wallet_credentials.get('cache_key'))
     return {
         'success': send_result.get('transaction_sent', False),
         'message': send_result.get('message'),
@@ -6,11 +6,13 @@ from datetime import datetime
 import asyncio
 import threading
 import traceback  # <-- ДОБАВЛЕНО
-from app import pools, get_current_price, order_wallet_address, get_balance, load_orders, save_order  # <-- ДОБАВЛЕНО load_orders и save_order
+from log_config import debug_sampled, get_logger
+from app import pools, get_current_price, order_wallet_address, get_balance, load_orders, save_order, allocate_wallet_funding  # <-- ДОБАВЛЕНО load_orders и save_order
 
 load_dotenv()
 
 PG_CONN = os.environ.get("PG_CONN", "dbname=lpm user=postgres password=762341 host=localhost port=5432")
+log = get_logger('order_manager')
 
 class OrderManager:
     def __init__(self):
@@ -60,30 +62,52 @@ class OrderManager:
             print(f"[ORDER MANAGER] Table creation error: {e}")
     
     def check_orders_funding(self):
-        """Проверка поступления средств для ордеров"""
+        """Проверка поступления средств для ордеров: один запрос баланса на кошелек ордеров"""
         try:
             with self.conn.cursor() as cur:
                 # Получаем unfunded ордера
-                cur.execute("SELECT * FROM orders WHERE status = 'unfunded'")
+                cur.execute("""
+                    SELECT id, amount, COALESCE(order_wallet, %s) AS wallet, created_at
+                    FROM orders
+                    WHERE status = 'unfunded'
+                    ORDER BY created_at ASC
+                """, (order_wallet_address,))
                 unfunded_orders = cur.fetchall()
+                if not unfunded_orders:
+                    return
                 
-                balance = get_balance(order_wallet_address)
-                updated = False
+                # Уже зарезервированные средства по кошелькам
+                cur.execute("""
+                    SELECT COALESCE(order_wallet, %s) AS wallet, COALESCE(SUM(amount + 0.1), 0)
+                    FROM orders
+                    WHERE status IN ('active', 'waiting_entry', 'opened')
+                    GROUP BY 1
+                """, (order_wallet_address,))
+                reserved_by_wallet = {row[0]: float(row[1]) for row in cur.fetchall()}
                 
-                for order in unfunded_orders:
-                    order_id, order_type, pair, amount, entry_price, stop_loss, take_profit, user_wallet, order_wallet, status, created_at, funded_at, executed_at, execution_price, execution_type, cancelled_at, pnl = order
-                    
-                    required_amount = amount + 0.1  # +0.1 TON для газа
-                    
-                    if balance >= required_amount:
+                pending_by_wallet = {}
+                for order_id, amount, wallet, created_at in unfunded_orders:
+                    if not wallet:
+                        continue
+                    pending_by_wallet.setdefault(wallet, []).append({
+                        'id': order_id, 'amount': float(amount), 'created_at': created_at
+                    })
+                
+                updated = False
+                for wallet, pending_orders in pending_by_wallet.items():
+                    balance = get_balance(wallet)
+                    reserved = reserved_by_wallet.get(wallet, 0.0)
+                    for order in allocate_wallet_funding(balance, reserved, pending_orders):
                         # Обновляем статус ордера
                         cur.execute("""
                             UPDATE orders 
-                            SET status = 'active', funded_at = NOW() 
+                            SET status = 'active', funded_at = NOW(), version = version + 1
                             WHERE id = %s AND status = 'unfunded'
-                        """, (order_id,))
+                        """, (order['id'],))
+                        if cur.rowcount != 1:
+                            continue  # Ордер уже изменен другим процессом
                         updated = True
-                        print(f"[ORDER MANAGER] Order {order_id} funded and activated")
+                        print(f"[ORDER MANAGER] Order {order['id']} funded and activated")
                 
                 if updated:
                     self.conn.commit()
@@ -94,8 +118,8 @@ class OrderManager:
     def check_orders_execution(self):
         """Проверяет выполнение условий для ордеров с фиксированной ценой исполнения"""
         try:
-            orders_data = load_orders()  # <-- ТЕПЕРЬ ФУНКЦИЯ ИМПОРТИРОВАНА
-            active_orders = [o for o in orders_data['orders'] if o['status'] == 'active']
+            orders_data = load_orders(statuses=('active',))  # <-- ТЕПЕРЬ ФУНКЦИЯ ИМПОРТИРОВАНА
+            active_orders = orders_data['orders']
             
             if not active_orders:
                 return
@@ -130,7 +154,9 @@ class OrderManager:
                 stop_loss = order.get('stop_loss')
                 take_profit = order.get('take_profit')
                 
-                print(f"[DEBUG] Checking order {order['id']}: current={current_price}, entry={entry_price}, SL={stop_loss}, TP={take_profit}")
+                debug_sampled(log, "[DEBUG] Checking order %s: current=%s, entry=%s, SL=%s, TP=%s",
+                              order['id'], current_price, entry_price, stop_loss, take_profit,
+                              order_id=order['id'], pair=pair)
                 
                 # Проверяем условия исполнения
                 should_execute = False
@@ -161,7 +187,8 @@ class OrderManager:
                     order['executed_at'] = datetime.now().isoformat()
                     order['execution_type'] = execution_type
                     order['execution_price'] = execution_price
-                    save_order(order)  # <-- ТЕПЕРЬ ФУНКЦИЯ ИМПОРТИРОВАНА
+                    if not save_order(order):  # CAS по версии: ордер мог быть исполнен/отменен другим процессом
+                        continue
                     print(f"[ORDER] Executed {order['id']} at fixed price {execution_price} (Market: {current_price}) - {execution_type}")
                 
         except Exception as e:
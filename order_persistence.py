@@ -0,0 +1,266 @@
+"""
+Пакетное сохранение ордеров с отслеживанием изменившихся полей.
+Ордера, загруженные за цикл проверки, запоминаются (track); при сохранении в пакете пишутся только
+изменившиеся колонки, а все изменения цикла сбрасываются одной транзакцией многострочными
+UPDATE ... FROM (VALUES ...) через execute_values. Ордера без версии только вставляются
+(INSERT ... ON CONFLICT DO NOTHING): существующая строка без проверки версии не перезаписывается.
+Записи — compare-and-set по колонке version и машине состояний (order_state): ордер, измененный
+другим писателем, не перезаписывается: flush возвращает id таких ордеров, а сохранения внутри пакета
+узнают о конфликте через колбэк on_conflict (вызывающий должен перечитать ордер или откатить свое состояние).
+"""
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional
+
+import psycopg2.extras
+
+from order_state import transition_condition, version_condition
+
+# Колонка -> SQL-тип (для приведения значений в VALUES)
+ORDER_COLUMNS = {
+    'id': 'varchar',
+    'type': 'varchar',
+    'pair': 'varchar',
+    'amount': 'numeric',
+    'entry_price': 'numeric',
+    'stop_loss': 'numeric',
+    'take_profit': 'numeric',
+    'user_wallet': 'varchar',
+    'order_wallet': 'varchar',
+    'order_wallet_id': 'integer',
+    'status': 'varchar',
+    'created_at': 'timestamp',
+    'funded_at': 'timestamp',
+    'opened_at': 'timestamp',
+    'executed_at': 'timestamp',
+    'execution_price': 'numeric',
+    'execution_type': 'varchar',
+    'cancelled_at': 'timestamp',
+    'pnl': 'numeric',
+    'price_at_creation': 'numeric',
+    'max_slippage': 'numeric',
+    'execution_error': 'text',
+    'order_type': 'varchar',  # Тип ордера OrderEngine (LIMIT, STOP_LOSS, ...); у legacy long/short — NULL
+    'version': 'integer',
+}
+
+# Колонки, изменяемые после создания ордера (как в ON CONFLICT DO UPDATE у save_order)
+UPDATABLE_COLUMNS = (
+    'stop_loss', 'take_profit', 'amount', 'status', 'funded_at', 'opened_at', 'executed_at',
+    'execution_price', 'execution_type', 'cancelled_at', 'pnl', 'max_slippage', 'execution_error',
+    'order_wallet_id',
+)
+
+
+class OrderPersistence:
+    """
+    Args:
+        connection_factory: Контекстный менеджер подключения к БД (app.get_db_connection)
+        defaults: Значения колонок по умолчанию, если в ордере их нет (например, pnl и max_slippage)
+    """
+
+    def __init__(self, connection_factory: Callable, defaults: Optional[Dict] = None):
+        self.connection_factory = connection_factory
+        self.defaults = dict(defaults or {})
+        self._persisted: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stats = {'flushes': 0, 'updated': 0, 'upserted': 0, 'statements': 0, 'conflicts': 0}
+        self.last_conflicts: List[str] = []
+
+    def _row(self, order: Dict) -> Dict:
+        row = {col: order.get(col, self.defaults.get(col)) for col in ORDER_COLUMNS}
+        if row['version'] is None:
+            # Ожидаемая версия — прочитанная из БД (order['version'] обновляется после записи)
+            with self._lock:
+                persisted = self._persisted.get(order['id'])
+            row['version'] = persisted['version'] if persisted else None
+        return row
+
+    def track(self, orders: Iterable[Dict], replace: bool = False):
+        """
+        Запоминает состояние ордеров, загруженных из БД (база для вычисления изменений).
+        replace=True — заменить все отслеживаемое состояние (полная загрузка ордеров за цикл)
+        """
+        rows = [self._row(order) for order in orders]
+        with self._lock:
+            if replace:
+                self._persisted = {}
+            for row in rows:
+                self._persisted[row['id']] = row
+
+    def forget(self, order_id: str):
+        with self._lock:
+            self._persisted.pop(order_id, None)
+
+    def dirty_columns(self, order: Dict) -> Optional[List[str]]:
+        """Изменившиеся колонки ордера; None — ордер не отслеживается (нужен полный UPSERT)"""
+        with self._lock:
+            persisted = self._persisted.get(order['id'])
+        if persisted is None:
+            return None
+        row = self._row(order)
+        return [col for col in UPDATABLE_COLUMNS if row[col] != persisted[col]]
+
+    @contextmanager
+    def batch(self):
+        """
+        Пакет сохранений текущего потока: save() внутри пакета только копит ордера,
+        запись выполняется одной транзакцией при выходе (вложенные пакеты сливаются с внешним)
+        """
+        pending = getattr(self._local, 'pending', None)
+        if pending is not None:
+            yield
+            return
+        self._local.pending = {}
+        self._local.on_conflict = {}
+        try:
+            yield
+        finally:
+            orders = list(self._local.pending.values())
+            callbacks = self._local.on_conflict
+            self._local.pending = None
+            self._local.on_conflict = None
+            conflicts = self.flush(orders)
+            by_id = {order['id']: order for order in orders}
+            for order_id in conflicts:
+                callback = callbacks.get(order_id)
+                if callback is None:
+                    continue
+                try:
+                    callback(by_id[order_id])
+                except Exception as e:
+                    print(f"[ПРИЛОЖЕНИЕ] Ошибка обработки конфликта записи ордера {order_id}: {e}")
+
+    def _defer(self, orders: List[Dict], on_conflict: Optional[Callable[[Dict], None]]) -> bool:
+        """Откладывает ордера до конца пакета текущего потока; False — пакета нет"""
+        pending = getattr(self._local, 'pending', None)
+        if pending is None:
+            return False
+        for order in orders:
+            pending[order['id']] = order
+            if on_conflict is not None:
+                self._local.on_conflict[order['id']] = on_conflict
+            else:
+                self._local.on_conflict.pop(order['id'], None)
+        return True
+
+    def save(self, order: Dict, on_conflict: Optional[Callable[[Dict], None]] = None) -> bool:
+        """
+        Сохраняет ордер: в пакете — откладывает до конца пакета (True; об отклоненной записи сообщит
+        on_conflict(order) после записи пакета), иначе пишет сразу и возвращает, прошла ли запись
+        """
+        if self._defer([order], on_conflict):
+            return True
+        if self.flush([order]):
+            if on_conflict is not None:
+                on_conflict(order)
+            return False
+        return True
+
+    def save_many(self, orders: Iterable[Dict], on_conflict: Optional[Callable[[Dict], None]] = None) -> bool:
+        """Как save для набора ордеров; вне пакета True — записаны все"""
+        orders = list(orders)
+        if self._defer(orders, on_conflict):
+            return True
+        conflicts = set(self.flush(orders))
+        if on_conflict is not None:
+            for order in orders:
+                if order['id'] in conflicts:
+                    on_conflict(order)
+        return not conflicts
+
+    def flush(self, orders: List[Dict], cur=None) -> List[str]:
+        """
+        Записывает ордера: отслеживаемые — UPDATE только изменившихся колонок (одна команда на набор колонок),
+        неотслеживаемые с версией — UPDATE всех изменяемых колонок, без версии — многострочный INSERT
+        (уже существующая строка — конфликт). Без курсора выполняется в собственной транзакции.
+
+        Returns:
+            list: id ордеров, запись которых не прошла (CAS проиграл или ошибка БД — тогда все записываемые)
+        """
+        if not orders:
+            return []
+        orders = list({order['id']: order for order in orders}.values())
+        updates: Dict[tuple, List[Dict]] = {}
+        upserts = []
+        for order in orders:
+            dirty = self.dirty_columns(order)
+            if dirty is None and order.get('version') is not None:
+                dirty = list(UPDATABLE_COLUMNS) # Версия известна — CAS-обновление всех изменяемых колонок
+            if dirty is None:
+                upserts.append(order)
+            elif dirty:
+                updates.setdefault(tuple(dirty), []).append(order)
+        if not updates and not upserts:
+            return []
+        try:
+            if cur is not None:
+                versions = self._write(cur, updates, upserts)
+            else:
+                with self.connection_factory() as conn:
+                    with conn.cursor() as own_cur:
+                        versions = self._write(own_cur, updates, upserts)
+                        conn.commit()
+        except Exception as e:
+            print(f"[ПРИЛОЖЕНИЕ] Ошибка пакетного сохранения ордеров ({len(orders)}): {e}")
+            failed = [order['id'] for group in updates.values() for order in group] + [order['id'] for order in upserts]
+            for order_id in failed:
+                self.forget(order_id)
+            return failed
+        written = [order for group in updates.values() for order in group] + upserts
+        won = []
+        conflicts = []
+        for order in written:
+            if order['id'] in versions:
+                order['version'] = versions[order['id']]
+                won.append(order)
+            else:
+                conflicts.append(order['id'])
+                self.forget(order['id']) # Перечитается на следующем цикле
+        self.track(won)
+        if conflicts:
+            print(f"[ПРИЛОЖЕНИЕ] Ордера изменены параллельно, запись отклонена: {', '.join(conflicts)}")
+        with self._lock:
+            self.last_conflicts = conflicts
+            self.stats['flushes'] += 1
+            self.stats['updated'] += sum(len(group) for group in updates.values())
+            self.stats['upserted'] += len(upserts)
+            self.stats['statements'] += len(updates) + (1 if upserts else 0)
+            self.stats['conflicts'] += len(conflicts)
+        return conflicts
+
+    def _write(self, cur, updates: Dict[tuple, List[Dict]], upserts: List[Dict]) -> Dict[str, int]:
+        """Выполняет CAS-записи, возвращает {id: новая версия} выигравших ордеров"""
+        versions = {}
+        for columns, group in updates.items():
+            cols = ('id', 'version') + columns
+            set_clause = ', '.join(f"{col} = v.{col}" for col in columns)
+            condition = version_condition('o.version', 'v.version')
+            if 'status' in columns:
+                condition += ' AND ' + transition_condition('o.status', 'v.status')
+            template = '(' + ', '.join(f"%s::{ORDER_COLUMNS[col]}" for col in cols) + ')'
+            rows = [tuple(self._row(order)[col] for col in cols) for order in group]
+            result = psycopg2.extras.execute_values(
+                cur,
+                f"""UPDATE orders AS o SET {set_clause}, version = o.version + 1
+                    FROM (VALUES %s) AS v({', '.join(cols)})
+                    WHERE o.id = v.id AND {condition}
+                    RETURNING o.id, o.version""",
+                rows, template=template, page_size=len(rows), fetch=True
+            )
+            versions.update(dict(result))
+        if upserts:
+            # Версия неизвестна: только вставка нового ордера, перезапись существующей строки — конфликт
+            cols = [col for col in ORDER_COLUMNS if col != 'version']
+            template = '(' + ', '.join(f"%s::{ORDER_COLUMNS[col]}" for col in cols) + ')'
+            rows = [tuple(self._row(order)[col] for col in cols) for order in upserts]
+            result = psycopg2.extras.execute_values(
+                cur,
+                f"""INSERT INTO orders ({', '.join(cols)}) VALUES %s
+                    ON CONFLICT (id) DO NOTHING
+                    RETURNING id, version""",
+                rows, template=template, page_size=len(rows), fetch=True
+            )
+            versions.update(dict(result))
+        return versions
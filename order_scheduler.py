@@ -0,0 +1,137 @@
+"""
+Единый планировщик проверки ордеров.
+Один процесс получает цены (PriceWatcher публикует только изменившиеся пары) и раздает их
+подключаемым оценщикам ордеров: legacy long/short (app.py) и расширенные ордера order_system
+(лимит/стоп/трейлинг/OCO через OrderEngine). Раз в heartbeat — полный проход по всем парам.
+"""
+import threading
+import time
+import traceback
+from contextlib import nullcontext
+from typing import Callable, Dict, Iterable, List, Optional
+
+from price_events import PriceEventBus, PriceWatcher
+
+
+class OrderEvaluator:
+    """
+    Оценщик ордеров одного вида. Получает снимки цен {pair: {'long', 'short', 'primary'}}
+    изменившихся пар (full=False) или всех пар при полном проходе (full=True).
+    """
+    name = 'evaluator'
+
+    def evaluate(self, prices: Dict[str, dict], full: bool):
+        raise NotImplementedError
+
+
+class OrderScheduler:
+    """
+    Args:
+        bus: Шина событий цены
+        watcher: Источник цен (единственный опрос пулов в процессе)
+        pairs_provider: Пары, которые проверяет этот процесс
+        heartbeat_interval: Интервал полного прохода, сек
+        on_heartbeat: Вызывается перед полным проходом (пополнение, очередь исполнения)
+        tick_context: Фабрика контекста вокруг одного прохода (например, пакет записи ордеров)
+    """
+
+    def __init__(self, bus: PriceEventBus, watcher: PriceWatcher,
+                 pairs_provider: Callable[[], Iterable[str]], heartbeat_interval: float = 30.0,
+                 on_heartbeat: Optional[Callable[[], None]] = None,
+                 tick_context: Optional[Callable] = None, name: str = "ПЛАНИРОВЩИК"):
+        self.bus = bus
+        self.watcher = watcher
+        self.pairs_provider = pairs_provider
+        self.heartbeat_interval = heartbeat_interval
+        self.on_heartbeat = on_heartbeat
+        self.tick_context = tick_context or nullcontext
+        self.name = name
+        self.running = False
+        self._evaluators: List[OrderEvaluator] = []
+        self._pending: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._metrics = {'event_passes': 0, 'full_passes': 0, 'last_pass_ms': 0.0, 'errors': 0}
+
+    def register(self, evaluator: OrderEvaluator):
+        """Подключает оценщик (повторная регистрация того же объекта игнорируется)"""
+        with self._lock:
+            if evaluator not in self._evaluators:
+                self._evaluators.append(evaluator)
+                print(f"[{self.name}] Подключен оценщик {evaluator.name}")
+
+    def unregister(self, evaluator: OrderEvaluator):
+        with self._lock:
+            if evaluator in self._evaluators:
+                self._evaluators.remove(evaluator)
+
+    def _on_price_change(self, pair, snapshot, previous):
+        with self._lock:
+            self._pending[pair] = snapshot # Последний снимок пары перекрывает предыдущие
+        self._wakeup.set()
+
+    def run_once(self, prices: Dict[str, dict], full: bool):
+        """Один проход всех оценщиков по снимкам цен"""
+        with self._lock:
+            evaluators = list(self._evaluators)
+        started = time.monotonic()
+        with self.tick_context():
+            if full and self.on_heartbeat:
+                self.on_heartbeat()
+            for evaluator in evaluators:
+                try:
+                    evaluator.evaluate(prices, full)
+                except Exception as e:
+                    self._metrics['errors'] += 1
+                    print(f"[{self.name}] Ошибка оценщика {evaluator.name}: {e}")
+                    traceback.print_exc()
+        self._metrics['full_passes' if full else 'event_passes'] += 1
+        self._metrics['last_pass_ms'] = (time.monotonic() - started) * 1000
+
+    def start(self):
+        """Подписка на цены, запуск опроса цен и цикла проверки"""
+        if self.running:
+            return None
+        self.running = True
+        self.bus.subscribe(self._on_price_change)
+
+        def scheduler_loop():
+            next_heartbeat = 0.0
+            while self.running:
+                try:
+                    self._wakeup.wait(max(next_heartbeat - time.monotonic(), 0))
+                    self._wakeup.clear()
+                    with self._lock:
+                        changed = dict(self._pending)
+                        self._pending.clear()
+                    if time.monotonic() >= next_heartbeat:
+                        # Полный проход; для неизменившихся пар берем последний известный снимок
+                        prices = {pair: self.watcher.latest(pair) for pair in self.pairs_provider()}
+                        prices = {pair: snap for pair, snap in prices.items() if snap}
+                        prices.update(changed)
+                        self.run_once(prices, full=True)
+                        next_heartbeat = time.monotonic() + self.heartbeat_interval
+                    elif changed:
+                        self.run_once(changed, full=False)
+                except Exception as e:
+                    self._metrics['errors'] += 1
+                    print(f"[{self.name}] Ошибка: {e}")
+                    traceback.print_exc()
+                    time.sleep(5)
+
+        scheduler_thread = threading.Thread(target=scheduler_loop)
+        scheduler_thread.daemon = True
+        scheduler_thread.start()
+        self.watcher.start()
+        return scheduler_thread
+
+    def stop(self):
+        self.running = False
+        self.watcher.stop()
+        self.bus.unsubscribe(self._on_price_change)
+        self._wakeup.set()
+
+    def get_metrics(self) -> Dict:
+        with self._lock:
+            evaluators = [e.name for e in self._evaluators]
+        return dict(self._metrics, evaluators=evaluators, running=self.running, watcher=self.watcher.get_metrics())
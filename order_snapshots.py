@@ -0,0 +1,163 @@
+"""
+Снимки состояния OrderProcessor и журнал изменений ордеров для теплого старта OrderEngine.
+Снимок — pickle ордеров процессора как есть (Decimal, трейлинг с экстремумами и текущим стопом,
+OCO-связи, версия строки в БД) вместе с позицией журнала order_change_log. При старте снимок
+загружается, а из БД перечитываются только ордера, измененные после этой позиции,
+поэтому старт не зависит от общего числа ордеров. Журнал пишет триггер на таблице orders.
+"""
+import os
+import pickle
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+ORDER_SNAPSHOT_PATH = os.environ.get("ORDER_SNAPSHOT_PATH", "order_engine.snapshot")
+ORDER_SNAPSHOT_SAVE_INTERVAL = float(os.environ.get("ORDER_SNAPSHOT_SAVE_INTERVAL", "60"))
+# Журнал хранится дольше самого старого пригодного снимка; снимок старше — полная загрузка из БД
+ORDER_CHANGE_LOG_RETENTION_HOURS = float(os.environ.get("ORDER_CHANGE_LOG_RETENTION_HOURS", "24"))
+# seq выдается до фиксации транзакции: строки с меньшим seq могли зафиксироваться после снимка,
+# поэтому воспроизводится и окно по времени перед снимком (повтор идемпотентен)
+ORDER_CHANGE_LOG_SLACK_SECONDS = float(os.environ.get("ORDER_CHANGE_LOG_SLACK_SECONDS", "60"))
+
+# 2 — без legacy long/short строк (снимки формата 1 могли их содержать)
+SNAPSHOT_FORMAT = 2
+
+
+class OrderChangeLog:
+    """
+    Args:
+        connection_factory: Контекстный менеджер подключения к БД (app.get_db_connection)
+    """
+
+    def __init__(self, connection_factory: Callable):
+        self.connection_factory = connection_factory
+
+    @staticmethod
+    def init_table(cur):
+        """Таблица журнала и триггер на orders (вызывается из init_db)"""
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS order_change_log (
+                seq BIGSERIAL PRIMARY KEY,
+                order_id VARCHAR(64) NOT NULL,
+                status VARCHAR(32),
+                version INTEGER,
+                changed_at TIMESTAMP NOT NULL DEFAULT NOW()
+            )
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_order_change_log_changed_at ON order_change_log(changed_at)")
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION log_order_change() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'DELETE' THEN
+                    INSERT INTO order_change_log (order_id, status, version) VALUES (OLD.id, NULL, NULL);
+                ELSE
+                    INSERT INTO order_change_log (order_id, status, version) VALUES (NEW.id, NEW.status, NEW.version);
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        """)
+        cur.execute("DROP TRIGGER IF EXISTS orders_change_log ON orders")
+        cur.execute("""
+            CREATE TRIGGER orders_change_log
+            AFTER INSERT OR UPDATE OR DELETE ON orders
+            FOR EACH ROW EXECUTE FUNCTION log_order_change()
+        """)
+
+    def position(self) -> Tuple[int, datetime]:
+        """
+        Текущая позиция журнала и время БД (берется до снятия состояния процессора).
+        LOCALTIMESTAMP, а не NOW(): время без пояса, как changed_at и datetime.now() в read_snapshot
+        """
+        with self.connection_factory() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT COALESCE(MAX(seq), 0), LOCALTIMESTAMP FROM order_change_log")
+                seq, now = cur.fetchone()
+        return seq, now
+
+    def changed_since(self, seq: int, taken_at: datetime) -> List[str]:
+        """id ордеров, измененных после позиции снимка (с окном ORDER_CHANGE_LOG_SLACK_SECONDS)"""
+        with self.connection_factory() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT DISTINCT order_id FROM order_change_log
+                    WHERE seq > %s OR changed_at >= %s
+                """, (seq, taken_at - timedelta(seconds=ORDER_CHANGE_LOG_SLACK_SECONDS)))
+                return [row[0] for row in cur.fetchall()]
+
+    def prune(self) -> int:
+        """Удаляет записи старше срока хранения"""
+        with self.connection_factory() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "DELETE FROM order_change_log WHERE changed_at < NOW() - make_interval(hours => %s)",
+                    (ORDER_CHANGE_LOG_RETENTION_HOURS,)
+                )
+                deleted = cur.rowcount
+                conn.commit()
+        return deleted
+
+
+def dump_processor(processor, position: Tuple[int, datetime]) -> bytes:
+    """Снимок процессора (вызывается в потоке-владельце процессора)"""
+    processor.sync_trailing()
+    seq, taken_at = position
+    return pickle.dumps({
+        'format': SNAPSHOT_FORMAT,
+        'seq': seq,
+        'taken_at': taken_at,
+        'orders': list(processor.orders.values()),
+    }, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def write_snapshot(data: bytes, path: str = ORDER_SNAPSHOT_PATH):
+    """Атомарная запись: читатель видит либо старый, либо новый снимок целиком"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path: str = ORDER_SNAPSHOT_PATH) -> Optional[Dict]:
+    """Снимок, пригодный для теплого старта, или None (нет файла, другой формат, старше журнала)"""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            snapshot = pickle.load(f)
+    except Exception as e:
+        print(f"[СНИМОК] Не удалось прочитать снимок {path}: {e}")
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get('format') != SNAPSHOT_FORMAT:
+        print(f"[СНИМОК] Снимок {path} другого формата, игнорируем")
+        return None
+    try:
+        taken_at = snapshot['taken_at']
+        if taken_at.tzinfo is not None:
+            # Снимки, записанные до перехода на LOCALTIMESTAMP, хранят время с поясом
+            taken_at = taken_at.astimezone().replace(tzinfo=None)
+            snapshot['taken_at'] = taken_at
+        stale = taken_at < datetime.now() - timedelta(hours=ORDER_CHANGE_LOG_RETENTION_HOURS) + timedelta(minutes=5)
+    except Exception as e:
+        print(f"[СНИМОК] Некорректное время снимка {path}: {e}")
+        return None
+    if stale:
+        print(f"[СНИМОК] Снимок {path} от {taken_at} старше журнала изменений, нужна полная загрузка")
+        return None
+    return snapshot
+
+
+class SnapshotTimer:
+    """Интервал между снимками"""
+
+    def __init__(self, interval: float = ORDER_SNAPSHOT_SAVE_INTERVAL):
+        self.interval = interval
+        self._last = time.monotonic()
+
+    def due(self) -> bool:
+        return time.monotonic() - self._last >= self.interval
+
+    def reset(self):
+        self._last = time.monotonic()
@@ -0,0 +1,89 @@
+"""
+Машина состояний ордеров и оптимистичная блокировка (колонка version).
+Любая запись ордера — compare-and-set: UPDATE проходит, только если версия в БД совпадает
+с прочитанной и переход статуса разрешен. Проигравший писатель получает отказ и перечитывает ордер,
+поэтому несколько проверяющих процессов и API-воркеров работают без глобальных блокировок.
+"""
+from typing import Dict, Optional
+
+# Разрешенные переходы статусов (кроме записи без смены статуса)
+ORDER_TRANSITIONS = {
+    'unfunded': ('waiting_entry', 'active', 'cancelled'),
+    'active': ('waiting_entry', 'unfunded', 'execution_failed', 'cancelled'),
+    'waiting_entry': ('opened', 'unfunded', 'execution_failed', 'cancelled'),
+    'opened': ('waiting_entry', 'execution_failed', 'cancelled'),
+    'executed': (),
+    'execution_failed': (),
+    'cancelled': (),
+}
+# Переходы в executed — только у пути исполнения (задача outbox, завершившая обмен);
+# остальные писатели (цикл проверки, OrderEngine, API) перевести ордер в executed не могут
+EXECUTION_TRANSITIONS = {
+    'active': ('executed',),
+    'waiting_entry': ('executed',),
+    'opened': ('executed',),
+}
+
+
+def _transitions(execution: bool) -> Dict[str, tuple]:
+    if not execution:
+        return ORDER_TRANSITIONS
+    return {
+        source: targets + EXECUTION_TRANSITIONS.get(source, ())
+        for source, targets in ORDER_TRANSITIONS.items()
+    }
+
+
+def can_transition(from_status: Optional[str], to_status: str, execution: bool = False) -> bool:
+    if from_status == to_status:
+        return True
+    return to_status in _transitions(execution).get(from_status, ())
+
+
+def transition_condition(old_status: str, new_status: str, execution: bool = False) -> str:
+    """SQL-условие допустимости перехода для выражений старого и нового статуса (execution — путь исполнения)"""
+    pairs = ', '.join(
+        f"('{source}', '{target}')"
+        for source, targets in _transitions(execution).items()
+        for target in targets
+    )
+    return f"({old_status} = {new_status} OR ({old_status}, {new_status}) IN ({pairs}))"
+
+
+def version_condition(current_version: str, expected_version: str) -> str:
+    """
+    SQL-условие CAS по версии для обновления существующей строки. Ожидаемая версия NULL условию
+    не удовлетворяет: ордер без версии можно только вставить (INSERT), но не перезаписать
+    """
+    return f"({current_version} = {expected_version})"
+
+
+def transition_order(cur, order: Dict, new_status: str, **fields) -> bool:
+    """
+    CAS-переход ордера: меняет статус и поля, если версия и статус в БД совпадают с прочитанными.
+
+    Args:
+        cur: Курсор (транзакция вызывающего)
+        order: Ордер в формате load_orders (нужны id, status, version)
+        new_status: Новый статус
+        fields: Остальные изменяемые колонки
+
+    Returns:
+        bool: True — переход выигран (order обновлен на месте, версия увеличена)
+    """
+    if not can_transition(order.get('status'), new_status):
+        return False
+    assignments = ', '.join(f"{column} = %s" for column in fields)
+    cur.execute(f"""
+        UPDATE orders
+        SET status = %s, {assignments + ', ' if assignments else ''}version = version + 1
+        WHERE id = %s AND status = %s AND version = %s
+        RETURNING version
+    """, [new_status] + list(fields.values()) + [order['id'], order.get('status'), order.get('version')])
+    row = cur.fetchone()
+    if not row:
+        return False
+    order.update(fields)
+    order['status'] = new_status
+    order['version'] = row[0]
+    return True
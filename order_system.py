@@ -2,12 +2,17 @@
 Комплексная система управления ордерами для криптовалютной биржи
 Включает: лимитные, рыночные, стоп-ордера, трейлинг-стопы, OCO ордера
 """
+import heapq
+import itertools
 from enum import Enum
 from dataclasses import dataclass, field
-from typing import Optional, Dict, List, Set
+from typing import Optional, Dict, Iterable, List, Sequence, Set, Tuple, Union
 from datetime import datetime
 from decimal import Decimal
 
+from slippage_stats import SlippageStats
+from trailing_book import NUMPY_AVAILABLE, TRAILING_BOOK_MIN_ORDERS, TrailingBook
+
 
 class OrderType(Enum):
     """Типы ордеров"""
@@ -95,8 +100,8 @@ class Order:
     symbol: str                        # Пара (например, "TON-USDT")
     quantity: Decimal                  # Количество
     type: OrderType
-    status: OrderStatus = OrderStatus.PENDING
     side: PositionSide                  # LONG или SHORT
+    status: OrderStatus = OrderStatus.PENDING
     
     # Цены
     limit_price: Optional[Decimal] = None      # Для лимитных ордеров
@@ -159,6 +164,8 @@ class Order:
             'trailing_type': self.trailing.type.value if self.trailing else None,
             'trailing_distance': float(self.trailing.distance) if self.trailing else None,
             'trailing_current_stop': float(self.trailing.current_stop) if self.trailing and self.trailing.current_stop else None,
+            'trailing_highest_price': float(self.trailing.highest_price) if self.trailing and self.trailing.highest_price else None,
+            'trailing_lowest_price': float(self.trailing.lowest_price) if self.trailing and self.trailing.lowest_price else None,
         }
     
     @classmethod
@@ -169,7 +176,9 @@ class Order:
             trailing = TrailingConfig(
                 type=TrailingType(data['trailing_type']),
                 distance=Decimal(str(data['trailing_distance'])),
-                current_stop=Decimal(str(data['trailing_current_stop'])) if data.get('trailing_current_stop') else None
+                current_stop=Decimal(str(data['trailing_current_stop'])) if data.get('trailing_current_stop') else None,
+                highest_price=Decimal(str(data['trailing_highest_price'])) if data.get('trailing_highest_price') else None,
+                lowest_price=Decimal(str(data['trailing_lowest_price'])) if data.get('trailing_lowest_price') else None
             )
         
         order = cls(
@@ -201,34 +210,305 @@ class Order:
         return order
 
 
+@dataclass
+class OcoGroup:
+    """
+    OCO-группа: ноги и флаг разрешения. Исполнение ноги только ставит resolved_by (O(1)),
+    остальные ноги считаются снятыми с этого момента и отменяются лениво (reap_oco)
+    """
+    id: str
+    order_ids: Set[str] = field(default_factory=set)
+    resolved_by: Optional[str] = None  # id исполненной ноги
+
+    @property
+    def resolved(self) -> bool:
+        return self.resolved_by is not None
+
+
+# Направление срабатывания триггера: 'up' — цена поднялась до уровня (min-куча),
+# 'down' — опустилась до уровня (max-куча)
+STOP_TRIGGER_DIRECTIONS = {
+    (OrderType.STOP_LOSS, PositionSide.LONG): 'down',
+    (OrderType.STOP_LOSS, PositionSide.SHORT): 'up',
+    (OrderType.TAKE_PROFIT, PositionSide.LONG): 'up',
+    (OrderType.TAKE_PROFIT, PositionSide.SHORT): 'down',
+    (OrderType.STOP_ENTRY, PositionSide.LONG): 'up',
+    (OrderType.STOP_ENTRY, PositionSide.SHORT): 'down',
+}
+LIMIT_TRIGGER_DIRECTIONS = {
+    PositionSide.LONG: 'down',   # Покупка не выше limit_price
+    PositionSide.SHORT: 'up',    # Продажа не ниже limit_price
+}
+# Ноги OCO срабатывают по take_profit / stop_loss
+OCO_TRIGGER_DIRECTIONS = {
+    (OrderType.TAKE_PROFIT, PositionSide.LONG): 'up',
+    (OrderType.TAKE_PROFIT, PositionSide.SHORT): 'down',
+    (OrderType.STOP_LOSS, PositionSide.LONG): 'down',
+    (OrderType.STOP_LOSS, PositionSide.SHORT): 'up',
+}
+TRIGGER_KINDS = ('stop', 'limit', 'oco')
+
+
+def price_key(value: Decimal) -> Union[int, Decimal]:
+    """
+    Уровень в очередях триггеров: целое в нано-единицах (10^-9, как nanoton) —
+    в тике сравниваются целые, а не Decimal. Уровень с большей точностью остается Decimal
+    в том же масштабе (int и Decimal сравниваются точно)
+    """
+    scaled = value.scaleb(9)
+    integral = scaled.to_integral_value()
+    return int(integral) if scaled == integral else scaled
+
+
+def bar_path(open_price: Decimal, high: Decimal, low: Decimal, close: Decimal) -> List[Decimal]:
+    """
+    Предполагаемый путь цены внутри бара: растущий бар (close >= open) — O-L-H-C,
+    падающий — O-H-L-C (экстремум, противоположный итоговому движению, достигнут раньше)
+    """
+    if close >= open_price:
+        return [open_price, low, high, close]
+    return [open_price, high, low, close]
+
+
+def zigzag(points: Sequence[Tuple[object, Decimal]]) -> List[Tuple[object, Decimal]]:
+    """
+    Оставляет только точки разворота пути (time, price): повторы и промежуточные точки
+    монотонного участка не меняют ни пересечение уровней, ни экстремумы трейлинга
+    """
+    result: List[Tuple[object, Decimal]] = []
+    for point in points:
+        if result and point[1] == result[-1][1]:
+            continue
+        if len(result) >= 2:
+            before, last = result[-2][1], result[-1][1]
+            if before < last < point[1] or before > last > point[1]:
+                result[-1] = point  # Движение продолжается — середина участка не нужна
+                continue
+        result.append(point)
+    return result
+
+
+def _tick_datetime(ts) -> Optional[datetime]:
+    if ts is None or isinstance(ts, datetime):
+        return ts
+    return datetime.fromtimestamp(float(ts))
+
+
 class OrderProcessor:
     """Процессор обработки ордеров с приоритетами"""
     
-    def __init__(self, price_feed_callback):
+    def __init__(self, price_feed_callback, slippage_stats: Optional[SlippageStats] = None):
         """
         Args:
             price_feed_callback: Функция получения текущей цены (symbol -> Decimal)
+            slippage_stats: Общая статистика проскальзывания (по умолчанию — своя, только в памяти)
         """
         self.price_feed = price_feed_callback
         self.orders: Dict[str, Order] = {}
-        self.oco_groups: Dict[str, Set[str]] = {}  # group_id -> set of order_ids
-        self.slippage_stats: List[Dict] = []  # Статистика проскальзывания
+        self.oco_groups: Dict[str, OcoGroup] = {}  # group_id -> группа
+        self._resolved_oco: List[str] = []  # Разрешенные группы, ноги которых еще не отменены
+        self.slippage_stats = slippage_stats or SlippageStats()  # Статистика проскальзывания
+        self._tick_time: Optional[datetime] = None  # Время обрабатываемого тика (догоняющая обработка)
+        # Индекс (symbol, type, status) -> {order_id: order}: тик перебирает только нужные корзины
+        self._buckets: Dict[Tuple[str, OrderType, OrderStatus], Dict[str, Order]] = {}
+        self._bucket_keys: Dict[str, Tuple[str, OrderType, OrderStatus]] = {}
+        # Активные ордера с трейлингом по символу (трейлинг бывает у ордера любого типа)
+        self._trailing_index: Dict[str, Dict[str, Order]] = {}
+        # Ноги OCO с трейлингом: их stop_loss меняется каждый тик, поэтому они не в куче 'oco'
+        self._oco_trailing: Dict[str, Dict[str, Order]] = {}
+        # Векторные книги трейлингов для символов с большим числом трейлинг-ордеров (нужен numpy)
+        self._trailing_books: Dict[str, TrailingBook] = {}
+        # Очереди триггеров (symbol, 'stop'/'limit'/'oco', направление) -> куча (ключ, seq, order_id).
+        # Удаление ленивое: запись действительна, только пока совпадает с _trigger_entries[(order_id, вид)]
+        # Ключ кучи — price_key(уровень) (для 'down' — с обратным знаком)
+        self._trigger_heaps: Dict[Tuple[str, str, str], List[Tuple[Union[int, Decimal], int, str]]] = {}
+        self._trigger_entries: Dict[Tuple[str, str], Tuple[Tuple[str, str, str], int]] = {}
+        self._trigger_live: Dict[Tuple[str, str, str], int] = {}
+        self._trigger_seq = itertools.count()
+    
+    def _index(self, order: Order):
+        """Помещает ордер в корзину по текущим symbol/type/status"""
+        self._unindex(order.id)
+        key = (order.symbol, order.type, order.status)
+        self._buckets.setdefault(key, {})[order.id] = order
+        self._bucket_keys[order.id] = key
+        if order.trailing and order.status == OrderStatus.ACTIVE:
+            trailing = self._trailing_index.setdefault(order.symbol, {})
+            trailing[order.id] = order
+            if order.oco_group_id and (order.type, order.side) in OCO_TRIGGER_DIRECTIONS:
+                self._oco_trailing.setdefault(order.symbol, {})[order.id] = order
+            book = self._trailing_books.get(order.symbol)
+            if book is not None:
+                book.add(order)
+            elif NUMPY_AVAILABLE and len(trailing) >= TRAILING_BOOK_MIN_ORDERS:
+                book = self._trailing_books[order.symbol] = TrailingBook(order.symbol)
+                for trailing_order in trailing.values():
+                    book.add(trailing_order)
+        self._push_trigger(order)
+    
+    def _unindex(self, order_id: str):
+        self._drop_trigger(order_id)
+        key = self._bucket_keys.pop(order_id, None)
+        if key is None:
+            return
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            bucket.pop(order_id, None)
+            if not bucket:
+                del self._buckets[key]
+        trailing = self._trailing_index.get(key[0])
+        if trailing is not None:
+            trailing.pop(order_id, None)
+            if not trailing:
+                del self._trailing_index[key[0]]
+        oco_trailing = self._oco_trailing.get(key[0])
+        if oco_trailing is not None:
+            oco_trailing.pop(order_id, None)
+            if not oco_trailing:
+                del self._oco_trailing[key[0]]
+        book = self._trailing_books.get(key[0])
+        if book is not None:
+            book.remove(order_id)  # Значения книги переносятся в ордер
+            if not len(book):
+                del self._trailing_books[key[0]]
+    
+    def reindex(self, order: Order):
+        """
+        Перестраивает индекс ордера после изменения symbol/type/status/trailing
+        или stop_price/limit_price вне процессора. Трейлинг и stop_loss ордера из векторной
+        книги перед внешним изменением нужно забрать через sync_trailing
+        """
+        if order.id in self.orders:
+            self._index(order)
+    
+    @staticmethod
+    def _triggers_of(order: Order) -> List[Tuple[str, str, Decimal]]:
+        """Триггеры ордера: (очередь 'stop'/'limit'/'oco', направление, уровень срабатывания)"""
+        if order.status != OrderStatus.ACTIVE:
+            return []
+        triggers = []
+        if order.type == OrderType.LIMIT:
+            if order.limit_price:
+                triggers.append(('limit', LIMIT_TRIGGER_DIRECTIONS[order.side], order.limit_price))
+        else:
+            direction = STOP_TRIGGER_DIRECTIONS.get((order.type, order.side))
+            if direction and order.stop_price:
+                triggers.append(('stop', direction, order.stop_price))
+        if order.oco_group_id and not order.trailing:
+            direction = OCO_TRIGGER_DIRECTIONS.get((order.type, order.side))
+            level = order.take_profit if order.type == OrderType.TAKE_PROFIT else order.stop_loss
+            if direction and level is not None:
+                triggers.append(('oco', direction, level))
+        return triggers
+    
+    def _push_trigger(self, order: Order):
+        for kind, direction, level in self._triggers_of(order):
+            heap_key = (order.symbol, kind, direction)
+            heap = self._trigger_heaps.setdefault(heap_key, [])
+            seq = next(self._trigger_seq)
+            key = price_key(level)
+            heapq.heappush(heap, (key if direction == 'up' else -key, seq, order.id))
+            self._trigger_entries[(order.id, kind)] = (heap_key, seq)
+            self._trigger_live[heap_key] = self._trigger_live.get(heap_key, 0) + 1
+            # Устаревших записей накопилось больше, чем живых — пересобираем кучу
+            if len(heap) > 2 * self._trigger_live[heap_key] + 64:
+                self._trigger_heaps[heap_key] = [
+                    item for item in heap
+                    if self._trigger_entries.get((item[2], kind)) == (heap_key, item[1])
+                ]
+                heapq.heapify(self._trigger_heaps[heap_key])
+    
+    def _drop_trigger(self, order_id: str):
+        """Снимает триггеры ордера (записи в кучах остаются и пропускаются при извлечении)"""
+        for kind in TRIGGER_KINDS:
+            entry = self._trigger_entries.pop((order_id, kind), None)
+            if entry is not None:
+                self._trigger_live[entry[0]] -= 1
+    
+    def _pop_triggered(self, symbol: str, kind: str, price: Union[int, Decimal]) -> List[Order]:
+        """Извлекает ордера очереди, уровень которых пересечен ценой (price — price_key цены)"""
+        triggered = []
+        for direction in ('up', 'down'):
+            heap_key = (symbol, kind, direction)
+            heap = self._trigger_heaps.get(heap_key)
+            bound = price if direction == 'up' else -price
+            while heap and heap[0][0] <= bound:
+                _, seq, order_id = heapq.heappop(heap)
+                if self._trigger_entries.get((order_id, kind)) != (heap_key, seq):
+                    continue  # Ордер снят, изменен или уже исполнен
+                self._drop_trigger(order_id)
+                triggered.append(self.orders[order_id])
+        return triggered
+    
+    def sync_trailing(self, order_ids: Optional[List[str]] = None):
+        """
+        Переносит значения трейлингов из векторных книг в Decimal-поля ордеров
+        (перед сохранением или отдачей ордера наружу); по умолчанию — все измененные
+        """
+        if order_ids is None:
+            for book in self._trailing_books.values():
+                book.write_back()
+            return
+        for order_id in order_ids:
+            order = self.orders.get(order_id)
+            book = self._trailing_books.get(order.symbol) if order else None
+            if book is not None:
+                book.write_back_order(order_id)
+    
+    def set_status(self, order: Order, status: OrderStatus):
+        """Меняет статус ордера с переносом в соответствующую корзину; исполнение ноги разрешает OCO-группу"""
+        order.status = status
+        self.reindex(order)
+        if status == OrderStatus.FILLED and order.oco_group_id:
+            group = self.oco_groups.get(order.oco_group_id)
+            if group is not None and not group.resolved:
+                group.resolved_by = order.id
+                self._resolved_oco.append(group.id)
+    
+    def _oco_cancelled(self, order: Order) -> bool:
+        """Нога OCO-группы, уже разрешенной исполнением другой ноги"""
+        if not order.oco_group_id:
+            return False
+        group = self.oco_groups.get(order.oco_group_id)
+        return group is not None and group.resolved and group.resolved_by != order.id
+    
+    def reap_oco(self) -> List[Order]:
+        """
+        Отменяет оставшиеся ноги разрешенных OCO-групп и возвращает их
+        (вызывается вне горячего пути тика — например, движком после обработки цен)
+        """
+        cancelled = []
+        for group_id in self._resolved_oco:
+            group = self.oco_groups.get(group_id)
+            if group is None:
+                continue
+            for order_id in list(group.order_ids):
+                order = self.orders.get(order_id)
+                if order is None or order_id == group.resolved_by:
+                    continue
+                if order.status in (OrderStatus.PENDING, OrderStatus.ACTIVE):
+                    self.set_status(order, OrderStatus.CANCELLED)
+                    order.cancelled_at = self._now()
+                    cancelled.append(order)
+        self._resolved_oco = []
+        return cancelled
+    
+    def get_orders(self, symbol: str, order_type: OrderType,
+                   status: OrderStatus = OrderStatus.ACTIVE) -> List[Order]:
+        """Ордера одной корзины (копия: статусы могут меняться во время перебора)"""
+        return list(self._buckets.get((symbol, order_type, status), {}).values())
     
     def add_order(self, order: Order):
         """Добавляет ордер в систему"""
         self.orders[order.id] = order
+        self._index(order)
         
-        # Регистрируем OCO группу
+        # Регистрируем OCO группу (ноги связаны через группу, без попарных ссылок)
         if order.oco_group_id:
-            if order.oco_group_id not in self.oco_groups:
-                self.oco_groups[order.oco_group_id] = set()
-            self.oco_groups[order.oco_group_id].add(order.id)
-            
-            # Связываем ордера в группе
-            for related_id in order.oco_related_ids:
-                if related_id in self.orders:
-                    self.orders[related_id].oco_related_ids.add(order.id)
-                    order.oco_related_ids.add(related_id)
+            group = self.oco_groups.get(order.oco_group_id)
+            if group is None:
+                group = self.oco_groups[order.oco_group_id] = OcoGroup(order.oco_group_id)
+            group.order_ids.add(order.id)
     
     def remove_order(self, order_id: str):
         """Удаляет ордер из системы"""
@@ -237,13 +517,56 @@ class OrderProcessor:
             
             # Удаляем из OCO группы
             if order.oco_group_id and order.oco_group_id in self.oco_groups:
-                self.oco_groups[order.oco_group_id].discard(order_id)
-                if not self.oco_groups[order.oco_group_id]:
+                group = self.oco_groups[order.oco_group_id]
+                group.order_ids.discard(order_id)
+                if not group.order_ids:
                     del self.oco_groups[order.oco_group_id]
             
+            self._unindex(order_id)
             del self.orders[order_id]
     
-    def process_tick(self, symbol: str, price: Decimal) -> List[Order]:
+    def _now(self) -> datetime:
+        return self._tick_time or datetime.now()
+    
+    def process_ticks(self, ticks: Iterable[Sequence]) -> List[Order]:
+        """
+        Пакетная обработка (догоняющая после простоя или с внутриинтервальными экстремумами).
+        
+        Args:
+            ticks: Бары (symbol, open, high, low, close, ts) и/или тики (symbol, price, ts);
+                ts — datetime или unix-время, попадает в filled_at/cancelled_at
+        
+        Бар раскладывается в путь bar_path, путь символа сортируется по времени и сжимается
+        до точек разворота (zigzag); каждая точка — обычный тик process_tick с тем же
+        приоритетом (OCO, трейлинг, стоп, лимит, рынок). Стоп, пересеченный внутри участка,
+        исполняется по цене конца участка — консервативная оценка для гэпов.
+        
+        Returns:
+            Исполненные ордера (каждый один раз)
+        """
+        paths: Dict[str, List[Tuple[object, Decimal]]] = {}
+        for row in ticks:
+            if len(row) == 6:
+                symbol, open_price, high, low, close, ts = row
+                prices = bar_path(*(Decimal(str(value)) for value in (open_price, high, low, close)))
+            elif len(row) == 3:
+                symbol, price, ts = row
+                prices = [Decimal(str(price))]
+            else:
+                raise ValueError(f"Expected (symbol, open, high, low, close, ts) or (symbol, price, ts), got {row!r}")
+            paths.setdefault(symbol, []).extend((ts, price) for price in prices)
+        
+        executed: Dict[str, Order] = {}
+        for symbol, path in paths.items():
+            path.sort(key=lambda point: point[0])  # Стабильная сортировка сохраняет порядок точек бара
+            for ts, price in zigzag(path):
+                if price <= 0:
+                    continue
+                for order in self.process_tick(symbol, price, ts):
+                    executed.setdefault(order.id, order)
+        return list(executed.values())
+    
+    def process_tick(self, symbol: str, price: Decimal, ts: Union[datetime, float, None] = None) -> List[Order]:
         """
         Обрабатывает тик цены для символа
         Возвращает список исполненных ордеров
@@ -254,85 +577,103 @@ class OrderProcessor:
         3. Стоп-ордера (активация)
         4. Лимитные ордера
         5. Рыночные ордера
+        
+        ts: Время тика для filled_at/cancelled_at (по умолчанию — текущее)
         """
+        self._tick_time = _tick_datetime(ts)
+        try:
+            return self._process_tick(symbol, price)
+        finally:
+            self._tick_time = None
+    
+    def _process_tick(self, symbol: str, price: Decimal) -> List[Order]:
         executed_orders = []
         
-        # Получаем все активные ордера для символа
-        active_orders = [
-            o for o in self.orders.values()
-            if o.symbol == symbol and o.status == OrderStatus.ACTIVE
-        ]
+        # Каждая ступень берет свежую копию корзины ACTIVE: ордера, исполненные или
+        # отмененные на предыдущей ступени, уже перенесены в другие корзины
         
-        if not active_orders:
-            return executed_orders
+        # Стопы из векторной книги, пересеченные ценой, — в Decimal-поля для точной проверки ниже
+        book = self._trailing_books.get(symbol)
+        if book is not None:
+            book.write_back(book.crossed(price))
         
-        # 1. Обработка OCO ордеров
-        oco_orders = [o for o in active_orders if o.oco_group_id]
+        # 1. Обработка OCO ордеров: ноги из очереди 'oco' с пересеченным уровнем и ноги с трейлингом.
+        # Исполнение ноги разрешает группу; остальные ноги пропускаются до reap_oco
+        key = price_key(price)  # Сравнения с очередями триггеров — в целых нано-единицах
+        oco_orders = self._pop_triggered(symbol, 'oco', key)
+        oco_orders += [o for o in self._oco_trailing.get(symbol, {}).values() if self._check_oco_execution(o, price)]
         for order in oco_orders:
+            if self._oco_cancelled(order):
+                continue
             if self._check_oco_execution(order, price):
+                self._execute_oco_order(order, price)
                 executed_orders.append(order)
-                # Отменяем связанные ордера
-                self._cancel_oco_related(order)
-        
-        # 2. Обновление трейлинг-стопов
-        trailing_orders = [o for o in active_orders if o.trailing and o.status == OrderStatus.ACTIVE]
-        for order in trailing_orders:
-            self._update_trailing_stop(order, price)
-        
-        # 3. Активация стоп-ордеров
-        stop_orders = [
-            o for o in active_orders
-            if o.type in (OrderType.STOP_LOSS, OrderType.TAKE_PROFIT, OrderType.STOP_ENTRY)
-            and o.status == OrderStatus.ACTIVE
-        ]
-        for order in stop_orders:
-            if self._check_stop_activation(order, price):
+            elif order.status == OrderStatus.ACTIVE:
+                self._index(order)
+        
+        # 2. Обновление трейлинг-стопов (одним векторным проходом, если для символа есть книга)
+        if book is not None:
+            book.update(price)
+        else:
+            trailing_orders = list(self._trailing_index.get(symbol, {}).values())
+            for order in trailing_orders:
+                self._update_trailing_stop(order, price)
+        
+        # 3. Активация стоп-ордеров: из очереди извлекаются только пересеченные уровни
+        for order in self._pop_triggered(symbol, 'stop', key):
+            if self._oco_cancelled(order):
+                continue
+            if self._check_stop_activation(order, price) and self._execute_stop_order(order, price):
                 # Активируем стоп-ордер (превращаем в рыночный или лимитный)
-                if self._execute_stop_order(order, price):
-                    executed_orders.append(order)
+                executed_orders.append(order)
+            elif order.status == OrderStatus.ACTIVE:
+                self._index(order)  # Не исполнен — возвращаем в очередь
         
         # 4. Исполнение лимитных ордеров
-        limit_orders = [
-            o for o in active_orders
-            if o.type == OrderType.LIMIT and o.status == OrderStatus.ACTIVE
-        ]
-        for order in limit_orders:
-            if self._check_limit_execution(order, price):
-                if self._execute_limit_order(order, price):
-                    executed_orders.append(order)
+        for order in self._pop_triggered(symbol, 'limit', key):
+            if self._oco_cancelled(order):
+                continue
+            if self._check_limit_execution(order, price) and self._execute_limit_order(order, price):
+                executed_orders.append(order)
+            elif order.status == OrderStatus.ACTIVE:
+                self._index(order)
         
         # 5. Исполнение рыночных ордеров
-        market_orders = [
-            o for o in active_orders
-            if o.type == OrderType.MARKET and o.status == OrderStatus.ACTIVE
-        ]
-        for order in market_orders:
+        for order in self.get_orders(symbol, OrderType.MARKET):
+            if self._oco_cancelled(order):
+                continue
             if self._execute_market_order(order, price):
                 executed_orders.append(order)
         
+        self.sync_trailing([o.id for o in executed_orders])
         return executed_orders
     
     def _check_oco_execution(self, order: Order, price: Decimal) -> bool:
         """Проверяет, должен ли OCO ордер исполниться"""
-        if order.type == OrderType.TAKE_PROFIT:
+        if order.type == OrderType.TAKE_PROFIT and order.take_profit is not None:
             if order.side == PositionSide.LONG:
                 return price >= order.take_profit
             else:
                 return price <= order.take_profit
-        elif order.type == OrderType.STOP_LOSS:
+        elif order.type == OrderType.STOP_LOSS and order.stop_loss is not None:
             if order.side == PositionSide.LONG:
                 return price <= order.stop_loss
             else:
                 return price >= order.stop_loss
         return False
     
-    def _cancel_oco_related(self, executed_order: Order):
-        """Отменяет связанные OCO ордера"""
-        for related_id in executed_order.oco_related_ids:
-            if related_id in self.orders:
-                related = self.orders[related_id]
-                related.status = OrderStatus.CANCELLED
-                related.cancelled_at = datetime.now()
+    def _execute_oco_order(self, order: Order, price: Decimal):
+        """Исполняет ногу OCO по текущей цене; группа разрешается в set_status"""
+        self.set_status(order, OrderStatus.FILLED)
+        order.filled_at = self._now()
+        order.execution_price = price
+        order.execution_type = order.type.value
+        order.filled_quantity = order.quantity
+        if order.entry_price:
+            if order.side == PositionSide.LONG:
+                order.pnl = (price - order.entry_price) * order.quantity
+            else:
+                order.pnl = (order.entry_price - price) * order.quantity
     
     def _update_trailing_stop(self, order: Order, price: Decimal):
         """Обновляет трейлинг-стоп"""
@@ -390,8 +731,8 @@ class OrderProcessor:
                 # Для шорта стоп-лосс исполняется по цене не ниже stop_price
                 execution_price = max(price, order.stop_price)
         
-        order.status = OrderStatus.FILLED
-        order.filled_at = datetime.now()
+        self.set_status(order, OrderStatus.FILLED)
+        order.filled_at = self._now()
         order.execution_price = execution_price
         order.execution_type = order.type.value
         order.filled_quantity = order.quantity
@@ -421,8 +762,8 @@ class OrderProcessor:
         """Исполняет лимитный ордер"""
         execution_price = order.limit_price
         
-        order.status = OrderStatus.FILLED
-        order.filled_at = datetime.now()
+        self.set_status(order, OrderStatus.FILLED)
+        order.filled_at = self._now()
         order.execution_price = execution_price
         order.execution_type = "LIMIT"
         order.filled_quantity = order.quantity
@@ -442,30 +783,31 @@ class OrderProcessor:
                     slippage = ((execution_price - order.limit_price) / order.limit_price) * 100
                     if slippage > order.max_slippage:
                         # Отменяем ордер из-за превышения проскальзывания
-                        order.status = OrderStatus.REJECTED
-                        order.cancelled_at = datetime.now()
+                        self.set_status(order, OrderStatus.REJECTED)
+                        order.cancelled_at = self._now()
                         return False
             else:
                 if execution_price < order.limit_price:
                     slippage = ((order.limit_price - execution_price) / order.limit_price) * 100
                     if slippage > order.max_slippage:
-                        order.status = OrderStatus.REJECTED
-                        order.cancelled_at = datetime.now()
+                        self.set_status(order, OrderStatus.REJECTED)
+                        order.cancelled_at = self._now()
                         return False
         
         # Логируем проскальзывание
         if expected_price != execution_price:
             slippage_pct = abs((execution_price - expected_price) / expected_price) * 100
-            self.slippage_stats.append({
-                'order_id': order.id,
-                'expected_price': float(expected_price),
-                'execution_price': float(execution_price),
-                'slippage_pct': float(slippage_pct),
-                'timestamp': datetime.now().isoformat()
-            })
-        
-        order.status = OrderStatus.FILLED
-        order.filled_at = datetime.now()
+            self.slippage_stats.record(
+                slippage_pct,
+                symbol=order.symbol,
+                order_id=order.id,
+                expected_price=float(expected_price),
+                execution_price=float(execution_price),
+                timestamp=self._now().isoformat()
+            )
+        
+        self.set_status(order, OrderStatus.FILLED)
+        order.filled_at = self._now()
         order.execution_price = execution_price
         order.execution_type = "MARKET"
         order.filled_quantity = order.quantity
@@ -473,16 +815,5 @@ class OrderProcessor:
         return True
     
     def get_slippage_stats(self) -> Dict:
-        """Возвращает статистику проскальзывания"""
-        if not self.slippage_stats:
-            return {'total_orders': 0, 'avg_slippage': 0, 'max_slippage': 0}
-        
-        slippages = [s['slippage_pct'] for s in self.slippage_stats]
-        return {
-            'total_orders': len(self.slippage_stats),
-            'avg_slippage': sum(slippages) / len(slippages),
-            'max_slippage': max(slippages),
-            'min_slippage': min(slippages),
-            'recent': self.slippage_stats[-10:]  # Последние 10
-        }
-
+        """Возвращает статистику проскальзывания (агрегаты считаются при записи)"""
+        return self.slippage_stats.snapshot()
@@ -0,0 +1,182 @@
+"""
+События изменения цены по парам.
+PriceWatcher опрашивает цены пар и публикует в PriceEventBus только те пары,
+цена которых изменилась, чтобы проверка ордеров запускалась по событию, а не по таймеру.
+Цены пар запрашиваются конкурентно (asyncio, не больше PRICE_FETCH_CONCURRENCY запросов
+одновременно), поэтому период опроса не растет линейно с числом пар
+"""
+import asyncio
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional
+
+PRICE_FETCH_CONCURRENCY = int(os.environ.get("PRICE_FETCH_CONCURRENCY", os.environ.get("ENGINE_MAX_CONCURRENCY", "8")))
+
+
+class PriceEventBus:
+    """Шина событий: подписчики получают (pair, snapshot, previous) при изменении цены пары"""
+
+    def __init__(self):
+        self._subscribers: Dict[Optional[str], List[Callable]] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback: Callable, pair: Optional[str] = None):
+        """Подписка на изменения цены пары (pair=None — на все пары)"""
+        with self._lock:
+            self._subscribers.setdefault(pair, []).append(callback)
+
+    def unsubscribe(self, callback: Callable, pair: Optional[str] = None):
+        with self._lock:
+            callbacks = self._subscribers.get(pair, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+
+    def publish(self, pair: str, snapshot: dict, previous: Optional[dict] = None):
+        with self._lock:
+            callbacks = list(self._subscribers.get(pair, [])) + list(self._subscribers.get(None, []))
+        for callback in callbacks:
+            try:
+                callback(pair, snapshot, previous)
+            except Exception as e:
+                print(f"[ЦЕНЫ] Ошибка обработчика события {pair}: {e}")
+                traceback.print_exc()
+
+
+class PriceWatcher:
+    """
+    Опрос цен пар с публикацией событий только при изменении.
+
+    Args:
+        bus: Шина, в которую публикуются события
+        pairs_provider: Функция, возвращающая список отслеживаемых пар
+        snapshot_fetcher: Функция pair -> {'long': float, 'short': float} или None
+        poll_interval: Интервал опроса цен в секундах
+        min_change: Минимальное относительное изменение цены, считающееся событием
+        max_concurrency: Максимум одновременных запросов цены (snapshot_fetcher синхронный, выполняется в пуле потоков)
+    """
+
+    def __init__(self, bus: PriceEventBus, pairs_provider: Callable[[], Iterable[str]],
+                 snapshot_fetcher: Callable[[str], Optional[dict]],
+                 poll_interval: float = 2.0, min_change: float = 0.0,
+                 max_concurrency: int = PRICE_FETCH_CONCURRENCY):
+        self.bus = bus
+        self.pairs_provider = pairs_provider
+        self.snapshot_fetcher = snapshot_fetcher
+        self.poll_interval = poll_interval
+        self.min_change = min_change
+        self.max_concurrency = max(1, max_concurrency)
+        self.running = False
+        self._last: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        # overruns — опросы, не уложившиеся в poll_interval
+        self._metrics = {'polls': 0, 'overruns': 0, 'errors': 0, 'last_poll_ms': 0.0, 'max_poll_ms': 0.0}
+
+    def latest(self, pair: str) -> Optional[dict]:
+        """Последний опубликованный снимок цены пары"""
+        with self._lock:
+            return self._last.get(pair)
+
+    def _changed(self, previous: Optional[dict], snapshot: dict) -> bool:
+        if previous is None:
+            return True
+        for side in ('long', 'short'):
+            old = previous.get(side) or 0
+            new = snapshot.get(side) or 0
+            if old == new:
+                continue
+            if not old:
+                return True
+            if abs(new - old) / abs(old) > self.min_change:
+                return True
+        return False
+
+    def _fetch(self, pair: str) -> Optional[dict]:
+        try:
+            return self.snapshot_fetcher(pair)
+        except Exception as e:
+            self._metrics['errors'] += 1
+            print(f"[ЦЕНЫ] Ошибка получения цены {pair}: {e}")
+            return None
+
+    def _record(self, pair: str, snapshot: dict) -> bool:
+        """
+        Запоминает снимок; True, если цена изменилась и событие опубликовано. Для неизменившейся
+        цены хранимый снимок остается прежним (база сравнения с min_change), но получает свежий
+        fetched_at: полный проход планировщика берет latest() и меряет задержку от этого момента
+        """
+        with self._lock:
+            previous = self._last.get(pair)
+            if not self._changed(previous, snapshot):
+                if 'fetched_at' in snapshot:
+                    self._last[pair] = dict(previous, fetched_at=snapshot['fetched_at'])
+                return False
+            self._last[pair] = snapshot
+        self.bus.publish(pair, snapshot, previous)
+        return True
+
+    async def poll_async(self, executor: ThreadPoolExecutor) -> List[str]:
+        """Опрашивает все пары один раз конкурентно, возвращает пары с изменившейся ценой"""
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        pairs = list(self.pairs_provider())
+
+        async def fetch(pair: str) -> Optional[dict]:
+            async with semaphore:
+                return await loop.run_in_executor(executor, self._fetch, pair)
+
+        started = time.monotonic()
+        snapshots = await asyncio.gather(*(fetch(pair) for pair in pairs))
+        changed = [pair for pair, snapshot in zip(pairs, snapshots) if snapshot and self._record(pair, snapshot)]
+        elapsed_ms = (time.monotonic() - started) * 1000
+        self._metrics['polls'] += 1
+        self._metrics['last_poll_ms'] = elapsed_ms
+        self._metrics['max_poll_ms'] = max(self._metrics['max_poll_ms'], elapsed_ms)
+        if elapsed_ms > self.poll_interval * 1000:
+            self._metrics['overruns'] += 1
+        return changed
+
+    def poll_once(self) -> List[str]:
+        """Однократный опрос вне цикла watcher (свой event loop и пул потоков)"""
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="price-fetch") as executor:
+            return asyncio.run(self.poll_async(executor))
+
+    async def _watch_async(self):
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="price-fetch") as executor:
+            while self.running:
+                started = time.monotonic()
+                try:
+                    await self.poll_async(executor)
+                except Exception as e:
+                    print(f"[ЦЕНЫ] Ошибка опроса цен: {e}")
+                    traceback.print_exc()
+                elapsed = time.monotonic() - started
+                await asyncio.sleep(max(self.poll_interval - elapsed, 0.1))
+
+    def start(self):
+        """Запускает опрос цен в фоновом потоке со своим event loop"""
+        if self.running:
+            return None
+        self.running = True
+
+        def watcher_loop():
+            while self.running:
+                try:
+                    asyncio.run(self._watch_async())
+                except Exception as e:
+                    print(f"[ЦЕНЫ] Цикл опроса цен остановлен ошибкой: {e}, перезапуск через 5 с")
+                    traceback.print_exc()
+                    time.sleep(5)
+
+        watcher_thread = threading.Thread(target=watcher_loop)
+        watcher_thread.daemon = True
+        watcher_thread.start()
+        return watcher_thread
+
+    def stop(self):
+        self.running = False
+
+    def get_metrics(self) -> Dict:
+        return dict(self._metrics, pairs=len(self._last), max_concurrency=self.max_concurrency)
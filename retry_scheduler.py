@@ -0,0 +1,166 @@
+"""
+Планировщик отложенных повторов исполнения ордеров.
+Временные ошибки (лимиты RPC, jetton wallet, таймауты) не повторяются на каждом тике проверки:
+следующая попытка назначается с экспоненциальной задержкой и джиттером по политике причины ошибки.
+Ближайшие попытки хранятся в min-heap по времени, один фоновый поток будит их по сроку.
+"""
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+import traceback
+from typing import Callable, Dict, Optional, Tuple
+
+RETRY_MAX_ATTEMPTS = int(os.environ.get("RETRY_MAX_ATTEMPTS", "6"))
+
+
+class RetryPolicy:
+    """
+    Политика повторов для одной причины ошибки.
+
+    Args:
+        base_delay: Задержка перед второй попыткой, сек
+        max_delay: Верхняя граница задержки, сек
+        multiplier: Множитель экспоненциального роста
+        max_attempts: Максимум попыток (включая первую)
+        jitter: Доля случайного разброса задержки (0.2 — ±20%)
+    """
+
+    def __init__(self, base_delay: float, max_delay: float, multiplier: float = 2.0,
+                 max_attempts: int = RETRY_MAX_ATTEMPTS, jitter: float = 0.2):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.max_attempts = max_attempts
+        self.jitter = jitter
+
+    def delay(self, attempt: int) -> float:
+        """Задержка перед попыткой attempt + 1 после неудачной попытки attempt"""
+        delay = min(self.base_delay * (self.multiplier ** max(attempt - 1, 0)), self.max_delay)
+        if self.jitter:
+            delay *= 1 + random.uniform(-self.jitter, self.jitter)
+        return max(delay, 0.0)
+
+
+# Причина ошибки -> (ключевые слова, политика). Порядок важен: первая совпавшая причина
+RETRY_REASONS = (
+    ('rate_limit', ('429', 'too many requests', 'rate limit', 'ratelimit'),
+     RetryPolicy(base_delay=1.0, max_delay=15.0, multiplier=1.5, max_attempts=10)),
+    ('jetton_wallet', ('jetton wallet',),
+     RetryPolicy(base_delay=15.0, max_delay=300.0, multiplier=3.0, max_attempts=5)),
+    ('timeout', ('timeout', 'timed out'),
+     RetryPolicy(base_delay=3.0, max_delay=60.0)),
+    ('rpc', ('ton rpc', 'server error', 'jsonrpc', 'rungetmethod'),
+     RetryPolicy(base_delay=5.0, max_delay=120.0)),
+)
+DEFAULT_RETRY_POLICY = RetryPolicy(base_delay=5.0, max_delay=120.0)
+
+
+def classify_retry_reason(error: Optional[str]) -> Tuple[str, RetryPolicy]:
+    """Определяет причину временной ошибки и ее политику повторов"""
+    msg = (error or '').lower()
+    for reason, keywords, policy in RETRY_REASONS:
+        if any(keyword in msg for keyword in keywords):
+            return reason, policy
+    return 'other', DEFAULT_RETRY_POLICY
+
+
+def plan_retry(error: Optional[str], attempt: int) -> Optional[Dict]:
+    """
+    План следующей попытки после неудачной попытки attempt.
+
+    Returns:
+        dict: {'reason', 'attempt', 'delay'} или None, если попытки исчерпаны
+    """
+    reason, policy = classify_retry_reason(error)
+    if attempt >= policy.max_attempts:
+        return None
+    return {'reason': reason, 'attempt': attempt + 1, 'delay': policy.delay(attempt)}
+
+
+class RetryScheduler:
+    """
+    Min-heap отложенных повторов. Повторная постановка того же ключа заменяет прежний срок
+    (старая запись кучи пропускается при извлечении).
+
+    Args:
+        name: Тег для логов
+    """
+
+    def __init__(self, name: str = "ПОВТОР"):
+        self.name = name
+        self._heap = []
+        self._entries: Dict[str, Tuple[float, int]] = {}
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self.running = False
+
+    def schedule(self, key: str, delay: float, callback: Callable, *args):
+        """Вызвать callback(*args) через delay секунд; для key остается только последняя постановка"""
+        due = time.monotonic() + max(delay, 0.0)
+        seq = next(self._counter)
+        with self._cond:
+            self._entries[key] = (due, seq)
+            heapq.heappush(self._heap, (due, seq, key, callback, args))
+            self._cond.notify()
+
+    def is_scheduled(self, key: str) -> bool:
+        with self._cond:
+            return key in self._entries
+
+    def cancel(self, key: str) -> bool:
+        with self._cond:
+            return self._entries.pop(key, None) is not None
+
+    def pending(self) -> Dict[str, float]:
+        """Ключи и оставшееся до попытки время, сек"""
+        now = time.monotonic()
+        with self._cond:
+            return {key: max(due - now, 0.0) for key, (due, _) in self._entries.items()}
+
+    def _pop_due(self):
+        """Извлекает готовую запись или возвращает время ожидания до ближайшей"""
+        while self._heap:
+            due, seq, key, callback, args = self._heap[0]
+            if self._entries.get(key) != (due, seq):
+                heapq.heappop(self._heap) # Отмененная или замененная запись
+                continue
+            wait = due - time.monotonic()
+            if wait > 0:
+                return None, wait
+            heapq.heappop(self._heap)
+            del self._entries[key]
+            return (key, callback, args), 0
+        return None, None
+
+    def start(self):
+        """Запускает фоновый поток повторов"""
+        if self.running:
+            return None
+        self.running = True
+
+        def scheduler_loop():
+            while self.running:
+                with self._cond:
+                    item, wait = self._pop_due()
+                    if item is None:
+                        self._cond.wait(wait)
+                        continue
+                key, callback, args = item
+                try:
+                    callback(*args)
+                except Exception as e:
+                    print(f"[{self.name}] Ошибка повтора {key}: {e}")
+                    traceback.print_exc()
+
+        scheduler_thread = threading.Thread(target=scheduler_loop)
+        scheduler_thread.daemon = True
+        scheduler_thread.start()
+        return scheduler_thread
+
+    def stop(self):
+        with self._cond:
+            self.running = False
+            self._cond.notify()
@@ -1,8 +1,7 @@
 import threading
 import time
 from snapshot_collector import SnapshotCollector
-from order_manager import OrderManager
-from app import app
+from app import app, start_order_checker
 
 def run_flask():
     app.run(debug=True, port=5000, use_reloader=False)
@@ -11,9 +10,9 @@ def run_snapshot_collector():
     collector = SnapshotCollector()
     collector.start_collection()
 
-def run_order_manager():
-    manager = OrderManager()
-    manager.start_monitoring()
+def run_order_scheduler():
+    # Единый планировщик: цены, legacy-ордера и расширенные ордера OrderEngine (вместо OrderManager.start_monitoring)
+    start_order_checker()
 
 if __name__ == "__main__":
     print("Starting TON DEX System...")
@@ -28,10 +27,8 @@ if __name__ == "__main__":
     snapshot_thread.daemon = True
     snapshot_thread.start()
     
-    # Запускаем менеджер ордеров
-    order_thread = threading.Thread(target=run_order_manager)
-    order_thread.daemon = True
-    order_thread.start()
+    # Запускаем планировщик проверки ордеров
+    run_order_scheduler()
     
     try:
         while True:
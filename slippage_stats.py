@@ -0,0 +1,286 @@
+"""
+Ограниченная потоковая статистика проскальзывания.
+Последние выборки — в кольцевом буфере; агрегаты (count, mean, min, max, p50/p95/p99 по
+алгоритму P² Джейна–Хламтача) считаются на лету — общие, по символу и по DEX. Память и
+чтение не зависят от числа исполнений. Агрегаты периодически сохраняются в таблицу
+slippage_stats и загружаются при старте.
+
+Несколько процессов проверки пишут строки под своим source (SLIPPAGE_STATS_SOURCE);
+read_merged объединяет их (квантили разных источников — среднее, взвешенное по count).
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+SLIPPAGE_QUANTILES = (0.5, 0.95, 0.99)
+SLIPPAGE_RECENT_SIZE = int(os.environ.get("SLIPPAGE_RECENT_SIZE", "100"))
+SLIPPAGE_PERSIST_INTERVAL = float(os.environ.get("SLIPPAGE_PERSIST_INTERVAL", "60"))
+SLIPPAGE_STATS_SOURCE = os.environ.get("SLIPPAGE_STATS_SOURCE", "default")
+
+
+class P2Quantile:
+    """Оценка квантиля p за O(1) памяти: пять маркеров, параболическая коррекция высот"""
+
+    def __init__(self, p: float):
+        self.p = p
+        self.heights: List[float] = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, x: float):
+        h = self.heights
+        if len(h) < 5:
+            h.append(x)
+            h.sort()
+            return
+        if x < h[0]:
+            h[0] = x
+            k = 0
+        elif x >= h[4]:
+            h[4] = x
+            k = 3
+        else:
+            k = next(i for i in range(1, 5) if x < h[i]) - 1
+        n = self.positions
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+        for i in (1, 2, 3):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                q = h[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (h[i + 1] - h[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - d) * (h[i] - h[i - 1]) / (n[i] - n[i - 1])
+                )
+                if not h[i - 1] < q < h[i + 1]:
+                    q = h[i] + d * (h[i + d] - h[i]) / (n[i + d] - n[i])  # Линейная коррекция
+                h[i] = q
+                n[i] += d
+
+    def value(self) -> Optional[float]:
+        h = self.heights
+        if not h:
+            return None
+        if len(h) < 5 or self.positions[4] == 5:
+            return h[min(int(round(self.p * (len(h) - 1))), len(h) - 1)]
+        return h[2]
+
+    def to_state(self) -> Dict:
+        return {'p': self.p, 'heights': self.heights, 'positions': self.positions, 'desired': self.desired}
+
+    @classmethod
+    def from_state(cls, state: Dict) -> 'P2Quantile':
+        estimator = cls(state['p'])
+        estimator.heights = list(state['heights'])
+        estimator.positions = list(state['positions'])
+        estimator.desired = list(state['desired'])
+        return estimator
+
+
+class SlippageAggregate:
+    """count/mean/min/max и квантили одной группы выборок"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self.quantiles = {p: P2Quantile(p) for p in SLIPPAGE_QUANTILES}
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        for estimator in self.quantiles.values():
+            estimator.add(value)
+
+    def summary(self) -> Dict:
+        result = {
+            'total_orders': self.count,
+            'avg_slippage': self.total / self.count if self.count else 0,
+            'max_slippage': self.max or 0,
+            'min_slippage': self.min or 0,
+        }
+        for p, estimator in self.quantiles.items():
+            result[f"p{int(p * 100)}"] = estimator.value() or 0
+        return result
+
+    def to_state(self) -> Dict:
+        return {
+            'count': self.count, 'total': self.total, 'min': self.min, 'max': self.max,
+            'quantiles': [estimator.to_state() for estimator in self.quantiles.values()],
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict) -> 'SlippageAggregate':
+        aggregate = cls()
+        aggregate.count = state['count']
+        aggregate.total = state['total']
+        aggregate.min = state['min']
+        aggregate.max = state['max']
+        for estimator_state in state.get('quantiles', []):
+            estimator = P2Quantile.from_state(estimator_state)
+            aggregate.quantiles[estimator.p] = estimator
+        return aggregate
+
+
+def merge_summaries(summaries: List[Dict]) -> Dict:
+    """Объединение сводок разных источников: точные count/mean/min/max, квантили — по весу count"""
+    summaries = [s for s in summaries if s.get('total_orders')]
+    if not summaries:
+        return SlippageAggregate().summary()
+    count = sum(s['total_orders'] for s in summaries)
+    result = {
+        'total_orders': count,
+        'avg_slippage': sum(s['avg_slippage'] * s['total_orders'] for s in summaries) / count,
+        'max_slippage': max(s['max_slippage'] for s in summaries),
+        'min_slippage': min(s['min_slippage'] for s in summaries),
+    }
+    for p in SLIPPAGE_QUANTILES:
+        key = f"p{int(p * 100)}"
+        result[key] = sum(s[key] * s['total_orders'] for s in summaries) / count
+    return result
+
+
+class SlippageStats:
+    """
+    Args:
+        connection_factory: Контекстный менеджер подключения к БД (без него — только память)
+        source: Имя источника строк в таблице (у каждого процесса проверки — свое)
+        recent_size: Размер кольцевого буфера последних выборок
+        persist_interval: Минимальный интервал сохранения агрегатов, сек
+    """
+
+    def __init__(self, connection_factory: Optional[Callable] = None, source: str = SLIPPAGE_STATS_SOURCE,
+                 recent_size: int = SLIPPAGE_RECENT_SIZE, persist_interval: float = SLIPPAGE_PERSIST_INTERVAL):
+        self.connection_factory = connection_factory
+        self.source = source
+        self.persist_interval = persist_interval
+        self.recent = deque(maxlen=recent_size)
+        # (scope, key) -> агрегат; scope: 'all' / 'symbol' / 'dex'
+        self._aggregates: Dict[Tuple[str, str], SlippageAggregate] = {('all', ''): SlippageAggregate()}
+        self._dirty = set()
+        self._last_persist = time.monotonic()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def init_table(cur):
+        """Создание таблицы агрегатов (вызывается из init_db)"""
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS slippage_stats (
+                source VARCHAR(120) NOT NULL,
+                scope VARCHAR(16) NOT NULL,
+                key VARCHAR(120) NOT NULL,
+                state JSONB NOT NULL,
+                updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+                PRIMARY KEY (source, scope, key)
+            )
+        """)
+
+    def record(self, slippage_pct: float, symbol: Optional[str] = None, dex: Optional[str] = None, **sample):
+        """Учитывает одну выборку проскальзывания (в процентах)"""
+        value = float(slippage_pct)
+        keys = [('all', '')]
+        if symbol:
+            keys.append(('symbol', symbol))
+        if dex:
+            keys.append(('dex', dex))
+        with self._lock:
+            for key in keys:
+                aggregate = self._aggregates.get(key)
+                if aggregate is None:
+                    aggregate = self._aggregates[key] = SlippageAggregate()
+                aggregate.add(value)
+                self._dirty.add(key)
+            self.recent.append(dict(
+                sample, slippage_pct=value, symbol=symbol, dex=dex,
+                timestamp=sample.get('timestamp') or datetime.now().isoformat()
+            ))
+
+    def snapshot(self, recent: int = 10) -> Dict:
+        """Сводка: общие агрегаты, по символам и DEX, последние выборки"""
+        with self._lock:
+            result = self._aggregates[('all', '')].summary()
+            result['by_symbol'] = {key: a.summary() for (scope, key), a in self._aggregates.items() if scope == 'symbol'}
+            result['by_dex'] = {key: a.summary() for (scope, key), a in self._aggregates.items() if scope == 'dex'}
+            result['recent'] = list(self.recent)[-recent:] if recent else []
+        return result
+
+    def load(self):
+        """Загружает сохраненные агрегаты своего источника (при старте процесса)"""
+        if not self.connection_factory:
+            return
+        with self.connection_factory() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT scope, key, state FROM slippage_stats WHERE source = %s", (self.source,))
+                rows = cur.fetchall()
+        with self._lock:
+            for scope, key, state in rows:
+                state = state if isinstance(state, dict) else json.loads(state)
+                if scope == 'recent':
+                    self.recent.extend(state.get('samples', []))
+                else:
+                    self._aggregates[(scope, key)] = SlippageAggregate.from_state(state)
+        print(f"[ПРОСКАЛЬЗЫВАНИЕ] Загружено агрегатов: {len(rows)} (источник {self.source})")
+
+    def persist(self):
+        """Сохраняет измененные агрегаты и буфер последних выборок"""
+        if not self.connection_factory:
+            return
+        with self._lock:
+            rows = [(scope, key, self._aggregates[(scope, key)].to_state()) for scope, key in self._dirty]
+            if rows:
+                rows.append(('recent', '', {'samples': list(self.recent)}))
+            self._dirty = set()
+            self._last_persist = time.monotonic()
+        if not rows:
+            return
+        try:
+            with self.connection_factory() as conn:
+                with conn.cursor() as cur:
+                    for scope, key, state in rows:
+                        cur.execute("""
+                            INSERT INTO slippage_stats (source, scope, key, state, updated_at)
+                            VALUES (%s, %s, %s, %s, NOW())
+                            ON CONFLICT (source, scope, key) DO UPDATE
+                            SET state = EXCLUDED.state, updated_at = NOW()
+                        """, (self.source, scope, key, json.dumps(state, default=str)))
+                    conn.commit()
+        except Exception:
+            with self._lock:
+                self._dirty.update((scope, key) for scope, key, _ in rows if scope != 'recent')
+            raise
+
+    def persist_if_due(self):
+        if time.monotonic() - self._last_persist >= self.persist_interval:
+            self.persist()
+
+    @staticmethod
+    def read_merged(connection_factory: Callable, recent: int = 10) -> Dict:
+        """Сводка по всем источникам из таблицы (процесс без собственной проверки ордеров)"""
+        with connection_factory() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT scope, key, state FROM slippage_stats")
+                rows = cur.fetchall()
+        groups: Dict[Tuple[str, str], List[Dict]] = {}
+        samples = []
+        for scope, key, state in rows:
+            state = state if isinstance(state, dict) else json.loads(state)
+            if scope == 'recent':
+                samples.extend(state.get('samples', []))
+            else:
+                groups.setdefault((scope, key), []).append(SlippageAggregate.from_state(state).summary())
+        result = merge_summaries(groups.get(('all', ''), []))
+        result['by_symbol'] = {key: merge_summaries(s) for (scope, key), s in groups.items() if scope == 'symbol'}
+        result['by_dex'] = {key: merge_summaries(s) for (scope, key), s in groups.items() if scope == 'dex'}
+        samples.sort(key=lambda sample: sample.get('timestamp') or '')
+        result['recent'] = samples[-recent:] if recent else []
+        return result
@@ -11,7 +11,10 @@ from pytoniq_core import Address
 from pytoniq_core.boc import Builder
 from dotenv import load_dotenv
 
+from log_config import get_logger
+
 load_dotenv()
+log = get_logger('stonfi')
 
 # Константы STON.fi
 STONFI_ROUTER = os.environ.get(
@@ -126,7 +129,7 @@ def create_swap_payload(pool_address: str, user_address: str, amount: int, min_o
         cell = cell.end_cell()
 
     boc = base64.b64encode(cell.to_boc()).decode()
-    print(f"[StonFi] Generated swap payload: {boc[:80]}...")
+    log.debug("[StonFi] Generated swap payload: %.80s...", boc)
     return boc
 
 
@@ -0,0 +1,74 @@
+"""
+Тесты бэктеста (backtest): воспроизведение тиков через order_evaluators и OrderProcessor,
+модель исполнения, чтение CSV и отчет
+"""
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+
+from backtest import Backtest, FillModel, iter_csv_ticks
+from order_system import Order, OrderStatus, OrderType, PositionSide
+
+T0 = datetime(2026, 1, 1)
+
+
+def ticks(*prices, pair='TON-USDT', pool='pool-a'):
+    return [(T0 + timedelta(seconds=i), pair, pool, price) for i, price in enumerate(prices)]
+
+
+def buy_limit(**fields):
+    order = {'id': 'l1', 'type': 'long', 'pair': 'TON-USDT', 'amount': 10, 'entry_price': 5,
+             'stop_loss': 4, 'take_profit': 7, 'status': 'waiting_entry', 'price_at_creation': 6,
+             'max_slippage': 0}
+    order.update(fields)
+    return order
+
+
+def test_legacy_order_opens_and_takes_profit():
+    backtest = Backtest([buy_limit()], fill_model=FillModel(fee_rate=0, slippage=0))
+    report = backtest.run(ticks(6.0, 4.9, 6.5, 7.2, 3.0))
+    assert [(f['kind'], f['price']) for f in backtest.fills] == [('open', 4.9), ('TAKE_PROFIT', 7.2)]
+    assert backtest.fills[1]['ts'] == T0 + timedelta(seconds=3)  # Симулированные часы — время данных
+    assert report['total_pnl'] == pytest.approx((7.2 - 4.9) * 10)
+    assert (report['closed_trades'], report['wins'], report['still_opened']) == (1, 1, 0)
+    assert report['ticks'] == 5 and report['orders_evaluated'] == 5  # Открытая позиция проверяется в том же тике
+
+
+def test_fill_model_slippage_and_fees_reduce_pnl():
+    backtest = Backtest([buy_limit(status='opened', entry_price=5)], fill_model=FillModel(fee_rate=0.01, slippage=0.01))
+    report = backtest.run(ticks(3.9))
+    exit_price = 3.9 * 0.99  # Продажа лонга хуже цены тика
+    expected = (exit_price - 5) * 10 - (5 * 10 * 0.01 + exit_price * 10 * 0.01)
+    assert backtest.fills[0]['kind'] == 'STOP_LOSS'
+    assert report['total_pnl'] == pytest.approx(expected)
+    assert report['losses'] == 1
+
+
+def test_long_uses_cheapest_pool():
+    backtest = Backtest([buy_limit()], fill_model=FillModel(fee_rate=0, slippage=0))
+    backtest.run([(T0, 'TON-USDT', 'pool-a', 5.5), (T0, 'TON-USDT', 'pool-b', 4.8)])
+    assert backtest.fills[0]['price'] == 4.8
+    backtest.run([(T0, 'TON-USDT', 'pool-b', 5.6)])  # pool-a (5.5) остается минимальной ценой
+    assert len(backtest.fills) == 1
+
+
+def test_advanced_orders_go_through_processor():
+    order = Order(id='a1', symbol='TON-USDT', quantity=Decimal(2), type=OrderType.STOP_LOSS,
+                  side=PositionSide.LONG, status=OrderStatus.ACTIVE, stop_price=Decimal('4.5'))
+    backtest = Backtest(advanced_orders=[order], fill_model=FillModel(fee_rate=0, slippage=0))
+    report = backtest.run(ticks(5.0, 4.4, 4.0))
+    assert [(f['order_id'], f['kind'], f['price']) for f in backtest.fills] == [('a1', 'STOP_LOSS', 4.4)]
+    assert report['advanced_active'] == 0
+    assert report['orders_evaluated'] == 2  # После исполнения ордер больше не проверяется
+
+
+def test_csv_ticks_and_bars(tmp_path):
+    path = tmp_path / 'prices.csv'
+    path.write_text("ts,pair,price,open,high,low,close\n"
+                    "2026-01-01T00:00:00,TON-USDT,5.0,,,,\n"
+                    "1767229200,TON-USDT,,5,6,4,5.5\n")
+    rows = list(iter_csv_ticks(str(path)))
+    assert rows[0] == (T0, 'TON-USDT', 'TON-USDT', 5.0)
+    assert [price for _, _, _, price in rows[1:]] == [5.0, 4.0, 6.0, 5.5]  # Растущий бар: O-L-H-C
+    assert rows[1][0] == datetime.fromtimestamp(1767229200)
@@ -0,0 +1,73 @@
+"""
+Тесты шардирования проверки ордеров (checker_shards): стабильный номер шарда,
+выравнивание доли воркера, пустой набор шардов после истечения аренды
+"""
+import zlib
+from contextlib import contextmanager
+
+from checker_shards import ShardLeaseManager, shard_of
+
+
+class ScriptedDB:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.executed = []
+        self.current = {}
+
+    @contextmanager
+    def connection(self):
+        yield self
+
+    @contextmanager
+    def cursor(self):
+        yield self
+
+    def commit(self):
+        pass
+
+    def execute(self, sql, params=None):
+        self.executed.append((' '.join(sql.split()), params))
+        self.current = self.responses.pop(0) if self.responses else {}
+
+    def fetchone(self):
+        return self.current.get('one')
+
+    def fetchall(self):
+        return self.current.get('all', [])
+
+
+def heartbeat(live_workers, mine):
+    # Отметка воркера, очистка ушедших, число живых, продление своих аренд
+    return [{}, {}, {'one': (live_workers,)}, {'all': [(shard,) for shard in mine]}]
+
+
+def test_shard_of_is_stable_crc32():
+    assert shard_of('TON-USDT', 16) == zlib.crc32(b'TON-USDT') % 16
+    assert all(0 <= shard_of(f"pair_{i}", 4) < 4 for i in range(100))
+
+
+def test_worker_gives_back_extra_shards_when_others_join():
+    db = ScriptedDB(heartbeat(live_workers=2, mine=[0, 1, 2, 3]) + [{}])
+    manager = ShardLeaseManager(db.connection, shard_count=4, worker_id='w1')
+    assert manager.rebalance() == frozenset({0, 1})
+    sql, params = db.executed[-1]
+    assert 'SET owner = NULL' in sql and params == ([2, 3], 'w1')
+
+
+def test_worker_claims_missing_share():
+    db = ScriptedDB(heartbeat(live_workers=2, mine=[1]) + [{'all': [(3,)]}])
+    manager = ShardLeaseManager(db.connection, shard_count=4, worker_id='w1')
+    assert manager.rebalance() == frozenset({1, 3})
+    sql, params = db.executed[-1]
+    assert 'FOR UPDATE SKIP LOCKED' in sql and params[-1] == 1  # Забирается недостающий один шард
+
+
+def test_expired_lease_owns_nothing():
+    key = 'TON-USDT'
+    db = ScriptedDB(heartbeat(live_workers=1, mine=list(range(4))))
+    manager = ShardLeaseManager(db.connection, shard_count=4, worker_id='w1', lease_seconds=30)
+    manager.rebalance()
+    assert manager.owns(key)
+    manager._valid_until = 0.0  # Аренду не удалось продлить вовремя
+    assert manager.owned() == frozenset()
+    assert not manager.owns(key)
@@ -0,0 +1,98 @@
+"""
+Тесты очереди исполнения (execution_outbox) на подставном курсоре: ключ идемпотентности,
+отказ при потерянной аренде, завершение задачи в транзакции вызывающего
+"""
+from contextlib import contextmanager
+
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from execution_outbox import ExecutionOutbox, make_idempotency_key
+
+
+class ScriptedCursor:
+    """Курсор, отвечающий заранее заданными результатами по порядку запросов"""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.executed = []
+        self.current = {}
+
+    def execute(self, sql, params=None):
+        self.executed.append((' '.join(sql.split()), params))
+        self.current = self.responses.pop(0) if self.responses else {}
+
+    def fetchone(self):
+        return self.current.get('one')
+
+    def fetchall(self):
+        return self.current.get('all', [])
+
+    @property
+    def rowcount(self):
+        return self.current.get('rowcount', 0)
+
+    @property
+    def description(self):
+        return [(name,) for name in self.current.get('columns', ())]
+
+
+class FakeDB:
+    def __init__(self, responses=()):
+        self.cur = ScriptedCursor(responses)
+        self.commits = 0
+
+    @contextmanager
+    def connection(self):
+        yield self
+
+    @contextmanager
+    def cursor(self, cursor_factory=None):
+        yield self.cur
+
+    def commit(self):
+        self.commits += 1
+
+
+def test_enqueue_uses_next_attempt_as_idempotency_key():
+    db = FakeDB([{'one': (3,)}, {'one': (7, 'order_1:close:3'), 'columns': ('id', 'idempotency_key')}])
+    job = ExecutionOutbox(db.connection, worker_id='w').enqueue('order_1', 'close', 'wallet')
+    assert job == {'id': 7, 'idempotency_key': 'order_1:close:3'}
+    assert db.cur.executed[1][1][0] == make_idempotency_key('order_1', 'close', 3)
+    assert 'ON CONFLICT DO NOTHING' in db.cur.executed[1][0]
+    assert db.commits == 1
+
+
+def test_enqueue_returns_none_when_action_is_already_blocked():
+    db = FakeDB([{'one': (2,)}, {'one': None}])
+    assert ExecutionOutbox(db.connection, worker_id='w').enqueue('order_1', 'close') is None
+
+
+def test_mark_sending_requires_own_claimed_lease():
+    db = FakeDB([{'rowcount': 0}, {'rowcount': 1}])
+    outbox = ExecutionOutbox(db.connection, worker_id='w')
+    assert outbox.mark_sending(5) is False  # Аренду забрал другой воркер: отправлять нельзя
+    assert outbox.mark_sending(5) is True
+    sql, params = db.cur.executed[0]
+    assert "state = 'claimed' AND lease_owner = %s" in sql
+    assert params[-1] == 'w'
+
+
+def test_finish_runs_in_callers_transaction():
+    db = FakeDB()
+    outbox = ExecutionOutbox(db.connection, worker_id='w')
+    caller_cur = ScriptedCursor([{}])
+    outbox.finish(5, 'done', result={'seqno': 1}, cur=caller_cur)
+    assert db.commits == 0 and db.cur.executed == []
+    sql, params = caller_cur.executed[0]
+    assert "state IN ('claimed', 'sending')" in sql
+    assert params[0] == 'done' and params[-2:] == (5, 'w')
+
+
+def test_recover_abandoned_never_requeues_started_sends():
+    db = FakeDB([{'all': [('order_a',)]}, {'all': [('order_b',)]}])
+    recovered = ExecutionOutbox(db.connection, worker_id='w').recover_abandoned()
+    assert recovered == {'requeued': ['order_a'], 'unknown': ['order_b']}
+    assert "SET state = 'pending'" in db.cur.executed[0][0] and "WHERE state = 'claimed'" in db.cur.executed[0][0]
+    assert "SET state = 'unknown'" in db.cur.executed[1][0] and "WHERE state = 'sending'" in db.cur.executed[1][0]
@@ -0,0 +1,91 @@
+"""
+Тесты пула исполнения (execution_pool): последовательность задач одного кошелька,
+параллельность разных кошельков, дедупликация по ключу задачи
+"""
+import threading
+import time
+
+from execution_pool import ExecutionPool
+
+
+def wait_idle(pool, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        metrics = pool.get_metrics()
+        if not metrics['queue_depth'] and not metrics['running'] and not metrics['active_wallets']:
+            return
+        time.sleep(0.01)
+    raise AssertionError("пул не освободился")
+
+
+def test_same_wallet_tasks_run_sequentially_in_order():
+    pool = ExecutionPool()
+    lock = threading.Lock()
+    running = []
+    overlaps = []
+    order = []
+
+    def task(_, key):
+        with lock:
+            running.append(key)
+            if len(running) > 1:
+                overlaps.append(key)
+        time.sleep(0.02)
+        with lock:
+            running.remove(key)
+            order.append(key)
+
+    for i in range(5):
+        assert pool.submit('wallet', f"order_{i}", task, f"order_{i}")
+    wait_idle(pool)
+    assert overlaps == []
+    assert order == [f"order_{i}" for i in range(5)]
+    assert pool.get_metrics()['completed'] == 5
+
+
+def test_different_wallets_run_in_parallel():
+    pool = ExecutionPool()
+    barrier = threading.Barrier(2, timeout=2)
+    results = []
+
+    def task(_, key):
+        barrier.wait()  # Без параллельного выполнения второй кошелек не дойдет до барьера
+        results.append(key)
+
+    pool.submit('wallet_a', 'a', task, 'a')
+    pool.submit('wallet_b', 'b', task, 'b')
+    wait_idle(pool)
+    assert sorted(results) == ['a', 'b']
+
+
+def test_duplicate_task_key_is_ignored_while_pending():
+    pool = ExecutionPool()
+    release = threading.Event()
+    calls = []
+
+    def task(_):
+        calls.append(1)
+        release.wait(2)
+
+    assert pool.submit('wallet', 'order_1', task)
+    assert not pool.submit('wallet', 'order_1', task)
+    assert pool.is_pending('order_1')
+    release.set()
+    wait_idle(pool)
+    assert calls == [1]
+    assert not pool.is_pending('order_1')
+
+
+def test_failing_task_does_not_stop_wallet_queue():
+    pool = ExecutionPool()
+    done = []
+
+    def failing(_):
+        raise RuntimeError("swap failed")
+
+    pool.submit('wallet', 'bad', failing)
+    pool.submit('wallet', 'good', lambda task: done.append(task.task_key))
+    wait_idle(pool)
+    metrics = pool.get_metrics()
+    assert done == ['good']
+    assert (metrics['failed'], metrics['completed']) == (1, 1)
@@ -0,0 +1,197 @@
+"""
+Тесты сохранения результата исполнения (app.save_execution_result): запись ордера и завершение
+задачи outbox в одной транзакции. Нужны зависимости app; БД подменяется
+"""
+import os
+import subprocess
+import sys
+from contextlib import contextmanager
+
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("psycopg2")
+
+import app
+
+
+class FakeOutbox:
+    def __init__(self):
+        self.finished = []
+        self.enqueued = []
+        self.sent = []
+        self.lease = True
+
+    def mark_sent(self, job_id, seqno, confirm_seconds):
+        self.sent.append((job_id, seqno))
+        return self.lease
+
+    def finish(self, job_id, state, result=None, error=None, cur=None, latency=None):
+        self.finished.append((job_id, state, error))
+
+    def enqueue(self, order_id, action, wallet_key=None, payload=None, delay_seconds=0, cur=None):
+        job = {'id': len(self.enqueued) + 100, 'attempt': 2, 'payload': payload, 'delay': delay_seconds}
+        self.enqueued.append(job)
+        return job
+
+
+class FakeDB:
+    """Подключение и курсор сразу; fresh — строка, которую вернет перечитывание ордера"""
+
+    def __init__(self):
+        self.commits = 0
+        self.fresh = None
+        self.description = []
+
+    def execute(self, sql, params=None):
+        pass
+
+    def fetchone(self):
+        if self.fresh is None:
+            return None
+        self.description = [(column,) for column in self.fresh]
+        return tuple(self.fresh.values())
+
+    @contextmanager
+    def connection(self):
+        yield self
+
+    @contextmanager
+    def cursor(self):
+        yield self
+
+    def commit(self):
+        self.commits += 1
+
+
+@pytest.fixture
+def env(monkeypatch):
+    db = FakeDB()
+    outbox = FakeOutbox()
+    writes = []
+    state = {'upsert': lambda order: 2, 'writes': writes, 'outbox': outbox, 'db': db}
+
+    def upsert(cur, order, execution=False, engine_fill=False):
+        writes.append((order['id'], order['status'], execution))
+        version = state['upsert'](order)
+        if version is not None:
+            order['version'] = version
+        return version
+
+    monkeypatch.setattr(app, 'get_db_connection', db.connection)
+    monkeypatch.setattr(app, '_upsert_order', upsert)
+    monkeypatch.setattr(app, 'execution_outbox', outbox)
+    monkeypatch.setattr(app.retry_scheduler, 'schedule', lambda key, delay, callback, *args: callback(*args))
+    return state
+
+
+def make_job(**fields):
+    job = {'id': 1, 'attempt': 1, 'action': 'close', 'wallet_key': 'w', 'payload': {}}
+    job.update(fields)
+    return job
+
+
+def make_order(status='executed'):
+    return {'id': 'order_1', 'status': status, 'version': 1}
+
+
+def test_lost_lease_leaves_order_and_job_untouched(env):
+    assert app.save_execution_result(make_order(), make_job(sending=False), 'done') is False
+    assert env['writes'] == [] and env['outbox'].finished == []
+
+
+def test_order_and_job_are_committed_together(env):
+    assert app.save_execution_result(make_order(), make_job(sending=True), 'done') is True
+    assert env['writes'] == [('order_1', 'executed', True)]
+    assert env['outbox'].finished == [(1, 'done', None)]
+    assert env['db'].commits == 1
+
+
+def test_failure_after_send_started_is_unknown_not_retried(env):
+    app.save_execution_result(make_order('opened'), make_job(sending=True), 'retry', error='timeout')
+    assert env['outbox'].finished == [(1, 'unknown', 'timeout')]
+    assert env['outbox'].enqueued == []
+
+
+def test_transient_failure_enqueues_next_attempt_in_same_transaction(env):
+    app.save_execution_result(make_order('opened'), make_job(sending=None), 'retry', error='429 Too Many Requests')
+    assert env['outbox'].finished == [(1, 'retry', '429 Too Many Requests')]
+    assert len(env['outbox'].enqueued) == 1
+    assert env['outbox'].enqueued[0]['payload']['retry_reason'] == 'rate_limit'
+    assert env['db'].commits == 1
+
+
+def test_exhausted_retries_fail_the_order(env):
+    order = make_order('opened')
+    app.save_execution_result(order, make_job(sending=None, attempt=100), 'retry', error='timeout')
+    assert order['status'] == 'execution_failed'
+    assert env['outbox'].finished[0][1] == 'failed'
+    assert env['outbox'].enqueued == []
+
+
+def test_version_bump_during_swap_is_reapplied_on_fresh_row(env):
+    # PATCH SL во время обмена поднял версию: результат накладывается на свежую строку
+    env['upsert'] = lambda order: 6 if order['version'] == 5 else None
+    env['db'].fresh = {'id': 'order_1', 'status': 'opened', 'version': 5, 'stop_loss': 4.2,
+                       'executed_at': None, 'execution_type': None}
+    order = dict(make_order('executed'), stop_loss=4.0, executed_at='2024-01-01T00:00:00', execution_type='TAKE_PROFIT')
+    assert app.save_execution_result(order, make_job(sending=True), 'done') is True
+    assert env['writes'] == [('order_1', 'executed', True), ('order_1', 'executed', True)]
+    assert (order['version'], order['stop_loss'], order['execution_type']) == (6, 4.2, 'TAKE_PROFIT')
+    assert env['outbox'].finished == [(1, 'done', None)]
+
+
+def test_swap_on_cancelled_order_is_not_finished_done(env):
+    env['upsert'] = lambda order: None
+    env['db'].fresh = {'id': 'order_1', 'status': 'cancelled', 'version': 5}
+    assert app.save_execution_result(make_order('executed'), make_job(sending=True), 'done') is False
+    assert env['writes'] == [('order_1', 'executed', True)]  # Переход из cancelled повторно не пишется
+    job_id, state, error = env['outbox'].finished[0]
+    assert state == 'unknown' and error
+
+
+def sent_via_sequencer(job):
+    on_confirm = app.outbox_confirm_hook(job)
+    result = {'transaction_sent': True, 'awaiting_confirmation': True, 'seqno': 5, 'valid_until': 0}
+    return on_confirm, result
+
+
+def test_sequencer_send_is_saved_after_confirmation(env):
+    job = make_job(sending=True)
+    on_confirm, result = sent_via_sequencer(job)
+    assert app.save_execution_result(make_order(), job, 'done', result=result) is True
+    assert env['outbox'].sent == [(1, 5)]
+    assert env['writes'] == [] and env['outbox'].finished == []  # Задача остается в sending
+    on_confirm(True)
+    assert env['writes'] == [('order_1', 'executed', True)]
+    assert env['outbox'].finished == [(1, 'done', None)]
+
+
+def test_expired_sequencer_message_is_retried(env, monkeypatch):
+    monkeypatch.setattr(app, 'load_order', lambda order_id: make_order('opened'))
+    job = make_job(sending=True)
+    on_confirm, result = sent_via_sequencer(job)
+    app.save_execution_result(make_order(), job, 'done', result=result)
+    on_confirm(False)
+    job_id, state, error = env['outbox'].finished[0]
+    assert state == 'retry' and 'valid_until' in error  # Не unknown: сообщение уже не исполнится
+    assert len(env['outbox'].enqueued) == 1
+
+
+def test_lost_lease_after_sequencer_send(env):
+    env['outbox'].lease = False
+    job = make_job(sending=True)
+    on_confirm, result = sent_via_sequencer(job)
+    assert app.save_execution_result(make_order(), job, 'done', result=result) is False
+    assert env['writes'] == []
+
+
+def test_sequencer_is_disabled_outside_embedded_mode():
+    # Режим читается при импорте app: отдельный процесс с ORDER_CHECKER_MODE=sharded
+    code = "import app, wallet_sequencer; print(wallet_sequencer.sequencer_enabled())"
+    proc = subprocess.run(
+        [sys.executable, '-c', code], env=dict(os.environ, ORDER_CHECKER_MODE='sharded'),
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, timeout=60,
+    )
+    assert proc.returncode == 0, proc.stderr
+    assert proc.stdout.strip().splitlines()[-1] == 'False'
@@ -0,0 +1,100 @@
+"""
+Тесты проверки пополнения ордеров по кошелькам (app.check_orders_funding): один запрос состояния
+на кошелек, распределение баланса в порядке создания, пропуск неизменившихся кошельков.
+Нужны зависимости app (как для test_orders.py); БД не используется — загрузка и запись подменяются
+"""
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("psycopg2")
+
+import app
+
+
+class FakeStore:
+    def __init__(self):
+        self.saved = []
+        self.reject = set()
+
+    def track(self, orders, replace=False):
+        pass
+
+    def save(self, order, on_conflict=None):
+        if order['id'] in self.reject:
+            on_conflict(order)
+            return False
+        self.saved.append(order['id'])
+        return True
+
+
+def make_order(order_id, amount, status='unfunded', created_at='2024-01-01T00:00:00'):
+    return {'id': order_id, 'amount': amount, 'status': status, 'created_at': created_at,
+            'order_wallet_id': 1, 'order_wallet': None}
+
+
+@pytest.fixture
+def funding(monkeypatch):
+    env = {'orders': [], 'state': {'balance': 0.0, 'last_lt': 1}, 'state_calls': 0}
+    store = FakeStore()
+
+    def wallet_state(address):
+        env['state_calls'] += 1
+        return dict(env['state'])
+
+    monkeypatch.setattr(app, 'load_orders', lambda **kwargs: {'orders': [dict(o) for o in env['orders']]})
+    monkeypatch.setattr(app, 'get_order_wallet_addresses', lambda ids: {1: 'EQ_wallet'})
+    monkeypatch.setattr(app, 'get_wallet_state', wallet_state)
+    monkeypatch.setattr(app, 'order_store', store)
+    monkeypatch.setattr(app, 'checker_owns', lambda key: True)
+    monkeypatch.setattr(app, '_funding_wallet_state', {})
+    env['store'] = store
+    return env
+
+
+def test_allocation_follows_creation_order_and_stops_at_first_gap():
+    orders = [
+        make_order('late', 1.0, created_at='2024-01-03T00:00:00'),
+        make_order('early', 2.0, created_at='2024-01-01T00:00:00'),
+        make_order('small', 0.1, created_at='2024-01-04T00:00:00'),
+    ]
+    # 3.5 - резерв 0.3 = 3.2: хватает на early (2.1) и late (1.1)
+    funded = app.allocate_wallet_funding(3.5, 0.3, orders)
+    assert [o['id'] for o in funded] == ['early', 'late']
+    # Не хватает на late — более поздний small его не обгоняет
+    assert [o['id'] for o in app.allocate_wallet_funding(2.5, 0.0, orders)] == ['early']
+
+
+def test_wallet_is_read_once_and_reserve_of_funded_orders_counts(funding):
+    funding['orders'] = [
+        make_order('opened', 1.0, status='opened'),
+        make_order('a', 1.0, created_at='2024-01-01T00:00:00'),
+        make_order('b', 1.0, created_at='2024-01-02T00:00:00'),
+    ]
+    funding['state'] = {'balance': 2.3, 'last_lt': 10}  # Резерв 1.1 — остается 1.2 только на 'a'
+    app.check_orders_funding()
+    assert funding['state_calls'] == 1
+    assert funding['store'].saved == ['a']
+
+
+def test_unchanged_wallet_is_skipped_until_new_transaction(funding):
+    funding['orders'] = [make_order('a', 5.0)]
+    funding['state'] = {'balance': 1.0, 'last_lt': 10}
+    app.check_orders_funding()
+    app.check_orders_funding()
+    assert funding['state_calls'] == 2  # Состояние читается, но распределение не повторяется
+    assert funding['store'].saved == []
+    funding['state'] = {'balance': 6.0, 'last_lt': 11}
+    app.check_orders_funding()
+    assert funding['store'].saved == ['a']
+
+
+
+def test_rejected_write_forces_recheck(funding):
+    funding['orders'] = [make_order('a', 1.0)]
+    funding['state'] = {'balance': 2.0, 'last_lt': 10}
+    funding['store'].reject = {'a'}
+    app.check_orders_funding()
+    assert 'EQ_wallet' not in app._funding_wallet_state
+    funding['store'].reject = set()
+    app.check_orders_funding()  # lt тот же, но кошелек проверяется заново
+    assert funding['store'].saved == ['a']
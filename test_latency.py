@@ -0,0 +1,66 @@
+"""
+Тесты трасс задержки исполнения (latency): длительности этапов, перенос трассы через payload,
+гистограммы с квантилями по корзинам
+"""
+import time
+
+import pytest
+
+from latency import LatencyHistogram, LatencyStats, LatencyTrace
+
+
+def test_durations_follow_stage_order_and_skip_missing():
+    trace = LatencyTrace(start=100.0)
+    trace.stamp('price_fetched', 100.0)
+    trace.stamp('sent', 100.5)
+    trace.stamp('evaluated', 100.1)
+    assert trace.durations() == [
+        ('price_fetched->evaluated', pytest.approx(0.1)),
+        ('evaluated->sent', pytest.approx(0.4)),
+        ('total', pytest.approx(0.5)),
+    ]
+
+
+def test_trace_continues_from_payload():
+    trace = LatencyTrace()
+    trace.stamp('price_fetched')
+    trace.label(pair='TON-USDT', dex=None)
+    restored = LatencyTrace.from_dict(trace.to_dict())
+    assert restored.labels == {'pair': 'TON-USDT'}
+    restored.stamp('execution_started')
+    [(name, seconds), _] = restored.durations()
+    assert name == 'price_fetched->execution_started'
+    assert 0 <= seconds < 1  # Продолжение по часам, без скачка между процессами
+
+
+def test_trace_starts_at_price_fetch_moment():
+    fetched_at = time.monotonic() - 2
+    trace = LatencyTrace(fetched_at)
+    trace.stamp('price_fetched', fetched_at)
+    trace.stamp('evaluated')
+    assert trace.durations()[-1][1] >= 2
+    assert trace.origin == pytest.approx(time.time() - 2, abs=0.1)
+
+
+def test_histogram_quantiles_use_bucket_bounds():
+    histogram = LatencyHistogram()
+    for value in [3] * 90 + [40] * 9 + [100000]:
+        histogram.observe(value)
+    summary = histogram.to_dict()
+    assert (summary['p50_ms'], summary['p95_ms'], summary['p99_ms']) == (5.0, 50.0, 50.0)
+    assert summary['max_ms'] == 100000 and summary['buckets'] == {'le_5': 90, 'le_50': 9, 'inf': 1}
+    assert LatencyHistogram().quantile(0.5) == 0.0
+
+
+def test_stats_group_by_dex_and_pair():
+    stats = LatencyStats()
+    trace = LatencyTrace(start=0.0)
+    trace.stamp('price_fetched', 0.0)
+    trace.stamp('sent', 0.015)
+    trace.label(dex='stonfi', pair='TON-USDT')
+    stats.observe(trace)
+    stats.observe(LatencyTrace())  # Без этапов — не учитывается
+    snapshot = stats.snapshot()
+    assert snapshot['all']['total']['count'] == 1
+    assert snapshot['by_dex']['stonfi']['price_fetched->sent']['p50_ms'] == 20.0
+    assert list(snapshot['by_pair']) == ['TON-USDT']
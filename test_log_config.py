@@ -0,0 +1,72 @@
+"""
+Тесты неблокирующего логирования (log_config): очередь без ожидания, ленивое форматирование,
+JSON-записи с полями extra и сэмплирование debug-записей тика
+"""
+import json
+import logging
+import queue
+
+import pytest
+
+from log_config import JsonFormatter, NonBlockingQueueHandler, debug_sampled
+
+
+class Exploding:
+    """Аргумент, форматирование которого в потоке вызова — ошибка теста"""
+
+    def __str__(self):
+        raise AssertionError("formatted on the calling thread")
+
+
+class Capture(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.DEBUG)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+@pytest.fixture
+def logger():
+    logger = logging.getLogger("test_log_config")
+    logger.propagate = False
+    logger.handlers = [Capture()]
+    yield logger
+    logger.handlers = []
+
+
+def test_queue_handler_drops_instead_of_blocking():
+    handler = NonBlockingQueueHandler(queue.Queue(1))
+    logger = logging.getLogger("test_log_config.queue")
+    logger.propagate = False
+    logger.handlers = [handler]
+    logger.warning("first %s", Exploding())  # Сообщение не собирается в потоке вызова
+    logger.warning("second")
+    assert handler.dropped == 1
+    record = handler.queue.get_nowait()
+    assert isinstance(record.args[0], Exploding)
+
+
+def test_json_formatter_includes_extra_fields():
+    record = logging.LogRecord("dex.orders", logging.INFO, __file__, 1, "tick %s", ("TON-USDT",), None)
+    record.order_id = "o1"
+    data = json.loads(JsonFormatter().format(record))
+    assert data['msg'] == "tick TON-USDT"
+    assert (data['level'], data['logger'], data['order_id']) == ('INFO', 'dex.orders', 'o1')
+    assert 'args' not in data
+
+
+def test_debug_sampled_is_free_when_debug_is_off(logger):
+    logger.setLevel(logging.INFO)
+    debug_sampled(logger, "order %s", Exploding(), rate=1.0)
+    assert logger.handlers[0].records == []
+
+
+def test_debug_sampled_respects_rate(logger):
+    logger.setLevel(logging.DEBUG)
+    debug_sampled(logger, "skipped", rate=0.0)
+    debug_sampled(logger, "order %s", "o1", rate=1.0, order_id="o1")
+    [record] = logger.handlers[0].records
+    assert record.getMessage() == "order o1" and record.order_id == "o1"
+    assert record.funcName == 'test_debug_sampled_respects_rate'  # Место вызова, а не debug_sampled
@@ -0,0 +1,87 @@
+"""
+Тесты актора-владельца OrderProcessor: команды из разных потоков применяются одним потоком,
+ошибки возвращаются через Future, чтение — из неизменяемого снимка
+"""
+import threading
+from decimal import Decimal
+
+import pytest
+
+from order_actor import OrderActor
+from order_system import Order, OrderProcessor, OrderStatus, OrderType, PositionSide
+
+
+def make_order(order_id, **fields):
+    return Order(id=order_id, symbol='TON-USDT', quantity=Decimal(1), type=OrderType.LIMIT,
+                 side=PositionSide.LONG, status=OrderStatus.ACTIVE, **fields)
+
+
+@pytest.fixture
+def actor():
+    actor = OrderActor(OrderProcessor(lambda symbol: Decimal(0)), snapshot_interval=0)
+    actor.start()
+    yield actor
+    actor.stop(timeout=2)
+
+
+def test_commands_run_on_single_owner_thread(actor):
+    threads = set()
+
+    def command(processor, i):
+        threads.add(threading.current_thread().name)
+        processor.add_order(make_order(f"o{i}", limit_price=Decimal(1)))
+
+    workers = [threading.Thread(target=lambda i=i: actor.call(command, i, timeout=2)) for i in range(20)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert threads == {'order-actor'}
+    assert len(actor.processor.orders) == 20
+
+
+def test_command_error_goes_to_future_and_actor_continues(actor):
+    def broken(processor):
+        raise ValueError("bad")
+
+    with pytest.raises(ValueError):
+        actor.call(broken, timeout=2)
+    assert actor.call(lambda processor: 'ok', timeout=2) == 'ok'
+    assert actor.get_metrics()['errors'] == 1
+
+
+def test_nested_submit_runs_inline(actor):
+    def outer(processor):
+        return actor.submit(lambda p: p is processor).result(timeout=1)
+
+    assert actor.call(outer, timeout=2) is True
+
+
+def test_snapshot_is_published_and_read_only(actor):
+    order = actor.add_order(make_order('a', limit_price=Decimal(2))).result(timeout=2)
+    assert order.id == 'a'
+    actor.call(lambda processor: None, timeout=2)  # Снимок публикуется после команды
+    snapshot = actor.snapshot()
+    assert 'a' in snapshot and snapshot.version >= 1
+    copy = snapshot.get('a')
+    copy['status'] = 'tampered'
+    assert snapshot.get('a')['status'] == OrderStatus.ACTIVE.value
+    with pytest.raises(TypeError):
+        snapshot._orders['b'] = {}
+
+
+def test_cancel_and_modify_commands(actor):
+    actor.add_order(make_order('a', limit_price=Decimal(2))).result(timeout=2)
+    actor.add_order(make_order('b', limit_price=Decimal(2))).result(timeout=2)
+
+    def raise_limit(order):
+        order.limit_price = Decimal(5)
+
+    modified = actor.modify_order('b', raise_limit).result(timeout=2)
+    assert modified.limit_price == Decimal(5)
+    executed = actor.tick('TON-USDT', Decimal(4)).result(timeout=2)
+    assert [o.id for o in executed] == ['b']  # Переиндексация: новый уровень лимита сработал
+    cancelled = actor.cancel_order('a').result(timeout=2)
+    assert cancelled.status == OrderStatus.CANCELLED
+    assert 'a' not in actor.processor.orders
+    assert actor.cancel_order('a').result(timeout=2) is None
@@ -0,0 +1,204 @@
+"""
+Тесты записи исполнений OrderEngine (order_engine): исполнения пишутся путем исполнения движка,
+из процессора уходят только ордера, запись которых прошла. Нужны зависимости app; БД подменяется
+"""
+import asyncio
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("psycopg2")
+
+import order_engine
+from order_engine import OrderEngine
+from order_system import Order, OrderProcessor, OrderStatus, OrderType, PositionSide
+
+
+def make_order(order_id, limit_price='5', version=1):
+    order = Order(
+        id=order_id, symbol='TON-USDT', quantity=Decimal('1'), type=OrderType.LIMIT, side=PositionSide.LONG,
+        status=OrderStatus.ACTIVE, limit_price=Decimal(limit_price), created_at=datetime(2024, 1, 1),
+    )
+    order.db_version = version
+    return order
+
+
+def db_row(order_id, status='waiting_entry', version=2):
+    return {
+        'id': order_id, 'type': 'long', 'order_type': 'LIMIT', 'pair': 'TON-USDT', 'amount': 1.0,
+        'entry_price': 5.0, 'status': status, 'version': version, 'created_at': '2024-01-01T00:00:00',
+    }
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    env = {'fills': [], 'lost': set(), 'rows': {}}
+
+    def save_engine_fills(orders):
+        env['fills'].extend(order['status'] for order in orders)
+        return [order['id'] for order in orders if order['id'] not in env['lost']]
+
+    monkeypatch.setattr(order_engine, 'save_engine_fills', save_engine_fills)
+    monkeypatch.setattr(order_engine, 'iter_orders', lambda ids: [env['rows'][i] for i in ids if i in env['rows']])
+    env['engine'] = OrderEngine.__new__(OrderEngine)  # Без актора и потоков: только логика записи
+    env['processor'] = OrderProcessor(lambda symbol: Decimal('0'))
+    return env
+
+
+def test_fills_are_written_as_executed_and_removed(engine):
+    processor = engine['processor']
+    processor.add_order(make_order('a'))
+    executed = engine['engine']._apply_prices(processor, {'TON-USDT': Decimal('4.9')})
+    assert [order.id for order in executed] == ['a']
+    assert engine['fills'] == ['executed']
+    assert 'a' not in processor.orders
+
+
+def test_lost_fill_stays_in_engine_with_db_state(engine):
+    processor = engine['processor']
+    processor.add_order(make_order('a'))
+    processor.add_order(make_order('b'))
+    engine['lost'] = {'b'}
+    engine['rows'] = {'b': db_row('b', version=7)}  # Строку изменил другой писатель, ордер еще жив
+    executed = engine['engine']._apply_prices(processor, {'TON-USDT': Decimal('4.9')})
+    assert [order.id for order in executed] == ['a']
+    assert 'a' not in processor.orders
+    reloaded = processor.orders['b']
+    assert reloaded.status == OrderStatus.ACTIVE and reloaded.db_version == 7
+
+
+def test_lost_fill_of_cancelled_row_is_dropped(engine):
+    processor = engine['processor']
+    processor.add_order(make_order('a'))
+    engine['lost'] = {'a'}
+    engine['rows'] = {'a': db_row('a', status='cancelled')}
+    assert engine['engine']._apply_prices(processor, {'TON-USDT': Decimal('4.9')}) == []
+    assert 'a' not in processor.orders
+
+
+def test_engine_rows_keep_their_order_type(engine):
+    order = make_order('a')
+    order.type = OrderType.STOP_LOSS
+    order.side = PositionSide.SHORT
+    row = engine['engine']._to_db_order(order)
+    assert (row['type'], row['order_type']) == ('short', 'STOP_LOSS')  # Не попадает в legacy-проверку
+    restored = OrderEngine._convert_legacy_order(dict(row, status='waiting_entry'))
+    assert (restored.type, restored.side) == (OrderType.STOP_LOSS, PositionSide.SHORT)
+
+
+class DirectActor:
+    def __init__(self, processor):
+        self.processor = processor
+
+    def call(self, command):
+        return command(self.processor)
+
+
+def test_legacy_check_and_engine_load_split_by_order_type(engine, monkeypatch):
+    import app
+    calls = []
+
+    def load_orders(**kwargs):
+        calls.append(kwargs)
+        return {'orders': [db_row('a')] if kwargs.get('engine') else []}
+
+    monkeypatch.setattr(app, 'load_orders', load_orders)
+    monkeypatch.setattr(order_engine, 'load_orders', load_orders)
+    app.check_orders_execution(pairs=['TON-USDT'], current_prices={})
+    engine['engine'].actor = DirectActor(engine['processor'])
+    engine['engine'].load_orders_from_db()
+    assert [call['engine'] for call in calls] == [False, True]
+    assert engine['processor'].orders['a'].db_version == 2
+
+
+class FakeChangeLog:
+    def __init__(self, changed, fail=False):
+        self.changed = changed
+        self.fail = fail
+
+    def changed_since(self, seq, taken_at):
+        if self.fail:
+            raise RuntimeError("db down")
+        return self.changed
+
+
+def warm_engine(engine, monkeypatch, snapshot_orders, changed, rows, fail=False):
+    monkeypatch.setattr(order_engine, 'read_snapshot', lambda path: {
+        'seq': 10, 'taken_at': datetime.now(), 'orders': snapshot_orders,
+    })
+    monkeypatch.setattr(order_engine, 'load_orders', lambda **kwargs: {
+        'orders': [rows[i] for i in kwargs.get('ids', []) if i in rows],
+    })
+    engine['engine'].change_log = FakeChangeLog(changed, fail)
+    engine['engine'].actor = DirectActor(engine['processor'])
+    return engine['engine']
+
+
+def test_warm_start_replays_changes_after_snapshot(engine, monkeypatch):
+    stop = make_order('a')
+    stop.type = OrderType.STOP_LOSS
+    stop.stop_price = Decimal('4')
+    rows = {
+        'a': dict(db_row('a', version=3), amount=2.0),       # Изменен вне движка
+        'b': db_row('b', status='cancelled'),                # Отменен после снимка
+        'c': db_row('c', version=1),                         # Изменение уже в снимке
+        'd': db_row('d'),                                    # Новый ордер движка
+        'e': dict(db_row('e'), order_type=None),             # Legacy-ордер
+    }
+    snapshot_orders = [stop, make_order('b'), make_order('c', limit_price='6')]
+    warm = warm_engine(engine, monkeypatch, snapshot_orders, list(rows), rows)
+    warm.warm_start()
+    orders = engine['processor'].orders
+    assert set(orders) == {'a', 'c', 'd'}
+    assert orders['a'].type == OrderType.STOP_LOSS  # Тип и уровни — из снимка
+    assert (orders['a'].quantity, orders['a'].db_version) == (Decimal('2'), 3)
+    assert orders['c'].limit_price == Decimal('6')
+    assert orders['d'].db_version == 2
+    for order_id in rows:  # Повторное применение ничего не меняет
+        OrderEngine._replay_change(engine['processor'], order_id, rows[order_id])
+    assert set(orders) == {'a', 'c', 'd'} and orders['a'].quantity == Decimal('2')
+
+
+def test_warm_start_falls_back_to_full_load(engine, monkeypatch):
+    warm = warm_engine(engine, monkeypatch, [make_order('stale')], [], {}, fail=True)
+    monkeypatch.setattr(order_engine, 'load_orders', lambda **kwargs: {'orders': [db_row('a')]})
+    warm.warm_start()
+    assert set(engine['processor'].orders) == {'a'}
+
+
+def test_symbol_loop_counts_overruns_and_skipped_ticks(engine):
+    class ImmediateActor:
+        def submit(self, fn, *args):
+            future = Future()
+            future.set_result(fn(engine['processor'], *args))
+            return future
+
+    warm = engine['engine']
+    warm.actor = ImmediateActor()
+    warm.tick_interval = 0.01
+    warm.symbol_intervals = {}
+    warm.tick_metrics = {}
+    warm.running = True
+
+    def slow_price(symbol):
+        time.sleep(0.035)  # Дольше трех периодов
+        return Decimal('5')
+
+    warm._get_price = slow_price
+
+    async def run():
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            task = asyncio.create_task(warm._symbol_loop('TON-USDT', asyncio.Semaphore(1), executor))
+            await asyncio.sleep(0.2)
+            warm.running = False
+            await task
+
+    asyncio.run(run())
+    metrics = warm.get_tick_metrics()['TON-USDT']
+    assert metrics['ticks'] >= 2 and metrics['overruns'] == metrics['ticks']
+    assert metrics['skipped'] >= 2 * metrics['ticks']
+    assert metrics['errors'] == 0 and metrics['interval'] == 0.01
@@ -0,0 +1,60 @@
+"""
+Тесты исполнения свопа (order_executor): неотправленная транзакция — неуспех, ошибка секвенсора
+возвращается с признаком transient. RPC, DEX и кошелек подменяются
+"""
+import pytest
+
+pytest.importorskip("pytoniq_core")
+pytest.importorskip("dotenv")
+
+import order_executor
+
+MNEMONIC = "word " * 23 + "word"
+POOL = {'address': 'EQ-pool', 'dex': 'DeDust', 'from_token': 'TON', 'to_token': 'USDT'}
+ORDER = {'id': 'order_1', 'type': 'long', 'action': 'open', 'amount': 1.0, 'pair': 'TON-USDT'}
+CREDENTIALS = {'address': 'EQ-order-wallet', 'mnemonic': MNEMONIC, 'cache_key': 'id:1'}
+
+
+@pytest.fixture
+def swap(monkeypatch):
+    monkeypatch.setenv('DEDUST_NATIVE_VAULT', 'EQ-vault')
+    monkeypatch.setattr(order_executor, 'determine_swap_direction', lambda order, pool: ('TON', 'USDT', None, 'TON -> USDT'))
+    monkeypatch.setattr(order_executor, 'get_balance', lambda address: 100.0)
+    monkeypatch.setattr(order_executor, 'calculate_quote_for_execution', lambda amount, pool, slippage: (5.0, 4_900_000, 5_000_000))
+    monkeypatch.setattr(order_executor, 'validate_address', lambda address: address)
+    monkeypatch.setattr(order_executor, 'dedust_create_swap_payload', lambda *args: 'payload')
+    sent = {}
+
+    def send(address, mnemonic, dest, amount, payload, cache_key=None, on_confirm=None):
+        return dict(sent)
+
+    monkeypatch.setattr(order_executor, '_maybe_send_transaction', send)
+    return sent
+
+
+def test_unsent_transaction_is_not_success(swap):
+    swap.update(transaction_sent=False, message='Failed to connect to TON network', transient=True)
+    result = order_executor.execute_order_swap(ORDER, POOL, CREDENTIALS)
+    assert result['success'] is False
+    assert result['error'] == 'Failed to connect to TON network' and result['transient'] is True
+
+
+def test_sent_transaction_is_success(swap):
+    swap.update(transaction_sent=True, message='Transaction sent successfully', seqno=5)
+    result = order_executor.execute_order_swap(ORDER, POOL, CREDENTIALS)
+    assert result['success'] is True and result['seqno'] == 5
+    assert 'error' not in result
+
+
+def test_sequencer_error_is_reported_as_unsent(monkeypatch):
+    class Sequencer:
+        def send(self, *args, **kwargs):
+            raise TimeoutError("timeout waiting for wallet queue")
+
+    monkeypatch.setattr(order_executor, 'get_balance', lambda address: 100.0)
+    monkeypatch.setattr(order_executor, 'get_wallet_sequencer', lambda *args, **kwargs: Sequencer())
+    result = order_executor._send_via_sequencer(
+        {'transaction_sent': False, 'transient': False}, 'EQ-order-wallet', MNEMONIC, 'EQ-vault', 10**9, None, 'id:1'
+    )
+    assert result['transaction_sent'] is False
+    assert result['transient'] is True  # Таймаут очереди — повтор через outbox
@@ -0,0 +1,106 @@
+"""
+Тесты пакетной записи ордеров (OrderPersistence) без БД: execute_values подменяется,
+отклоненные CAS-записи задаются набором id
+"""
+from contextlib import contextmanager
+
+import pytest
+
+pytest.importorskip("psycopg2")
+
+import order_persistence
+from order_persistence import OrderPersistence
+
+
+class FakeDB:
+    def __init__(self):
+        self.rejected = set()
+        self.statements = []
+
+    @contextmanager
+    def connection(self):
+        yield self
+
+    @contextmanager
+    def cursor(self):
+        yield self
+
+    def commit(self):
+        pass
+
+    def execute_values(self, cur, sql, rows, template=None, page_size=None, fetch=False):
+        self.statements.append(sql)
+        return [(row[0], 2) for row in rows if row[0] not in self.rejected]
+
+
+@pytest.fixture
+def db(monkeypatch):
+    fake = FakeDB()
+    monkeypatch.setattr(order_persistence.psycopg2.extras, 'execute_values', fake.execute_values)
+    return fake
+
+
+def make_order(order_id, status='waiting_entry', version=1):
+    return {
+        'id': order_id, 'type': 'long', 'pair': 'TON-USDT', 'amount': 1, 'entry_price': 2,
+        'user_wallet': 'u', 'status': status, 'created_at': '2024-01-01T00:00:00', 'version': version,
+    }
+
+
+def test_tracked_order_writes_only_dirty_columns(db):
+    store = OrderPersistence(db.connection)
+    order = make_order('a')
+    store.track([order])
+    changed = dict(order, status='opened')
+    assert store.flush([changed]) == []
+    assert len(db.statements) == 1
+    assert 'status = v.status' in db.statements[0]
+    assert 'stop_loss' not in db.statements[0]
+    assert changed['version'] == 2
+
+
+def test_flush_returns_conflicted_ids(db):
+    store = OrderPersistence(db.connection)
+    db.rejected = {'b'}
+    a, b = make_order('a'), make_order('b')
+    assert store.flush([a, b]) == ['b']
+    assert a['version'] == 2
+    assert b['version'] == 1
+
+
+def test_batch_reports_conflicts_to_callback(db):
+    store = OrderPersistence(db.connection)
+    db.rejected = {'b'}
+    conflicted = []
+    with store.batch():
+        assert store.save(make_order('a'), on_conflict=conflicted.append)
+        assert store.save(make_order('b'), on_conflict=conflicted.append)
+        assert db.statements == []  # До конца пакета ничего не пишется
+    assert [order['id'] for order in conflicted] == ['b']
+
+
+def test_save_outside_batch_returns_false_on_conflict(db):
+    store = OrderPersistence(db.connection)
+    db.rejected = {'a'}
+    conflicted = []
+    assert store.save(make_order('a'), on_conflict=conflicted.append) is False
+    assert len(conflicted) == 1
+    assert store.save_many([make_order('b')]) is True
+
+
+def test_unversioned_order_is_insert_only(db):
+    store = OrderPersistence(db.connection)
+    db.rejected = {'a'}  # Строка уже есть: INSERT ... DO NOTHING ничего не возвращает
+    assert store.flush([make_order('a', version=None)]) == ['a']
+    assert 'ON CONFLICT (id) DO NOTHING' in db.statements[0]
+    assert 'DO UPDATE' not in db.statements[0]
+
+
+def test_nested_batches_flush_once_at_outer_exit(db):
+    store = OrderPersistence(db.connection)
+    with store.batch():
+        with store.batch():
+            store.save(make_order('a'))
+        assert db.statements == []
+        store.save(make_order('b'))
+    assert len(db.statements) == 1
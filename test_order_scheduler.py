@@ -0,0 +1,81 @@
+"""
+Тесты единого планировщика проверки ордеров (order_scheduler) и чистых условий legacy-ордеров
+(order_evaluators)
+"""
+from contextlib import contextmanager
+
+from order_evaluators import entry_condition, exit_condition, side_price
+from order_scheduler import OrderEvaluator, OrderScheduler
+from price_events import PriceEventBus, PriceWatcher
+
+
+class Recorder(OrderEvaluator):
+    def __init__(self, name, log, fail=False):
+        self.name = name
+        self.log = log
+        self.fail = fail
+
+    def evaluate(self, prices, full):
+        self.log.append((self.name, sorted(prices), full))
+        if self.fail:
+            raise RuntimeError("evaluator failed")
+
+
+def make_scheduler(log):
+    bus = PriceEventBus()
+    watcher = PriceWatcher(bus, lambda: [], lambda pair: None)
+
+    @contextmanager
+    def tick():
+        log.append('begin')
+        yield
+        log.append('end')
+
+    return OrderScheduler(bus, watcher, lambda: [], on_heartbeat=lambda: log.append('heartbeat'), tick_context=tick)
+
+
+def test_pass_runs_all_evaluators_inside_one_context():
+    log = []
+    scheduler = make_scheduler(log)
+    evaluator = Recorder('legacy', log, fail=True)
+    scheduler.register(evaluator)
+    scheduler.register(evaluator)  # Повторная регистрация игнорируется
+    scheduler.register(Recorder('advanced', log))
+    scheduler.run_once({'TON-USDT': {'long': 1.0}}, full=True)
+    assert log == ['begin', 'heartbeat', ('legacy', ['TON-USDT'], True), ('advanced', ['TON-USDT'], True), 'end']
+    metrics = scheduler.get_metrics()
+    assert (metrics['full_passes'], metrics['errors']) == (1, 1)
+
+
+def test_event_pass_skips_heartbeat():
+    log = []
+    scheduler = make_scheduler(log)
+    scheduler.register(Recorder('legacy', log))
+    scheduler.run_once({'TON-USDT': {'long': 1.0}}, full=False)
+    assert 'heartbeat' not in log
+    assert scheduler.get_metrics()['event_passes'] == 1
+
+
+def test_price_events_coalesce_per_pair():
+    scheduler = make_scheduler([])
+    scheduler._on_price_change('TON-USDT', {'long': 1.0}, None)
+    scheduler._on_price_change('TON-USDT', {'long': 2.0}, None)
+    assert scheduler._pending == {'TON-USDT': {'long': 2.0}}
+    assert scheduler._wakeup.is_set()
+
+
+def test_entry_condition_direction_and_slippage():
+    order = {'type': 'long', 'entry_price': 100.0}
+    assert entry_condition(order, 99.5, 90.0, 1.0) == (True, 'Buy Stop', 99.0)  # Граница снижена на 1%
+    assert entry_condition(order, 98.0, 90.0, 1.0)[0] is False
+    assert entry_condition(order, 101.0, 110.0, 1.0) == (True, 'Buy Limit', 101.0)
+    short = {'type': 'short', 'entry_price': 100.0}
+    assert entry_condition(short, 100.5, 90.0, 1.0)[:2] == (True, 'Sell Limit')
+
+
+def test_exit_condition_stop_loss_before_take_profit():
+    order = {'type': 'short', 'entry_price': 10.0, 'stop_loss': 12.0, 'take_profit': 8.0, 'amount': 2.0}
+    assert exit_condition(order, 12.5) == ('STOP_LOSS', -4.0)
+    assert exit_condition(order, 7.5) == ('TAKE_PROFIT', 4.0)
+    assert exit_condition(order, 10.0) is None
+    assert side_price(order, {'long': 1.0, 'short': 2.0}) == 2.0
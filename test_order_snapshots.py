@@ -0,0 +1,54 @@
+"""
+Тесты снимков OrderProcessor (order_snapshots): атомарная запись, проверка формата и возраста,
+приведение времени с поясом к локальному
+"""
+import pickle
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import order_snapshots
+from order_snapshots import SNAPSHOT_FORMAT, dump_processor, read_snapshot, write_snapshot
+from order_system import Order, OrderProcessor, OrderStatus, OrderType, PositionSide
+
+
+def make_processor():
+    processor = OrderProcessor(lambda symbol: Decimal(0))
+    processor.add_order(Order(id='a', symbol='TON-USDT', quantity=Decimal(1), type=OrderType.STOP_LOSS,
+                              side=PositionSide.LONG, status=OrderStatus.ACTIVE, stop_price=Decimal('4.5')))
+    return processor
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / 'engine.snapshot')
+    taken_at = datetime.now()
+    write_snapshot(dump_processor(make_processor(), (42, taken_at)), path)
+    snapshot = read_snapshot(path)
+    assert snapshot['seq'] == 42 and snapshot['taken_at'] == taken_at
+    [order] = snapshot['orders']
+    assert (order.id, order.stop_price) == ('a', Decimal('4.5'))
+    assert not (tmp_path / 'engine.snapshot.tmp').exists()
+
+
+def test_missing_or_foreign_snapshot_is_ignored(tmp_path):
+    path = tmp_path / 'engine.snapshot'
+    assert read_snapshot(str(path)) is None
+    path.write_bytes(pickle.dumps({'format': SNAPSHOT_FORMAT - 1, 'taken_at': datetime.now()}))
+    assert read_snapshot(str(path)) is None
+    path.write_bytes(b'not a pickle')
+    assert read_snapshot(str(path)) is None
+
+
+def test_snapshot_older_than_change_log_is_stale(tmp_path):
+    path = str(tmp_path / 'engine.snapshot')
+    old = datetime.now() - timedelta(hours=order_snapshots.ORDER_CHANGE_LOG_RETENTION_HOURS)
+    write_snapshot(dump_processor(make_processor(), (1, old)), path)
+    assert read_snapshot(path) is None
+
+
+def test_aware_taken_at_is_normalized_to_local_naive(tmp_path):
+    path = str(tmp_path / 'engine.snapshot')
+    aware = datetime.now(timezone.utc) - timedelta(minutes=10)
+    write_snapshot(dump_processor(make_processor(), (1, aware)), path)
+    snapshot = read_snapshot(path)
+    assert snapshot['taken_at'].tzinfo is None
+    assert snapshot['taken_at'] == aware.astimezone().replace(tzinfo=None)
@@ -0,0 +1,51 @@
+"""
+Тесты машины состояний ордеров и условий CAS (order_state)
+"""
+from order_state import can_transition, transition_condition, transition_order, version_condition
+
+
+def test_version_condition_rejects_null_expected_version():
+    assert version_condition('o.version', 'v.version') == '(o.version = v.version)'
+    assert 'IS NULL' not in version_condition('orders.version', '%s::integer')
+
+
+def test_executed_only_on_execution_path():
+    assert not can_transition('opened', 'executed')
+    assert can_transition('opened', 'executed', execution=True)
+    assert "('opened', 'executed')" not in transition_condition('o.status', 'v.status')
+    assert "('opened', 'executed')" in transition_condition('o.status', 'v.status', execution=True)
+
+
+class RecordingCursor:
+    def __init__(self, row):
+        self.row = row
+        self.executed = []
+
+    def execute(self, sql, params):
+        self.executed.append((sql, params))
+
+    def fetchone(self):
+        return self.row
+
+
+def test_transition_order_is_cas_on_status_and_version():
+    cur = RecordingCursor((4,))
+    order = {'id': 'order_1', 'status': 'waiting_entry', 'version': 3}
+    assert transition_order(cur, order, 'opened', opened_at='2024-01-01T00:00:00')
+    assert order == {'id': 'order_1', 'status': 'opened', 'version': 4, 'opened_at': '2024-01-01T00:00:00'}
+    sql, params = cur.executed[0]
+    assert 'WHERE id = %s AND status = %s AND version = %s' in sql
+    assert params[-3:] == ['order_1', 'waiting_entry', 3]
+
+
+def test_transition_order_lost_cas_leaves_order_unchanged():
+    order = {'id': 'order_1', 'status': 'waiting_entry', 'version': 3}
+    assert not transition_order(RecordingCursor(None), order, 'opened')
+    assert order == {'id': 'order_1', 'status': 'waiting_entry', 'version': 3}
+
+
+def test_forbidden_transition_is_not_sent_to_db():
+    cur = RecordingCursor((4,))
+    assert not transition_order(cur, {'id': 'order_1', 'status': 'cancelled', 'version': 3}, 'opened')
+    assert not transition_order(cur, {'id': 'order_1', 'status': 'opened', 'version': 3}, 'executed')
+    assert cur.executed == []
@@ -0,0 +1,163 @@
+"""
+Тесты OrderProcessor (order_system): корзины по символу/типу/статусу, очереди триггеров,
+пакетные тики и OCO-группы
+"""
+from datetime import datetime
+from decimal import Decimal
+
+from order_system import Order, OrderProcessor, OrderStatus, OrderType, PositionSide
+
+
+def D(value) -> Decimal:
+    return Decimal(str(value))
+
+
+def make_order(order_id, order_type=OrderType.LIMIT, side=PositionSide.LONG, symbol='TON-USDT', **fields):
+    fields = {key: D(value) if isinstance(value, (int, float, str)) and key != 'oco_group_id' else value
+              for key, value in fields.items()}
+    return Order(id=order_id, symbol=symbol, quantity=D(1), type=order_type, side=side,
+                 status=fields.pop('status', OrderStatus.ACTIVE), **fields)
+
+
+def make_processor(*orders) -> OrderProcessor:
+    processor = OrderProcessor(lambda symbol: D(0))
+    for order in orders:
+        processor.add_order(order)
+    return processor
+
+
+def test_buckets_follow_status_changes():
+    limit = make_order('limit', limit_price=5)
+    market = make_order('market', OrderType.MARKET, symbol='NOT-TON')
+    processor = make_processor(limit, market)
+    assert processor.get_orders('TON-USDT', OrderType.LIMIT) == [limit]
+    assert processor.get_orders('TON-USDT', OrderType.MARKET) == []
+    processor.set_status(limit, OrderStatus.CANCELLED)
+    assert processor.get_orders('TON-USDT', OrderType.LIMIT) == []
+    assert processor.get_orders('TON-USDT', OrderType.LIMIT, OrderStatus.CANCELLED) == [limit]
+    processor.remove_order('limit')
+    assert processor._buckets.get(('TON-USDT', OrderType.LIMIT, OrderStatus.CANCELLED)) is None
+
+
+def test_tick_only_touches_its_symbol():
+    ton = make_order('ton', OrderType.MARKET)
+    other = make_order('other', OrderType.MARKET, symbol='NOT-TON')
+    processor = make_processor(ton, other)
+    assert processor.process_tick('TON-USDT', D(5)) == [ton]
+    assert other.status == OrderStatus.ACTIVE
+
+
+def test_only_crossed_trigger_levels_execute():
+    near = make_order('near', OrderType.STOP_LOSS, stop_price=4.9)
+    far = make_order('far', OrderType.STOP_LOSS, stop_price=4.0)
+    take = make_order('take', OrderType.TAKE_PROFIT, stop_price=6)
+    buy = make_order('buy', limit_price=4.8)
+    sell = make_order('sell', side=PositionSide.SHORT, limit_price=5.5)
+    processor = make_processor(near, far, take, buy, sell)
+    assert processor.process_tick('TON-USDT', D('4.85')) == [near]
+    assert near.execution_price == D('4.85')
+    assert {o.id for o in processor.process_tick('TON-USDT', D('6.1'))} == {'take', 'sell'}
+    assert [o.status for o in (far, buy)] == [OrderStatus.ACTIVE, OrderStatus.ACTIVE]
+
+
+def test_moved_level_is_requeued_by_reindex():
+    order = make_order('stop', OrderType.STOP_LOSS, stop_price=4.0)
+    processor = make_processor(order)
+    order.stop_price = D('4.9')
+    processor.reindex(order)  # Старая запись кучи остается, но пропускается
+    assert processor.process_tick('TON-USDT', D('4.95')) == []
+    assert processor.process_tick('TON-USDT', D('4.9')) == [order]
+    assert processor.process_tick('TON-USDT', D('3.9')) == []  # Исполненный ордер не срабатывает повторно
+
+
+def test_removed_order_never_triggers():
+    order = make_order('stop', OrderType.STOP_LOSS, stop_price=5)
+    processor = make_processor(order)
+    processor.remove_order('stop')
+    assert processor.process_tick('TON-USDT', D(1)) == []
+
+
+def test_stale_heap_entries_are_compacted():
+    order = make_order('stop', OrderType.STOP_LOSS, stop_price=1)
+    processor = make_processor(order)
+    for i in range(500):
+        order.stop_price = D(1) + D(i) / 1000
+        processor.reindex(order)
+    heap = processor._trigger_heaps[('TON-USDT', 'stop', 'down')]
+    assert len(heap) <= 2 * 1 + 64 + 1
+
+
+def test_price_key_is_exact_nano_integer():
+    from order_system import price_key
+    assert price_key(D('5.123456789')) == 5123456789
+    assert isinstance(price_key(D('5')), int)
+    fine = price_key(D('5.0000000001'))  # Точнее 10^-9 — остается Decimal в том же масштабе
+    assert not isinstance(fine, int) and 5000000000 < fine < 5000000001
+
+
+def test_sub_nano_levels_trigger_exactly():
+    order = make_order('stop', OrderType.STOP_LOSS, stop_price='5.0000000001')
+    processor = make_processor(order)
+    assert processor.process_tick('TON-USDT', D('5.0000000002')) == []
+    assert processor.process_tick('TON-USDT', D('5.0000000001')) == [order]
+
+
+def test_bar_path_and_zigzag():
+    from order_system import bar_path, zigzag
+    assert bar_path(D(5), D(6), D(4), D('5.5')) == [D(5), D(4), D(6), D('5.5')]  # Растущий бар: O-L-H-C
+    assert bar_path(D(5), D(6), D(4), D('4.5')) == [D(5), D(6), D(4), D('4.5')]
+    points = [(1, D(1)), (2, D(2)), (3, D(3)), (4, D(3)), (5, D(2)), (6, D(4))]
+    assert zigzag(points) == [(1, D(1)), (3, D(3)), (5, D(2)), (6, D(4))]
+
+
+def test_intra_bar_extremes_trigger_both_sides_once():
+    stop = make_order('stop', OrderType.STOP_LOSS, stop_price=4.5)
+    take = make_order('take', OrderType.TAKE_PROFIT, side=PositionSide.SHORT, stop_price=4.8)
+    limit = make_order('limit', side=PositionSide.SHORT, limit_price=5.8)
+    processor = make_processor(stop, take, limit)
+    ts = datetime(2024, 1, 1, 12, 0)
+    # Бар закрылся около открытия, но внутри прошел и 4.4, и 6.0
+    executed = processor.process_ticks([('TON-USDT', 5.0, 6.0, 4.4, 5.1, ts)])
+    assert sorted(o.id for o in executed) == ['limit', 'stop', 'take']
+    assert stop.filled_at == ts
+
+
+def test_batched_ticks_are_processed_in_time_order():
+    order = make_order('stop', OrderType.STOP_LOSS, stop_price=4.5)
+    processor = make_processor(order)
+    executed = processor.process_ticks([('TON-USDT', 4.0, 2.0), ('TON-USDT', 5.0, 1.0)])
+    assert executed == [order]
+    assert order.execution_price == D('4.0')  # Стоп-лосс исполнен по цене второго (более позднего) тика
+    assert order.filled_at == datetime.fromtimestamp(2.0)
+
+
+def make_oco_pair(group='g1'):
+    take = make_order('tp', OrderType.TAKE_PROFIT, take_profit=6, oco_group_id=group)
+    stop = make_order('sl', OrderType.STOP_LOSS, stop_loss=4, oco_group_id=group)
+    return take, stop, make_processor(take, stop)
+
+
+def test_oco_fill_resolves_group_and_blocks_other_leg():
+    take, stop, processor = make_oco_pair()
+    assert processor.process_tick('TON-USDT', D('6.1')) == [take]
+    assert processor.oco_groups['g1'].resolved_by == 'tp'
+    assert stop.status == OrderStatus.ACTIVE  # Отмена ленивая
+    assert processor.process_tick('TON-USDT', D('3.9')) == []  # Но снятая нога уже не исполняется
+    assert processor.reap_oco() == [stop]
+    assert stop.status == OrderStatus.CANCELLED and stop.cancelled_at is not None
+    assert processor.reap_oco() == []
+
+
+def test_oco_legs_crossed_in_one_batch_fill_once():
+    take, stop, processor = make_oco_pair()
+    executed = processor.process_ticks([('TON-USDT', D('3.9'), 1.0), ('TON-USDT', D('6.1'), 2.0)])
+    assert executed == [stop]
+    assert [o.id for o in processor.reap_oco()] == ['tp']
+
+
+def test_removing_all_legs_drops_the_group():
+    take, stop, processor = make_oco_pair()
+    processor.remove_order('tp')
+    assert processor.oco_groups['g1'].order_ids == {'sl'}
+    processor.remove_order('sl')
+    assert 'g1' not in processor.oco_groups
@@ -0,0 +1,96 @@
+"""
+Тесты событий изменения цены (price_events): публикация только изменившихся пар
+"""
+import threading
+import time
+
+from price_events import PriceEventBus, PriceWatcher
+
+
+def make_watcher(prices, min_change=0.0):
+    bus = PriceEventBus()
+    events = []
+    bus.subscribe(lambda pair, snapshot, previous: events.append((pair, snapshot['long'])))
+    watcher = PriceWatcher(bus, lambda: list(prices), lambda pair: dict(prices[pair]), min_change=min_change)
+    return watcher, events
+
+
+def test_only_changed_pairs_are_published():
+    prices = {'TON-USDT': {'long': 5.0, 'short': 5.0}, 'NOT-TON': {'long': 1.0, 'short': 1.0}}
+    watcher, events = make_watcher(prices)
+    assert sorted(watcher.poll_once()) == ['NOT-TON', 'TON-USDT']  # Первый опрос — все пары
+    events.clear()
+    prices['TON-USDT'] = {'long': 5.1, 'short': 5.1}
+    assert watcher.poll_once() == ['TON-USDT']
+    assert events == [('TON-USDT', 5.1)]
+    assert watcher.poll_once() == []
+
+
+def test_change_below_threshold_is_not_an_event():
+    prices = {'TON-USDT': {'long': 100.0, 'short': 100.0}}
+    watcher, events = make_watcher(prices, min_change=0.01)
+    watcher.poll_once()
+    prices['TON-USDT'] = {'long': 100.5, 'short': 100.5}
+    assert watcher.poll_once() == []
+    assert watcher.latest('TON-USDT')['long'] == 100.0  # База сравнения не сдвигается
+    prices['TON-USDT'] = {'long': 101.5, 'short': 101.5}
+    assert watcher.poll_once() == ['TON-USDT']
+
+
+def test_pair_subscription_and_failing_handler():
+    bus = PriceEventBus()
+    received = []
+
+    def failing(pair, snapshot, previous):
+        raise RuntimeError("handler failed")
+
+    bus.subscribe(failing)
+    bus.subscribe(lambda pair, snapshot, previous: received.append((pair, previous)), pair='TON-USDT')
+    bus.publish('NOT-TON', {'long': 1.0})
+    bus.publish('TON-USDT', {'long': 2.0}, {'long': 1.0})
+    assert received == [('TON-USDT', {'long': 1.0})]
+
+
+def test_pairs_are_fetched_concurrently_within_limit():
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def fetcher(pair):
+        with lock:
+            active.append(pair)
+            peak.append(len(active))
+        time.sleep(0.05)
+        with lock:
+            active.remove(pair)
+        return {'long': 1.0, 'short': 1.0}
+
+    pairs = [f"P{i}" for i in range(8)]
+    watcher = PriceWatcher(PriceEventBus(), lambda: pairs, fetcher, max_concurrency=4)
+    started = time.monotonic()
+    assert sorted(watcher.poll_once()) == sorted(pairs)
+    assert max(peak) == 4
+    assert time.monotonic() - started < 0.05 * len(pairs) * 0.75  # Не последовательный обход
+
+
+def test_fetch_errors_and_overruns_are_counted():
+    def fetcher(pair):
+        if pair == 'BAD':
+            raise RuntimeError("rpc down")
+        time.sleep(0.02)
+        return {'long': 1.0, 'short': 1.0}
+
+    watcher = PriceWatcher(PriceEventBus(), lambda: ['BAD', 'TON-USDT'], fetcher, poll_interval=0.01)
+    assert watcher.poll_once() == ['TON-USDT']
+    metrics = watcher.get_metrics()
+    assert (metrics['errors'], metrics['overruns'], metrics['polls']) == (1, 1, 1)
+
+
+def test_unchanged_poll_refreshes_fetched_at_only():
+    prices = {'TON-USDT': {'long': 5.0, 'short': 5.0, 'fetched_at': 1.0}}
+    watcher, events = make_watcher(prices)
+    watcher.poll_once()
+    prices['TON-USDT'] = {'long': 5.0, 'short': 5.0, 'fetched_at': 2.0}
+    assert watcher.poll_once() == []
+    assert len(events) == 1
+    assert watcher.latest('TON-USDT') == {'long': 5.0, 'short': 5.0, 'fetched_at': 2.0}
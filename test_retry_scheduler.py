@@ -0,0 +1,48 @@
+"""
+Тесты отложенных повторов (retry_scheduler): классификация причин, экспоненциальные задержки,
+исчерпание попыток, замена и отмена сроков
+"""
+import threading
+
+from retry_scheduler import RetryPolicy, RetryScheduler, classify_retry_reason, plan_retry
+
+
+def test_reason_classification():
+    assert classify_retry_reason('HTTP 429 Too Many Requests')[0] == 'rate_limit'
+    assert classify_retry_reason('Failed to get jetton wallet address')[0] == 'jetton_wallet'
+    assert classify_retry_reason('Request timed out')[0] == 'timeout'
+    assert classify_retry_reason(None)[0] == 'other'
+
+
+def test_delay_grows_exponentially_up_to_cap():
+    policy = RetryPolicy(base_delay=1.0, max_delay=5.0, multiplier=2.0, jitter=0)
+    assert [policy.delay(attempt) for attempt in range(1, 6)] == [1.0, 2.0, 4.0, 5.0, 5.0]
+
+
+def test_jitter_stays_within_bounds():
+    policy = RetryPolicy(base_delay=10.0, max_delay=100.0, jitter=0.2)
+    assert all(8.0 <= policy.delay(1) <= 12.0 for _ in range(100))
+
+
+def test_plan_retry_stops_after_max_attempts():
+    plan = plan_retry('timeout', 1)
+    assert plan['reason'] == 'timeout' and plan['attempt'] == 2 and plan['delay'] > 0
+    _, policy = classify_retry_reason('timeout')
+    assert plan_retry('timeout', policy.max_attempts) is None
+
+
+def test_reschedule_replaces_due_time_and_cancel_drops_it():
+    scheduler = RetryScheduler()
+    fired = []
+    done = threading.Event()
+    scheduler.schedule('order_1', 60, fired.append, 'stale')
+    scheduler.schedule('order_1', 0, lambda value: (fired.append(value), done.set()), 'fresh')
+    scheduler.schedule('order_2', 0, fired.append, 'cancelled')
+    assert scheduler.cancel('order_2')
+    scheduler.start()
+    try:
+        assert done.wait(2)
+    finally:
+        scheduler.stop()
+    assert fired == ['fresh']
+    assert not scheduler.is_scheduled('order_1')
@@ -0,0 +1,138 @@
+"""
+Тесты потоковой статистики проскальзывания: квантили P², ограниченная память,
+сохранение/загрузка агрегатов и объединение источников
+"""
+import json
+import random
+from contextlib import contextmanager
+
+import pytest
+
+from slippage_stats import P2Quantile, SlippageAggregate, SlippageStats, merge_summaries
+
+
+class FakeTable:
+    """Таблица slippage_stats в памяти: подключение и курсор одновременно"""
+
+    def __init__(self):
+        self.rows = {}
+        self.fail = False
+        self._result = []
+
+    @contextmanager
+    def connection(self):
+        yield self
+
+    @contextmanager
+    def cursor(self):
+        yield self
+
+    def commit(self):
+        pass
+
+    def execute(self, sql, params=()):
+        if self.fail:
+            raise RuntimeError("db down")
+        if sql.lstrip().startswith('INSERT'):
+            source, scope, key, state = params
+            self.rows[(source, scope, key)] = json.loads(state)
+        elif 'WHERE source' in sql:
+            self._result = [(scope, key, state) for (source, scope, key), state in self.rows.items()
+                            if source == params[0]]
+        else:
+            self._result = [(scope, key, state) for (_, scope, key), state in self.rows.items()]
+
+    def fetchall(self):
+        return self._result
+
+
+def test_p2_quantiles_track_uniform_distribution():
+    rng = random.Random(7)
+    estimators = {p: P2Quantile(p) for p in (0.5, 0.95, 0.99)}
+    for _ in range(20000):
+        x = rng.uniform(0, 100)
+        for estimator in estimators.values():
+            estimator.add(x)
+    for p, estimator in estimators.items():
+        assert estimator.value() == pytest.approx(p * 100, abs=2)
+        assert len(estimator.heights) == 5  # Память не растет с числом выборок
+
+
+def test_p2_small_samples_use_exact_order_statistics():
+    estimator = P2Quantile(0.5)
+    assert estimator.value() is None
+    for x in (3, 1, 2):
+        estimator.add(x)
+    assert estimator.value() == 2
+
+
+def test_aggregate_state_round_trip():
+    aggregate = SlippageAggregate()
+    for x in range(1, 101):
+        aggregate.add(float(x))
+    restored = SlippageAggregate.from_state(json.loads(json.dumps(aggregate.to_state())))
+    assert restored.summary() == aggregate.summary()
+    restored.add(101.0)
+    aggregate.add(101.0)
+    assert restored.summary() == aggregate.summary()
+
+
+def test_recent_buffer_is_bounded_and_groups_by_symbol_and_dex():
+    stats = SlippageStats(recent_size=3)
+    for i in range(10):
+        stats.record(i, symbol='TON-USDT' if i % 2 else 'NOT-TON', dex='stonfi')
+    snapshot = stats.snapshot(recent=5)
+    assert snapshot['total_orders'] == 10
+    assert [s['slippage_pct'] for s in snapshot['recent']] == [7.0, 8.0, 9.0]
+    assert snapshot['by_symbol']['TON-USDT']['total_orders'] == 5
+    assert snapshot['by_dex']['stonfi']['max_slippage'] == 9.0
+
+
+def test_persist_writes_only_dirty_aggregates_and_load_restores():
+    table = FakeTable()
+    stats = SlippageStats(table.connection, source='a')
+    stats.record(1.0, symbol='TON-USDT')
+    stats.persist()
+    assert set(table.rows) == {('a', 'all', ''), ('a', 'symbol', 'TON-USDT'), ('a', 'recent', '')}
+    table.rows.clear()
+    stats.persist()
+    assert table.rows == {}  # Изменений нет — ничего не пишется
+    stats.record(2.0, dex='dedust')
+    stats.persist()
+    assert ('a', 'symbol', 'TON-USDT') not in table.rows
+    restored = SlippageStats(table.connection, source='a')
+    restored.load()
+    assert restored.snapshot()['by_dex']['dedust']['total_orders'] == 1
+
+
+def test_failed_persist_keeps_aggregates_dirty():
+    table = FakeTable()
+    stats = SlippageStats(table.connection, source='a')
+    stats.record(1.0)
+    table.fail = True
+    with pytest.raises(RuntimeError):
+        stats.persist()
+    table.fail = False
+    stats.persist()
+    assert ('a', 'all', '') in table.rows
+
+
+def test_read_merged_weights_sources_by_count():
+    table = FakeTable()
+    first = SlippageStats(table.connection, source='a')
+    second = SlippageStats(table.connection, source='b')
+    for _ in range(3):
+        first.record(1.0)
+    second.record(5.0)
+    first.persist()
+    second.persist()
+    merged = SlippageStats.read_merged(table.connection)
+    assert merged['total_orders'] == 4
+    assert merged['avg_slippage'] == pytest.approx(2.0)
+    assert merged['max_slippage'] == 5.0
+    assert merged['p50'] == pytest.approx(2.0)
+    assert len(merged['recent']) == 4
+
+
+def test_merge_summaries_of_nothing_is_empty():
+    assert merge_summaries([{'total_orders': 0}])['total_orders'] == 0
@@ -0,0 +1,91 @@
+"""
+Тесты векторной книги трейлинг-стопов (trailing_book): совпадение с Decimal-реализацией TrailingConfig
+"""
+from decimal import Decimal
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from order_system import Order, OrderType, PositionSide, TrailingConfig, TrailingType
+from trailing_book import TrailingBook
+
+
+def make_order(order_id, side=PositionSide.LONG, stop_loss=None, **trailing):
+    return Order(
+        id=order_id, symbol='TON-USDT', quantity=Decimal('1'), type=OrderType.STOP_LOSS, side=side,
+        stop_loss=stop_loss, trailing=TrailingConfig(**trailing),
+    )
+
+
+def test_stop_loss_moved_without_new_extremum_is_written_back():
+    # Экстремум и текущий стоп не меняются, но stop_loss ниже стопа (например, после PATCH) — подтягивается
+    order = make_order('a', stop_loss=Decimal('8'), type=TrailingType.FIXED, distance=Decimal('1'),
+                       highest_price=Decimal('10'), current_stop=Decimal('9'))
+    book = TrailingBook('TON-USDT')
+    book.add(order)
+    book.update(9.5)
+    assert book.write_back() == [order]
+    assert order.stop_loss == Decimal('9')
+
+
+def test_book_matches_decimal_trailing_on_random_path():
+    import random
+    rng = random.Random(7)
+    book = TrailingBook('TON-USDT', capacity=2)  # Заодно проверяется рост емкости
+    pairs = []
+    for i in range(40):
+        side = PositionSide.LONG if i % 2 else PositionSide.SHORT
+        kind = TrailingType.PERCENTAGE if i % 3 else TrailingType.FIXED
+        distance = Decimal(rng.randint(1, 50)) / (10 if kind == TrailingType.PERCENTAGE else 100)
+        stop_loss = Decimal('4') if side == PositionSide.LONG else Decimal('6')
+        order = make_order(f"book_{i}", side, stop_loss, type=kind, distance=distance)
+        reference = make_order(f"ref_{i}", side, stop_loss, type=kind, distance=distance)
+        book.add(order)
+        pairs.append((order, reference))
+    price = Decimal('5')
+    for _ in range(200):
+        price = max(price + Decimal(rng.randint(-20, 20)) / 100, Decimal('0.5'))
+        book.update(float(price))
+        for _, reference in pairs:
+            # Эталон — та же логика, что OrderProcessor._update_trailing_stop
+            if reference.side == PositionSide.LONG:
+                stop = reference.trailing.update_for_long(price)
+                if stop and stop > reference.stop_loss:
+                    reference.stop_loss = stop
+            else:
+                stop = reference.trailing.update_for_short(price)
+                if stop and stop < reference.stop_loss:
+                    reference.stop_loss = stop
+    book.write_back()
+    for order, reference in pairs:
+        assert abs(order.stop_loss - reference.stop_loss) <= abs(reference.stop_loss) * Decimal('1e-9')
+        assert abs(order.trailing.current_stop - reference.trailing.current_stop) <= abs(reference.trailing.current_stop) * Decimal('1e-9')
+
+
+def test_crossed_rows_and_removal():
+    long_order = make_order('long', stop_loss=Decimal('5'), type=TrailingType.FIXED, distance=Decimal('1'))
+    short_order = make_order('short', PositionSide.SHORT, Decimal('6'), type=TrailingType.FIXED, distance=Decimal('1'))
+    book = TrailingBook('TON-USDT')
+    book.add(long_order)
+    book.add(short_order)
+    assert [book.orders[slot].id for slot in book.crossed(4.9)] == ['long']
+    assert [book.orders[slot].id for slot in book.crossed(6.1)] == ['short']
+    book.remove('long')
+    assert 'long' not in book and len(book) == 1
+    assert book.crossed(4.9) == []
+
+
+def test_processor_switches_to_book_for_large_trailing_sets(monkeypatch):
+    import order_system
+    from order_system import OrderProcessor
+    monkeypatch.setattr(order_system, 'TRAILING_BOOK_MIN_ORDERS', 3)
+    processor = OrderProcessor(lambda symbol: Decimal('0'))
+    orders = [make_order(f"o{i}", stop_loss=Decimal('4'), type=TrailingType.FIXED, distance=Decimal('1')) for i in range(3)]
+    for order in orders:
+        order.status = order_system.OrderStatus.ACTIVE
+        processor.add_order(order)
+    assert 'TON-USDT' in processor._trailing_books
+    processor.process_tick('TON-USDT', Decimal('6'))
+    processor.sync_trailing()
+    assert all(order.stop_loss == Decimal('5') for order in orders)
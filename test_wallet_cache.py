@@ -0,0 +1,120 @@
+"""
+Тесты кэша кошельков (wallet_cache): учетные данные без повторной загрузки, однократный вывод
+ключа, экземпляр кошелька на провайдер, вытеснение и затирание секретов
+"""
+import asyncio
+
+import pytest
+
+import wallet_cache
+from wallet_cache import WalletKeyCache, wallet_cache_key
+
+MNEMONIC = "word " * 23 + "word"
+
+
+@pytest.fixture
+def derivations(monkeypatch):
+    calls = []
+
+    def mnemonic_to_private_key(words):
+        calls.append(words)
+        return b'pub', b'\x01' * 32 if len(calls) == 1 else b'\x02' * 32
+
+    monkeypatch.setattr(wallet_cache, 'mnemonic_to_private_key', mnemonic_to_private_key)
+    monkeypatch.setattr(wallet_cache, 'KEY_DERIVATION_AVAILABLE', True)
+    return calls
+
+
+class FakeWallet:
+    built = 0
+
+    @classmethod
+    async def from_private_key(cls, provider, private_key, **kwargs):
+        cls.built += 1
+        wallet = cls()
+        wallet.provider = provider
+        return wallet
+
+
+def loader(address='EQ-a', mnemonic=MNEMONIC, calls=None):
+    def load():
+        if calls is not None:
+            calls.append(address)
+        return {'address': address, 'label': 'w', 'mnemonic': mnemonic}
+    return load
+
+
+def test_keys():
+    assert wallet_cache_key(wallet_id=7, address='EQ') == 'id:7'
+    assert wallet_cache_key(address='EQ') == 'addr:EQ'
+    assert wallet_cache_key() is None
+
+
+def test_credentials_are_loaded_once_and_missing_wallet_is_not_cached():
+    cache = WalletKeyCache()
+    calls = []
+    assert cache.credentials('id:1', loader(calls=calls), wallet_id=1)['mnemonic'] == MNEMONIC
+    assert cache.credentials('id:1', loader(calls=calls), wallet_id=1)['address'] == 'EQ-a'
+    assert calls == ['EQ-a']
+    assert cache.credentials('id:2', lambda: None) is None
+    assert cache.get_metrics()['entries'] == 1
+
+
+def test_expired_entry_is_reloaded_and_zeroized():
+    cache = WalletKeyCache(ttl=0)
+    calls = []
+    cache.credentials('id:1', loader(calls=calls))
+    entry = cache._entries['id:1']
+    cache.credentials('id:1', loader(calls=calls))
+    assert calls == ['EQ-a', 'EQ-a']
+    assert entry._mnemonic is None
+
+
+def test_lru_eviction_zeroizes_secrets():
+    cache = WalletKeyCache(max_entries=2)
+    cache.credentials('id:1', loader('EQ-1'))
+    cache.credentials('id:2', loader('EQ-2'))
+    second = cache._entries['id:2']
+    secret = second._mnemonic
+    cache.credentials('id:1', loader('EQ-1'))  # Обращение поднимает запись
+    cache.credentials('id:3', loader('EQ-3'))
+    assert list(cache._entries) == ['id:1', 'id:3']
+    assert cache.get_metrics()['evicted'] == 1
+    assert second._mnemonic is None and not any(secret)
+
+
+def test_private_key_is_derived_once_per_mnemonic(derivations):
+    cache = WalletKeyCache()
+    cache.credentials('id:1', loader())
+    assert cache.private_key('id:1', MNEMONIC) == b'\x01' * 32
+    assert cache.private_key('id:1', MNEMONIC + " ") == b'\x01' * 32
+    assert len(derivations) == 1
+    assert cache.private_key('id:1', "other " * 24) == b'\x02' * 32  # Мнемоника сменилась
+    assert len(derivations) == 2
+
+
+def test_wallet_instance_is_reused_per_provider(derivations):
+    cache = WalletKeyCache()
+    FakeWallet.built = 0
+    first, second = object(), object()
+
+    async def scenario():
+        a = await cache.get_wallet('id:1', first, MNEMONIC, FakeWallet)
+        b = await cache.get_wallet('id:1', first, MNEMONIC, FakeWallet)
+        c = await cache.get_wallet('id:1', second, MNEMONIC, FakeWallet)
+        return a, b, c
+
+    a, b, c = asyncio.run(scenario())
+    assert a is b and c is not a and c.provider is second
+    assert FakeWallet.built == 2 and len(derivations) == 1
+
+
+def test_invalidate_by_address_zeroizes(derivations):
+    cache = WalletKeyCache()
+    cache.credentials('id:1', loader('EQ-a'), wallet_id=1)
+    cache.private_key('id:1', MNEMONIC)
+    entry = cache._entries['id:1']
+    key = entry._private_key
+    assert cache.invalidate(address='EQ-a') == 1
+    assert not any(key) and entry._mnemonic is None
+    assert cache.get_metrics()['entries'] == 0
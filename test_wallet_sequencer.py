@@ -0,0 +1,150 @@
+"""
+Тесты секвенсора кошелька (wallet_sequencer): локальный seqno без чтения из сети на каждое сообщение,
+подтверждение и потеря по valid_until, сверка с сетью после ошибки. Кошелек и LiteClient подменяются
+"""
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("pytoniq_core")
+
+import wallet_sequencer
+from wallet_sequencer import SEQUENCER_CONFIRM_GRACE, OutgoingMessage, WalletSequencer
+
+ADDRESS = 'EQ-order-wallet'
+MNEMONIC = "word " * 23 + "word"
+
+
+class FakeAddress:
+    def __init__(self, address):
+        self.address = address
+
+    def to_str(self, **kwargs):
+        return self.address
+
+
+class FakeWallet:
+    def __init__(self, address=ADDRESS, seqno=5):
+        self.address = FakeAddress(address)
+        self.chain_seqno = seqno  # None — кошелек не развернут
+        self.seqno_reads = 0
+        self.sent = []
+        self.fail = None
+        self.private_key = b'k'
+        self.wallet_id = 1
+
+    async def get_seqno(self):
+        self.seqno_reads += 1
+        if self.chain_seqno is None:
+            raise RuntimeError("account is not initialized")
+        return self.chain_seqno
+
+    def create_wallet_internal_message(self, destination, value, body):
+        return destination, value
+
+    def raw_create_transfer_msg(self, private_key, seqno, wallet_id, messages, valid_until):
+        return {'seqno': seqno, 'valid_until': valid_until}
+
+    async def send_external(self, body):
+        if self.fail:
+            raise self.fail
+        self.sent.append(body['seqno'])
+
+    async def transfer(self, destination, amount, body):
+        self.sent.append('deploy')
+
+
+class FakeClient:
+    closed = 0
+
+    async def close(self):
+        FakeClient.closed += 1
+
+
+@pytest.fixture
+def wallet(monkeypatch):
+    wallet = FakeWallet()
+
+    class Cache:
+        async def get_wallet(self, key, provider, mnemonic, wallet_cls, **kwargs):
+            return wallet
+
+    monkeypatch.setattr(wallet_sequencer, 'wallet_key_cache', Cache())
+    monkeypatch.setattr(wallet_sequencer, 'Address', str)
+    return wallet
+
+
+def make_sequencer():
+    async def connect():
+        return FakeClient()
+    return WalletSequencer('id:1', ADDRESS, connect, FakeWallet)
+
+
+def send(sequencer, on_confirm=None):
+    message = OutgoingMessage('EQ-dest', 10, None, MNEMONIC, on_confirm)
+    asyncio.run(sequencer._process(message))
+    return message.future
+
+
+def test_messages_use_local_seqno_without_network_reads(wallet):
+    sequencer = make_sequencer()
+    results = [send(sequencer).result(timeout=1) for _ in range(3)]
+    assert [r['seqno'] for r in results] == [5, 6, 7]
+    assert wallet.sent == [5, 6, 7]
+    assert wallet.seqno_reads == 1
+    assert sequencer.get_metrics()['in_flight'] == 3
+
+
+def test_reconcile_confirms_and_detects_lost_messages(wallet):
+    sequencer = make_sequencer()
+    outcomes = []
+    for _ in range(3):
+        send(sequencer, on_confirm=outcomes.append)
+    wallet.chain_seqno = 7  # 5 и 6 включены в блок
+    asyncio.run(sequencer._reconcile())
+    assert outcomes == [True, True]
+    assert sequencer.expected_seqno == 8
+    sequencer._in_flight[0].valid_until = time.time() - SEQUENCER_CONFIRM_GRACE - 1
+    asyncio.run(sequencer._reconcile())
+    assert outcomes == [True, True, False]  # 7 уже не попадет в блок: повтор безопасен
+    assert sequencer.expected_seqno == 7
+    metrics = sequencer.get_metrics()
+    assert (metrics['confirmed'], metrics['lost'], metrics['in_flight']) == (2, 1, 0)
+
+
+def test_send_failure_resyncs_seqno_with_network(wallet):
+    sequencer = make_sequencer()
+    send(sequencer)
+    wallet.fail = ConnectionError("lite server down")
+    future = send(sequencer)
+    with pytest.raises(ConnectionError):
+        future.result(timeout=1)
+    assert sequencer.expected_seqno is None and sequencer._client is None
+    wallet.fail = None
+    wallet.chain_seqno = 6
+    assert send(sequencer).result(timeout=1)['seqno'] == 6
+    assert wallet.seqno_reads == 2
+
+
+def test_foreign_wallet_address_is_refused(wallet):
+    wallet.address = FakeAddress('EQ-other')
+    with pytest.raises(ValueError):
+        send(make_sequencer()).result(timeout=1)
+    assert wallet.sent == []
+
+
+def test_undeployed_wallet_is_deployed_by_first_transfer(wallet):
+    wallet.chain_seqno = None
+    sequencer = make_sequencer()
+    assert send(sequencer).result(timeout=1)['seqno'] == 0
+    assert wallet.sent == ['deploy'] and sequencer._deploying
+
+
+def test_send_through_wallet_thread(wallet):
+    sequencer = make_sequencer()
+    try:
+        assert sequencer.send('EQ-dest', 10, None, MNEMONIC, timeout=5)['seqno'] == 5
+    finally:
+        sequencer.stop(timeout=5)
+    assert not sequencer._thread.is_alive()
@@ -11,7 +11,11 @@ from pytoniq_core.boc import Builder
 from dotenv import load_dotenv
 import traceback
 
+from log_config import get_logger
+from wallet_cache import wallet_key_cache
+
 load_dotenv()
+log = get_logger('ton_rpc')
 
 # Конфигурация
 TESTNET = os.environ.get("TESTNET", "False") == "True"
@@ -42,15 +46,16 @@ def toncenter_request(method, params=None, retries=5, timeout=30):
             response.raise_for_status()
             data = response.json()
             if 'error' in data:
-                print(f"[TON RPC] Error in response: {data['error']}")
+                log.warning("[TON RPC] Error in response: %s", data['error'], extra={'method': method})
                 if data['error']['code'] in [429, 503]:  # Rate limit or temp unavailable
                     time.sleep(2 ** attempt)
                     continue
             return data.get('result', {})
         except Exception as e:
-            print(f"[TON RPC] Error (attempt {attempt+1}/{retries}) method:{payload}: {e}")
+            log.warning("[TON RPC] Error (attempt %d/%d) method:%s: %s", attempt + 1, retries, payload, e,
+                        extra={'method': method})
             time.sleep(2 ** attempt)  # Exponential backoff
-    print(f"[TON RPC] All retries failed for {method} payload: {payload}")
+    log.error("[TON RPC] All retries failed for %s payload: %s", method, payload, extra={'method': method})
     return None
 
 
@@ -132,6 +137,33 @@ def get_balance(address: str, decimals=9):
         return 0
 
 
+def get_wallet_state(address: str, decimals=9):
+    """
+    Получение баланса и lt последней транзакции кошелька одним запросом
+    
+    Args:
+        address: Адрес кошелька
+        decimals: Количество десятичных знаков (9 для TON)
+    
+    Returns:
+        dict: {'balance': float, 'last_lt': int | None} или None при ошибке
+    """
+    try:
+        addr = validate_address(address)
+        result = toncenter_request('getAddressInformation', {'address': addr})
+        if not result:
+            return None
+        last_tx = result.get('last_transaction_id') or {}
+        last_lt = last_tx.get('lt')
+        return {
+            'balance': int(result.get('balance', 0)) / (10 ** decimals),
+            'last_lt': int(last_lt) if last_lt not in (None, '', '0') else None
+        }
+    except Exception as e:
+        print(f"[TON RPC] Wallet state error: {e}")
+        return None
+
+
 def get_pool_reserves(pool_addr: str):
     """
     Получение резервов пула DEX
@@ -316,9 +348,12 @@ def get_order_wallet_from_mnemonic():
         
         async def create_wallet():
             await config.connect()
-            wallet = await WalletV5R1.from_mnemonic(
+            # Ключ из мнемоники выводится один раз (кэш кошельков ордеров)
+            wallet = await wallet_key_cache.get_wallet(
+                'env:ORDER_WALLET_MNEMONIC',
                 provider=config,
-                mnemonics=mnemonics,
+                mnemonic=mnemonic_decoded,
+                wallet_cls=WalletV5R1,
                 wallet_id=2147483409,  # Standard wallet ID
                 network_global_id=-239 if not TESTNET else -3  # Mainnet or testnet
             )
@@ -0,0 +1,181 @@
+"""
+Векторный книжный учет трейлинг-стопов одного символа.
+Экстремумы цены, дистанции, тип дистанции, текущий стоп и stop_loss хранятся в массивах NumPy,
+и обновление всех трейлингов символа на тике — один векторный проход вместо Decimal-арифметики
+по каждому ордеру. Значения в ордерах (Decimal) обновляются лениво: write_back при исполнении,
+отмене, сохранении и для строк, пересеченных ценой (там решение принимается точной Decimal-проверкой).
+
+Расхождение с Decimal-реализацией TrailingConfig — не больше TRAILING_BOOK_TOLERANCE
+(относительная погрешность float64 после цепочки операций, с большим запасом).
+"""
+import os
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+TRAILING_BOOK_TOLERANCE = float(os.environ.get("TRAILING_BOOK_TOLERANCE", "1e-9"))
+# Книга включается для символа, когда активных трейлингов не меньше этого числа
+TRAILING_BOOK_MIN_ORDERS = int(os.environ.get("TRAILING_BOOK_MIN_ORDERS", "256"))
+
+
+def _to_float(value: Optional[Decimal]) -> float:
+    return float(value) if value is not None else float('nan')
+
+
+def _to_decimal(value: float) -> Optional[Decimal]:
+    return Decimal(repr(float(value))) if value == value else None  # NaN -> None
+
+
+class TrailingBook:
+    """
+    Трейлинг-стопы одного символа в массивах. Строка — ордер; освобожденные строки переиспользуются.
+
+    Args:
+        symbol: Символ
+        capacity: Начальная емкость (растет удвоением)
+    """
+
+    def __init__(self, symbol: str, capacity: int = 64):
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("numpy is not installed: trailing book is unavailable")
+        self.symbol = symbol
+        self.orders: List[Optional[object]] = [None] * capacity
+        self._slots: Dict[str, int] = {}
+        self._free: List[int] = list(range(capacity - 1, -1, -1))
+        self.active = np.zeros(capacity, dtype=bool)
+        self.is_long = np.zeros(capacity, dtype=bool)
+        self.is_percent = np.zeros(capacity, dtype=bool)
+        self.distance = np.zeros(capacity)
+        self.highest = np.full(capacity, np.nan)
+        self.lowest = np.full(capacity, np.nan)
+        self.current_stop = np.full(capacity, np.nan)
+        self.stop_loss = np.full(capacity, np.nan)
+        self.dirty = np.zeros(capacity, dtype=bool)  # Строка изменилась после последнего write_back
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, order_id: str):
+        return order_id in self._slots
+
+    def _grow(self):
+        old = len(self.orders)
+        new = old * 2
+        for name in ('active', 'is_long', 'is_percent', 'dirty'):
+            setattr(self, name, np.concatenate([getattr(self, name), np.zeros(old, dtype=bool)]))
+        self.distance = np.concatenate([self.distance, np.zeros(old)])
+        for name in ('highest', 'lowest', 'current_stop', 'stop_loss'):
+            setattr(self, name, np.concatenate([getattr(self, name), np.full(old, np.nan)]))
+        self.orders.extend([None] * old)
+        self._free.extend(range(new - 1, old - 1, -1))
+
+    def add(self, order):
+        """Загружает трейлинг ордера (order_system.Order) в книгу"""
+        if order.id in self._slots:
+            self.remove(order.id, write_back=False)
+        if not self._free:
+            self._grow()
+        slot = self._free.pop()
+        trailing = order.trailing
+        self._slots[order.id] = slot
+        self.orders[slot] = order
+        self.active[slot] = True
+        self.is_long[slot] = order.side.value == 'LONG'
+        self.is_percent[slot] = trailing.type.value == 'PERCENTAGE'
+        self.distance[slot] = float(trailing.distance)
+        self.highest[slot] = _to_float(trailing.highest_price)
+        self.lowest[slot] = _to_float(trailing.lowest_price)
+        self.current_stop[slot] = _to_float(trailing.current_stop)
+        # stop_loss == 0 в Decimal-реализации равносилен отсутствию (проверка по истинности)
+        self.stop_loss[slot] = _to_float(order.stop_loss) if order.stop_loss else np.nan
+        self.dirty[slot] = False
+
+    def remove(self, order_id: str, write_back: bool = True):
+        """Убирает ордер из книги, по умолчанию переписав в него актуальные значения"""
+        slot = self._slots.get(order_id)
+        if slot is None:
+            return
+        if write_back:
+            self._write_back_slot(slot)
+        del self._slots[order_id]
+        self.orders[slot] = None
+        self.active[slot] = False
+        self.dirty[slot] = False
+        self._free.append(slot)
+
+    def update(self, price: float):
+        """
+        Один векторный проход: экстремумы, текущие стопы и подтягивание stop_loss —
+        та же логика, что TrailingConfig.update_for_long/short и OrderProcessor._update_trailing_stop
+        """
+        p = float(price)
+        long_rows = self.active & self.is_long
+        short_rows = self.active & ~self.is_long
+
+        # Сравнения с NaN ложны: отсутствующий экстремум/стоп заменяется новым значением
+        new_high = long_rows & ~(self.highest >= p)
+        new_low = short_rows & ~(self.lowest <= p)
+        self.highest = np.where(new_high, p, self.highest)
+        self.lowest = np.where(new_low, p, self.lowest)
+
+        base = np.where(self.is_long, self.highest, self.lowest)
+        sign = np.where(self.is_long, -1.0, 1.0)
+        new_stop = np.where(self.is_percent, base * (1 + sign * self.distance / 100), base + sign * self.distance)
+
+        raise_long = long_rows & ~(self.current_stop >= new_stop)
+        lower_short = short_rows & ~(self.current_stop <= new_stop)
+        stop = np.where(raise_long | lower_short, new_stop, self.current_stop)
+
+        has_stop = (stop == stop) & (stop != 0)
+        move_sl = has_stop & (self.stop_loss == self.stop_loss) & (
+            (long_rows & (stop > self.stop_loss)) | (short_rows & (stop < self.stop_loss))
+        )
+        self.dirty |= new_high | new_low | raise_long | lower_short | move_sl
+        self.current_stop = stop
+        self.stop_loss = np.where(move_sl, stop, self.stop_loss)
+
+    def crossed(self, price: float, tolerance: float = TRAILING_BOOK_TOLERANCE) -> List[int]:
+        """
+        Строки, чей stop_loss пересечен ценой (лонг: цена <= stop_loss, шорт: цена >= stop_loss).
+        Граница расширена на tolerance, чтобы пограничные случаи решала точная Decimal-проверка.
+        """
+        p = float(price)
+        band = np.abs(self.stop_loss) * tolerance
+        hit = self.active & (self.stop_loss == self.stop_loss) & (
+            (self.is_long & (p <= self.stop_loss + band)) | (~self.is_long & (p >= self.stop_loss - band))
+        )
+        return np.flatnonzero(hit).tolist()
+
+    def _write_back_slot(self, slot: int):
+        if not self.dirty[slot]:
+            return
+        order = self.orders[slot]
+        trailing = order.trailing
+        trailing.highest_price = _to_decimal(self.highest[slot])
+        trailing.lowest_price = _to_decimal(self.lowest[slot])
+        trailing.current_stop = _to_decimal(self.current_stop[slot])
+        if self.stop_loss[slot] == self.stop_loss[slot]:
+            order.stop_loss = _to_decimal(self.stop_loss[slot])
+        self.dirty[slot] = False
+
+    def write_back(self, slots: Optional[List[int]] = None) -> List[object]:
+        """Переносит значения строк (по умолчанию всех измененных) в Decimal-поля ордеров"""
+        if slots is None:
+            slots = np.flatnonzero(self.dirty & self.active).tolist()
+        written = []
+        for slot in slots:
+            if self.orders[slot] is not None:
+                self._write_back_slot(slot)
+                written.append(self.orders[slot])
+        return written
+
+    def write_back_order(self, order_id: str):
+        slot = self._slots.get(order_id)
+        if slot is not None:
+            self._write_back_slot(slot)
@@ -0,0 +1,213 @@
+"""
+Кэш кошельков ордеров в памяти.
+Для каждого кошелька ордеров (ключ — id в order_wallets, для legacy-кошельков — адрес) хранятся
+расшифрованные учетные данные, выведенный из мнемоники ключ подписи и экземпляр WalletV5R1,
+поэтому проверка ордера не ходит в БД и не расшифровывает Fernet, а отправка не повторяет
+PBKDF2 вывода ключа. Запись живет WALLET_CACHE_TTL секунд; при вытеснении, истечении и явной
+инвалидации (смена мнемоники, удаление кошелька) мнемоника и ключ затираются нулями.
+"""
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+try:
+    from pytoniq_core.crypto.keys import mnemonic_to_private_key
+    KEY_DERIVATION_AVAILABLE = True
+except ImportError:
+    mnemonic_to_private_key = None
+    KEY_DERIVATION_AVAILABLE = False
+
+WALLET_CACHE_TTL = float(os.environ.get("WALLET_CACHE_TTL", "600"))
+WALLET_CACHE_MAX_ENTRIES = int(os.environ.get("WALLET_CACHE_MAX_ENTRIES", "256"))
+
+
+def wallet_cache_key(wallet_id=None, address: Optional[str] = None) -> Optional[str]:
+    if wallet_id:
+        return f"id:{wallet_id}"
+    if address:
+        return f"addr:{address}"
+    return None
+
+
+def _zeroize(buffer: Optional[bytearray]):
+    if buffer is not None:
+        buffer[:] = bytes(len(buffer))
+
+
+class CachedWallet:
+    """
+    Запись кэша. Секреты хранятся в bytearray, чтобы их можно было затереть; копии, уже
+    отданные наружу (str мнемоники, bytes ключа внутри WalletV5R1), затереть нельзя
+    """
+
+    def __init__(self, key: str, wallet_id, address: Optional[str], label: Optional[str], mnemonic: Optional[str]):
+        self.key = key
+        self.wallet_id = wallet_id
+        self.address = address
+        self.label = label
+        self._mnemonic = bytearray(mnemonic.strip().encode()) if mnemonic else None
+        self._private_key: Optional[bytearray] = None
+        self.wallet = None  # WalletV5R1, привязан к провайдеру wallet_provider
+        self.wallet_provider = None
+        self.expires_at = time.monotonic() + WALLET_CACHE_TTL
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def credentials(self) -> Dict:
+        """Учетные данные в формате get_order_wallet_credentials"""
+        return {
+            'address': self.address,
+            'label': self.label,
+            'mnemonic': self._mnemonic.decode() if self._mnemonic else None,
+            'cache_key': self.key,
+        }
+
+    def matches(self, mnemonic: str) -> bool:
+        return self._mnemonic is not None and hmac.compare_digest(bytes(self._mnemonic), mnemonic.strip().encode())
+
+    def zeroize(self):
+        _zeroize(self._mnemonic)
+        _zeroize(self._private_key)
+        self._mnemonic = None
+        self._private_key = None
+        self.wallet = None
+        self.wallet_provider = None
+
+
+class WalletKeyCache:
+    """
+    Args:
+        ttl: Время жизни записи, сек
+        max_entries: Максимум записей; при превышении вытесняется давно не использованная
+    """
+
+    def __init__(self, ttl: float = WALLET_CACHE_TTL, max_entries: int = WALLET_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, CachedWallet]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._metrics = {'hits': 0, 'misses': 0, 'derivations': 0, 'wallets_built': 0, 'evicted': 0, 'invalidated': 0}
+
+    def _get(self, key: str) -> Optional[CachedWallet]:
+        """Живая запись (под блокировкой); истекшая удаляется"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expired:
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            entry.zeroize()
+            self._metrics['evicted'] += 1
+
+    def _put(self, entry: CachedWallet):
+        entry.expires_at = time.monotonic() + self.ttl
+        old = self._entries.pop(entry.key, None)
+        if old is not None and old is not entry:
+            old.zeroize()
+        self._entries[entry.key] = entry
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+
+    def credentials(self, key: str, loader: Callable[[], Optional[Dict]], wallet_id=None) -> Optional[Dict]:
+        """
+        Учетные данные кошелька; при промахе вызывается loader (БД + расшифровка),
+        отсутствующий кошелек (None) не кэшируется
+        """
+        with self._lock:
+            entry = self._get(key)
+            if entry is not None and entry.address:  # Запись только с ключом (без учетных данных) — промах
+                self._metrics['hits'] += 1
+                return entry.credentials()
+            self._metrics['misses'] += 1
+        loaded = loader()
+        if not loaded:
+            return None
+        entry = CachedWallet(key, wallet_id, loaded['address'], loaded.get('label'), loaded.get('mnemonic'))
+        with self._lock:
+            self._put(entry)
+        return entry.credentials()
+
+    def private_key(self, key: str, mnemonic: str) -> bytes:
+        """Ключ подписи из мнемоники; вывод (PBKDF2) выполняется один раз на запись"""
+        with self._lock:
+            entry = self._get(key)
+            if entry is not None and entry.matches(mnemonic) and entry._private_key is not None:
+                return bytes(entry._private_key)
+        if not KEY_DERIVATION_AVAILABLE:
+            raise RuntimeError("pytoniq_core is not installed on server")
+        _, private_key = mnemonic_to_private_key(mnemonic.strip().split())  # Вне блокировки: вывод медленный
+        with self._lock:
+            self._metrics['derivations'] += 1
+            entry = self._get(key)
+            if entry is None or not entry.matches(mnemonic):
+                # Мнемоника не из кэша учетных данных (legacy, env) или сменилась — новая запись
+                entry = CachedWallet(key, entry.wallet_id if entry else None, entry.address if entry else None,
+                                     entry.label if entry else None, mnemonic)
+                self._put(entry)
+            _zeroize(entry._private_key)
+            entry._private_key = bytearray(private_key)
+        return private_key
+
+    async def get_wallet(self, key: str, provider, mnemonic: str, wallet_cls, **wallet_kwargs):
+        """
+        Экземпляр кошелька для провайдера. Экземпляр привязан к провайдеру (LiteClient), поэтому
+        переиспользуется только с тем же провайдером, иначе собирается из кэшированного ключа
+        """
+        with self._lock:
+            entry = self._get(key)
+            if entry is not None and entry.wallet is not None and entry.wallet_provider is provider \
+                    and entry.matches(mnemonic):
+                return entry.wallet
+        private_key = self.private_key(key, mnemonic)
+        wallet = await wallet_cls.from_private_key(provider=provider, private_key=private_key, **wallet_kwargs)
+        with self._lock:
+            self._metrics['wallets_built'] += 1
+            entry = self._get(key)
+            if entry is not None and entry.matches(mnemonic):
+                entry.wallet = wallet
+                entry.wallet_provider = provider
+        return wallet
+
+    def invalidate(self, wallet_id=None, address: Optional[str] = None) -> int:
+        """Удаляет и затирает записи кошелька (по id и/или адресу)"""
+        keys = {wallet_cache_key(wallet_id=wallet_id), wallet_cache_key(address=address)} - {None}
+        with self._lock:
+            victims: List[str] = [
+                key for key, entry in self._entries.items()
+                if key in keys or (wallet_id and entry.wallet_id == wallet_id) or (address and entry.address == address)
+            ]
+            for key in victims:
+                self._entries.pop(key).zeroize()
+            self._metrics['invalidated'] += len(victims)
+        return len(victims)
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            expired = [key for key, entry in self._entries.items() if entry.expired]
+            for key in expired:
+                self._drop(key)
+        return len(expired)
+
+    def clear(self):
+        with self._lock:
+            for entry in self._entries.values():
+                entry.zeroize()
+            self._entries.clear()
+
+    def get_metrics(self) -> Dict:
+        with self._lock:
+            return dict(self._metrics, entries=len(self._entries), ttl=self.ttl)
+
+
+wallet_key_cache = WalletKeyCache()
@@ -0,0 +1,346 @@
+"""
+Последовательная отправка транзакций с кошелька ордеров с локальным учетом seqno.
+На каждый кошелек — один WalletSequencer: поток со своим event loop, постоянным LiteClient
+и очередью исходящих сообщений. seqno читается из сети один раз, дальше каждое принятое
+сообщение увеличивает локальный счетчик, и следующее подписывается сразу, без ожидания
+включения предыдущего в блок. Каждое сообщение подписывается с явным valid_until
+(SEQUENCER_MESSAGE_TTL): отправленное ждет подтверждения (seqno в сети обогнал его seqno), а не
+подтвержденное к valid_until + SEQUENCER_CONFIRM_GRACE уже не может попасть в блок и считается
+потерянным. Об итоге сообщает колбэк on_confirm (True — подтверждено, False — потеряно, повтор
+безопасен); при ошибке отправки или потере локальный счетчик сверяется с сетью.
+
+Локальный seqno верен, только пока все отправки с кошелька идут через один процесс: отправка
+с того же кошелька из другого процесса займет seqno, и чужое сообщение будет принято за
+подтверждение своего. Поэтому секвенсор отключается (disable_wallet_sequencer) во всех режимах,
+кроме встроенной проверки (ORDER_CHECKER_MODE=embedded): при отдельных воркерах отправляют и они,
+и API веб-сервера. При нескольких процессах в режиме embedded нужно WALLET_SEQUENCER_ENABLED=False.
+"""
+import asyncio
+import os
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Dict, Optional
+
+from pytoniq_core import Address
+
+from wallet_cache import wallet_key_cache
+
+WALLET_SEQUENCER_ENABLED = os.environ.get("WALLET_SEQUENCER_ENABLED", "True") == "True"
+SEQUENCER_SEND_TIMEOUT = float(os.environ.get("SEQUENCER_SEND_TIMEOUT", "90"))
+# Срок действия подписанного сообщения (valid_until = now + TTL); деплой pytoniq подписывает с now + 60
+SEQUENCER_MESSAGE_TTL = int(os.environ.get("SEQUENCER_MESSAGE_TTL", "60"))
+# Запас после valid_until на отставание lite-сервера, после которого сообщение считается потерянным
+SEQUENCER_CONFIRM_GRACE = float(os.environ.get("SEQUENCER_CONFIRM_GRACE", "30"))
+SEQUENCER_CONFIRM_TIMEOUT = SEQUENCER_MESSAGE_TTL + SEQUENCER_CONFIRM_GRACE
+SEQUENCER_POLL_INTERVAL = float(os.environ.get("SEQUENCER_POLL_INTERVAL", "3"))
+# Без сообщений дольше этого соединение закрывается, а seqno при следующей отправке читается заново
+SEQUENCER_IDLE_SECONDS = float(os.environ.get("SEQUENCER_IDLE_SECONDS", "300"))
+
+_STOP = object()
+
+
+class OutgoingMessage:
+    def __init__(self, destination: str, amount: int, body, mnemonic: str,
+                 on_confirm: Optional[Callable[[bool], None]] = None):
+        self.destination = destination
+        self.amount = amount
+        self.body = body  # Cell или None
+        self.mnemonic = mnemonic
+        self.on_confirm = on_confirm
+        self.future: Future = Future()
+        self.enqueued_at = time.monotonic()
+
+
+class InFlight:
+    def __init__(self, seqno: int, destination: str, valid_until: int,
+                 on_confirm: Optional[Callable[[bool], None]] = None):
+        self.seqno = seqno
+        self.destination = destination
+        self.valid_until = valid_until  # Unix-время, после которого кошелек сообщение не примет
+        self.on_confirm = on_confirm
+        self.sent_at = time.monotonic()
+
+    def expired(self) -> bool:
+        return time.time() > self.valid_until + SEQUENCER_CONFIRM_GRACE
+
+    def notify(self, confirmed: bool):
+        if self.on_confirm is None:
+            return
+        try:
+            self.on_confirm(confirmed)
+        except Exception as e:
+            print(f"[СЕКВЕНСОР] Ошибка обработчика подтверждения seqno {self.seqno}: {e}")
+            traceback.print_exc()
+
+
+class WalletSequencer:
+    """
+    Args:
+        key: Ключ кошелька в wallet_key_cache
+        address: Ожидаемый адрес кошелька (сообщения с другого адреса не отправляются)
+        connect: Корутина-фабрика подключенного LiteClient (None — не удалось подключиться)
+        wallet_cls: Класс кошелька (WalletV5R1)
+        wallet_kwargs: Параметры кошелька (wallet_id, network_global_id)
+    """
+
+    def __init__(self, key: str, address: str, connect: Callable[[], Awaitable], wallet_cls, **wallet_kwargs):
+        self.key = key
+        self.address = address
+        self.connect = connect
+        self.wallet_cls = wallet_cls
+        self.wallet_kwargs = wallet_kwargs
+        self.expected_seqno: Optional[int] = None  # seqno следующего сообщения; None — прочитать из сети
+        self._in_flight: "deque[InFlight]" = deque()
+        self._client = None
+        self._wallet = None
+        self._deploying = False  # Отправлен деплой: следующие ждут его подтверждения
+        self._mnemonic: Optional[str] = None  # Для сверки неподтвержденных после переподключения
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._last_activity = time.monotonic()
+        self._last_reconcile = 0.0
+        self._metrics = {'sent': 0, 'failed': 0, 'confirmed': 0, 'lost': 0, 'resyncs': 0, 'deploys': 0}
+
+    def start(self):
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return self._thread
+            self._loop = asyncio.new_event_loop()
+            self._queue = asyncio.Queue()
+            self._thread = threading.Thread(target=self._loop.run_until_complete, args=(self._run(),),
+                                            name=f"wallet-seq-{self.address[-6:]}")
+            self._thread.daemon = True
+            self._thread.start()
+            return self._thread
+
+    def stop(self, timeout: Optional[float] = None):
+        if self._loop and self._thread and self._thread.is_alive():
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, _STOP)
+            self._thread.join(timeout)
+
+    def submit(self, destination: str, amount: int, body, mnemonic: str,
+               on_confirm: Optional[Callable[[bool], None]] = None) -> Future:
+        """
+        Ставит сообщение в очередь кошелька; результат Future — {'seqno', 'valid_until'} после приема
+        сетью. on_confirm вызывается потоком кошелька после подтверждения (True) или потери (False)
+        """
+        self.start()
+        message = OutgoingMessage(destination, amount, body, mnemonic, on_confirm)
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, message)
+        return message.future
+
+    def send(self, destination: str, amount: int, body, mnemonic: str,
+             timeout: float = SEQUENCER_SEND_TIMEOUT, on_confirm: Optional[Callable[[bool], None]] = None) -> Dict:
+        """
+        Синхронная отправка. Если сообщение не взято в работу за timeout, оно снимается с очереди;
+        уже отправляемое дожидается результата, чтобы не получить повторную отправку при ретрае
+        """
+        future = self.submit(destination, amount, body, mnemonic, on_confirm)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            if future.cancel():
+                raise TimeoutError(f"Очередь кошелька {self.address}: сообщение не отправлено за {timeout:.0f} с")
+            return future.result()
+
+    # Поток кошелька
+
+    async def _run(self):
+        while True:
+            timeout = SEQUENCER_POLL_INTERVAL if self._in_flight else SEQUENCER_IDLE_SECONDS
+            try:
+                message = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                message = None
+            if message is _STOP:
+                break
+            try:
+                if message is not None:
+                    await self._process(message)
+                if self._in_flight and time.monotonic() - self._last_reconcile >= SEQUENCER_POLL_INTERVAL:
+                    await self._reconcile()
+                elif not self._in_flight and self._client is not None \
+                        and time.monotonic() - self._last_activity >= SEQUENCER_IDLE_SECONDS:
+                    await self._disconnect()
+            except Exception as e:
+                print(f"[СЕКВЕНСОР] {self.address}: ошибка цикла: {e}")
+                traceback.print_exc()
+                await self._disconnect()
+        await self._disconnect()
+
+    async def _ensure_wallet(self, mnemonic: str):
+        if self._client is None:
+            self._client = await self.connect()
+            if self._client is None:
+                raise ConnectionError('Failed to connect to TON network')
+        wallet = await wallet_key_cache.get_wallet(self.key, provider=self._client, mnemonic=mnemonic,
+                                                   wallet_cls=self.wallet_cls, **self.wallet_kwargs)
+        wallet_address = wallet.address.to_str(is_bounceable=True, is_url_safe=True)
+        if wallet_address != self.address:
+            raise ValueError(
+                f'Адрес кошелька из мнемоники ({wallet_address}) не совпадает с ожидаемым адресом ({self.address}). '
+                f'Отправка транзакции заблокирована для безопасности.'
+            )
+        if wallet is not self._wallet and self._wallet is not None:
+            self.expected_seqno = None  # Другой экземпляр (новое подключение или мнемоника) — сверка с сетью
+        self._wallet = wallet
+        return wallet
+
+    async def _chain_seqno(self, wallet) -> Optional[int]:
+        """seqno в сети; None — кошелек не развернут"""
+        try:
+            return await wallet.get_seqno()
+        except Exception as e:
+            print(f"[СЕКВЕНСОР] {self.address}: seqno не получен (кошелек не инициализирован?): {e}")
+            return None
+
+    async def _process(self, message: OutgoingMessage):
+        if not message.future.set_running_or_notify_cancel():
+            return
+        self._last_activity = time.monotonic()
+        try:
+            wallet = await self._ensure_wallet(message.mnemonic)
+            self._mnemonic = message.mnemonic
+            if self._deploying:
+                await self._wait_deploy(wallet)
+            if self.expected_seqno is None:
+                await self._reconcile(wallet)
+            if self.expected_seqno is None:
+                # Не развернут: первый перевод разворачивает кошелек (state_init добавляет pytoniq)
+                valid_until = int(time.time()) + 60
+                await wallet.transfer(destination=message.destination, amount=message.amount, body=message.body)
+                seqno = 0
+                self.expected_seqno = None  # Прочитать из сети после подтверждения деплоя
+                self._deploying = True
+                self._metrics['deploys'] += 1
+            else:
+                seqno = self.expected_seqno
+                valid_until = int(time.time()) + SEQUENCER_MESSAGE_TTL
+                await self._sign_and_send(wallet, seqno, valid_until, message)
+                self.expected_seqno = seqno + 1
+            self._in_flight.append(InFlight(seqno, message.destination, valid_until, message.on_confirm))
+            self._metrics['sent'] += 1
+            print(f"[СЕКВЕНСОР] {self.address}: seqno {seqno} принят сетью, в ожидании: {len(self._in_flight)}")
+            message.future.set_result({'seqno': seqno, 'valid_until': valid_until})
+        except Exception as e:
+            self._metrics['failed'] += 1
+            print(f"[СЕКВЕНСОР] {self.address}: ошибка отправки (seqno {self.expected_seqno}): {e}")
+            self.expected_seqno = None  # Следующее сообщение сверит seqno с сетью
+            if isinstance(e, (ConnectionError, asyncio.TimeoutError)):
+                await self._disconnect()
+            message.future.set_exception(e)
+
+    async def _sign_and_send(self, wallet, seqno: int, valid_until: int, message: OutgoingMessage):
+        """Подпись перевода с локальным seqno и отправка внешнего сообщения (без чтения seqno из сети)"""
+        internal = wallet.create_wallet_internal_message(
+            destination=Address(message.destination),
+            value=message.amount,
+            body=message.body
+        )
+        transfer = wallet.raw_create_transfer_msg(
+            private_key=wallet.private_key,
+            seqno=seqno,
+            wallet_id=wallet.wallet_id,
+            messages=[internal],
+            valid_until=valid_until
+        )
+        await wallet.send_external(body=transfer)
+
+    async def _wait_deploy(self, wallet):
+        """После деплоя следующие сообщения ждут его включения: до него кошелек их не примет"""
+        deadline = time.monotonic() + SEQUENCER_CONFIRM_TIMEOUT
+        while self._deploying and time.monotonic() < deadline:
+            await self._reconcile(wallet)
+            if self._deploying:
+                await asyncio.sleep(SEQUENCER_POLL_INTERVAL)
+        if self._deploying:
+            self._deploying = False
+            self.expected_seqno = None
+
+    async def _reconcile(self, wallet=None):
+        """
+        Сверка с сетью: сообщения с seqno ниже сетевого подтверждены; если у самого старого
+        неподтвержденного истек valid_until (с запасом SEQUENCER_CONFIRM_GRACE), оно и все следующие
+        за ним (их seqno уже не совпадет) потеряны, и счетчик берется из сети
+        """
+        wallet = wallet or self._wallet
+        if wallet is None and self._in_flight and self._mnemonic:
+            wallet = await self._ensure_wallet(self._mnemonic)  # Соединение закрыто после ошибки
+        if wallet is None:
+            return
+        self._last_reconcile = time.monotonic()
+        chain_seqno = await self._chain_seqno(wallet)
+        if chain_seqno is None:
+            if not self._deploying:
+                self.expected_seqno = None
+            return
+        self._metrics['resyncs'] += 1
+        while self._in_flight and self._in_flight[0].seqno < chain_seqno:
+            self._in_flight.popleft().notify(True)
+            self._metrics['confirmed'] += 1
+        self._deploying = False
+        if self._in_flight and self._in_flight[0].expired():
+            lost = list(self._in_flight)
+            self._metrics['lost'] += len(lost)
+            self._in_flight.clear()
+            print(f"[СЕКВЕНСОР] ⚠️  {self.address}: seqno {[item.seqno for item in lost]} не подтверждены "
+                  f"до valid_until, seqno сети: {chain_seqno}")
+            for item in lost:
+                item.notify(False)
+        if self._in_flight:
+            self.expected_seqno = max(chain_seqno, self._in_flight[-1].seqno + 1)
+        else:
+            self.expected_seqno = chain_seqno
+
+    async def _disconnect(self):
+        """Закрывает соединение; неподтвержденные сообщения остаются в учете до сверки после переподключения"""
+        client, self._client, self._wallet = self._client, None, None
+        self.expected_seqno = None
+        if client is not None:
+            try:
+                await client.close()
+            except Exception:
+                pass
+
+    def get_metrics(self) -> Dict:
+        return dict(self._metrics, address=self.address, expected_seqno=self.expected_seqno,
+                    in_flight=len(self._in_flight), queue_depth=self._queue.qsize() if self._queue else 0,
+                    connected=self._client is not None)
+
+
+_sequencers: Dict[str, WalletSequencer] = {}
+_sequencers_lock = threading.Lock()
+
+
+def sequencer_enabled() -> bool:
+    return WALLET_SEQUENCER_ENABLED
+
+
+def disable_wallet_sequencer(reason: str):
+    """Отключает секвенсор в процессе (отправки с кошелька идут не только через этот процесс)"""
+    global WALLET_SEQUENCER_ENABLED
+    if WALLET_SEQUENCER_ENABLED:
+        WALLET_SEQUENCER_ENABLED = False
+        print(f"[СЕКВЕНСОР] Отключен: {reason}")
+
+
+def get_wallet_sequencer(key: str, address: str, connect: Callable[[], Awaitable], wallet_cls,
+                         **wallet_kwargs) -> WalletSequencer:
+    """Секвенсор кошелька (один на ключ в процессе)"""
+    with _sequencers_lock:
+        sequencer = _sequencers.get(key)
+        if sequencer is None or sequencer.address != address:
+            if sequencer is not None:
+                sequencer.stop(timeout=0)
+            sequencer = _sequencers[key] = WalletSequencer(key, address, connect, wallet_cls, **wallet_kwargs)
+        return sequencer
+
+
+def get_sequencer_metrics() -> Dict:
+    with _sequencers_lock:
+        return {key: sequencer.get_metrics() for key, sequencer in _sequencers.items()}